@@ -0,0 +1,114 @@
+import threading
+import time
+from contextvars import ContextVar
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .models import Specialization
+
+
+VERSION_KEY = 'specialization-catalog:version'
+
+_lock = threading.Lock()
+# (version, loaded at, specializations in order, specializations by id), replaced whole
+_snapshot = (None, 0.0, (), {})
+# The version read at the start of the current request, if any
+_request_version = ContextVar('specialization_catalog_version', default=None)
+# Set once this context changed the catalog in a transaction that hasn't committed
+_uncommitted = ContextVar('specialization_catalog_uncommitted', default=False)
+
+
+def get_cache():
+    return caches[getattr(settings, 'MEDLINK_CATALOG_CACHE', 'default')]
+
+
+def _version():
+    """The shared version stamp, starting a fresh one if it is missing"""
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump():
+    """Make every process reload the catalog on its next read"""
+    version = uuid4().hex
+    get_cache().set(VERSION_KEY, version, None)
+    _uncommitted.set(False)
+    if _request_version.get() is not None:
+        # The request that made the change sees it too
+        _request_version.set(version)
+
+
+def invalidate():
+    """Record a change to specializations, published once the transaction commits
+
+    Until then this context reads the catalog straight from the database,
+    so it sees its own change while nothing uncommitted reaches the shared
+    snapshot. A rollback leaves the published version alone.
+    """
+    _uncommitted.set(True)
+    transaction.on_commit(bump)
+
+
+def _load():
+    ordered = tuple(Specialization.objects.annotate(doctor_count=Count('doctors')))
+    return ordered, {specialization.id: specialization for specialization in ordered}
+
+
+def _current():
+    global _snapshot
+    if _uncommitted.get():
+        if connection.in_atomic_block:
+            return (None, 0.0, *_load())
+        # The transaction ended without committing, or bump() would have cleared this
+        _uncommitted.set(False)
+    # Inside a request the version was read once by the middleware; the
+    # database is only hit after a bump, or once the snapshot is older than
+    # the max age, which bounds staleness where the version cache is not shared
+    version = _request_version.get() or _version()
+    max_age = getattr(settings, 'MEDLINK_CATALOG_MAX_AGE', 60)
+    snapshot = _snapshot
+    if snapshot[0] == version and time.monotonic() - snapshot[1] < max_age:
+        return snapshot
+    with _lock:
+        if _snapshot[0] != version or time.monotonic() - _snapshot[1] >= max_age:
+            # Stamped with the version read before loading, so a bump made
+            # while loading still forces the next read to reload
+            _snapshot = (version, time.monotonic(), *_load())
+        return _snapshot
+
+
+def specializations():
+    """Every specialization, with its doctor_count, in the model's ordering
+
+    The instances are shared between requests and must not be modified.
+    """
+    return list(_current()[2])
+
+
+def get(specialization_id):
+    """One cached specialization, or None if the catalog does not have it"""
+    return _current()[3].get(specialization_id)
+
+
+class CatalogVersionMiddleware:
+    """Check the catalog version once per request rather than on every lookup"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _request_version.set(_version())
+        uncommitted_token = _uncommitted.set(False)
+        try:
+            return self.get_response(request)
+        finally:
+            _uncommitted.reset(uncommitted_token)
+            _request_version.reset(token)
@@ -0,0 +1,148 @@
+import re
+import unicodedata
+from datetime import datetime
+
+from django.db import transaction
+
+from .models import User, PatientLookupKey
+
+
+KEY_LENGTH = PatientLookupKey._meta.get_field('key').max_length
+MIN_NAME_LENGTH = 2
+MIN_PHONE_DIGITS = 3
+NATIONAL_DIGITS = 10
+# User fields the keys are built from; saves touching none of them skip reindexing
+LOOKUP_FIELDS = {'first_name', 'last_name', 'phone_number', 'date_of_birth', 'role', 'is_active'}
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+PHONE_RE = re.compile(r'^\+?[\d\s().-]+$')
+PARTIAL_DATE_RE = re.compile(r'^\d{4}-\d{1,2}(-\d{1,2})?$')
+YEAR_RE = re.compile(r'^(19|20)\d{2}$')
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y')
+
+
+def normalize_name(value):
+    """Lowercase words without accents, single-spaced: 'José  O'Neil' -> 'jose o neil'"""
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(WORD_RE.findall(stripped.casefold()))
+
+
+def phone_digits(value):
+    return re.sub(r'\D', '', value or '')
+
+
+def lookup_keys(first_name, last_name, phone_number, date_of_birth):
+    """The (kind, key) pairs a patient can be found under"""
+    first, last = normalize_name(first_name), normalize_name(last_name)
+    names = {' '.join(part for part in parts if part) for parts in ((first, last), (last, first))}
+    # Every word on its own too, so a middle name or second surname matches,
+    # and each part run together, so O'Neil is found as both "o neil" and "oneil"
+    names.update(WORD_RE.findall(f'{first} {last}'))
+    names.update(part.replace(' ', '') for part in (first, last))
+    keys = {('name', name[:KEY_LENGTH]) for name in names if len(name) >= MIN_NAME_LENGTH}
+
+    digits = phone_digits(phone_number)
+    if digits:
+        # With and without the country code
+        keys.update({('phone', digits), ('phone', digits[-NATIONAL_DIGITS:])})
+    if date_of_birth:
+        keys.add(('birth', date_of_birth.isoformat()))
+    return keys
+
+
+def index_patients(user_ids):
+    """Rewrite the lookup keys of some users; non-patients end up with none"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    patients = User.objects.filter(id__in=user_ids, role='patient', is_active=True).values_list(
+        'id', 'first_name', 'last_name', 'phone_number', 'date_of_birth'
+    )
+    rows = [
+        PatientLookupKey(user_id=user_id, kind=kind, key=key)
+        for user_id, *fields in patients
+        for kind, key in lookup_keys(*fields)
+    ]
+    with transaction.atomic():
+        PatientLookupKey.objects.filter(user_id__in=user_ids).delete()
+        PatientLookupKey.objects.bulk_create(rows, batch_size=1000)
+
+
+def rebuild(batch_size=1000):
+    """Reindex every patient, returning how many were indexed
+
+    One transaction, so lookups keep answering from the old keys until the
+    new ones are all in.
+    """
+    with transaction.atomic():
+        PatientLookupKey.objects.all().delete()
+        user_ids = list(User.objects.filter(role='patient').order_by('id').values_list('id', flat=True))
+        for offset in range(0, len(user_ids), batch_size):
+            index_patients(user_ids[offset:offset + batch_size])
+    return len(user_ids)
+
+
+def parse_query(query):
+    """Classify free text as a (kind, prefix) pair, or None if it is too short to look up"""
+    query = (query or '').strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return 'birth', datetime.strptime(query, date_format).date().isoformat()
+        except ValueError:
+            pass
+    if PARTIAL_DATE_RE.match(query):
+        # A year and month, such as 1985-3
+        return 'birth', '-'.join(part.zfill(2) for part in query.split('-'))
+    if YEAR_RE.match(query):
+        # A bare birth year such as 1985, not a phone fragment
+        return 'birth', query
+    if PHONE_RE.match(query):
+        digits = phone_digits(query)
+        return ('phone', digits) if len(digits) >= MIN_PHONE_DIGITS else None
+    name = normalize_name(query)
+    return ('name', name[:KEY_LENGTH]) if len(name) >= MIN_NAME_LENGTH else None
+
+
+def prefix_range(prefix):
+    """Half-open (lower, upper) bounds around the keys that start with prefix"""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def search_patients(query, limit=10):
+    """Best matches for type-ahead, as minimal patient dicts, in one indexed query
+
+    Rows come back in key order straight off the index, so the scan stops
+    after a few rows. That puts a key equal to the query before the longer
+    keys it prefixes, but is not a ranking by length. A patient matching
+    under several keys is listed once.
+    """
+    parsed = parse_query(query)
+    if parsed is None:
+        return []
+    kind, prefix = parsed
+    lower, upper = prefix_range(prefix)
+    # The index serves the range on any backend (LIKE can't use it under
+    # SQLite's case-insensitive LIKE or non-C collations); startswith only
+    # rechecks the rows inside it
+    rows = PatientLookupKey.objects.filter(
+        kind=kind, key__gte=lower, key__lt=upper, key__startswith=prefix
+    ).order_by('key', 'user_id').values_list(
+        'user_id', 'user__username', 'user__first_name', 'user__last_name',
+        'user__phone_number', 'user__date_of_birth'
+    )
+    # Each patient has a handful of keys at most, so this leaves room for duplicates
+    results = {}
+    for user_id, username, first_name, last_name, phone_number, date_of_birth in rows[:limit * 4]:
+        if user_id in results:
+            continue
+        results[user_id] = {
+            'id': user_id,
+            'username': username,
+            'full_name': f"{first_name} {last_name}" if first_name and last_name else username,
+            'phone_number': phone_number,
+            'date_of_birth': date_of_birth,
+        }
+        if len(results) == limit:
+            break
+    return list(results.values())
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from accounts.lookup import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the patient lookup keys (names, phone digits, birth dates) from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} patients'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from accounts.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text doctor search index from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = get_backend().rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} doctors'))
@@ -0,0 +1,54 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from accounts.models import DoctorProfile, Review
+
+
+class Command(BaseCommand):
+    help = 'Recompute every doctor rating and star histogram from the reviews table'
+    fields = sorted(DoctorProfile.RATING_FIELDS)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    @staticmethod
+    def aggregates(histogram):
+        rating_sum = sum(stars * reviews for stars, reviews in histogram.items())
+        total_reviews = sum(histogram.values())
+        rating = 0.0
+        if total_reviews:
+            # Round half up like the database does in DoctorProfile.adjust_rating
+            average = Decimal(rating_sum) / Decimal(total_reviews)
+            rating = float(average.quantize(Decimal('0.1'), rounding=ROUND_HALF_UP))
+        return {
+            'rating': rating,
+            'rating_sum': rating_sum,
+            'total_reviews': total_reviews,
+            **{f'stars_{stars}': reviews for stars, reviews in histogram.items()},
+        }
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            histograms = {}
+            rows = Review.objects.order_by().values_list('doctor', 'rating').annotate(reviews=Count('id'))
+            for doctor_id, rating, reviews in rows:
+                histograms.setdefault(doctor_id, dict.fromkeys(range(1, 6), 0))[rating] = reviews
+
+            changed = []
+            profiles = DoctorProfile.objects.select_for_update().only(*self.fields)
+            for profile in profiles.iterator(chunk_size=options['batch_size']):
+                histogram = histograms.get(profile.id, dict.fromkeys(range(1, 6), 0))
+                expected = self.aggregates(histogram)
+                if any(getattr(profile, field) != value for field, value in expected.items()):
+                    for field, value in expected.items():
+                        setattr(profile, field, value)
+                    changed.append(profile)
+
+            DoctorProfile.objects.bulk_update(
+                changed, self.fields, batch_size=options['batch_size']
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Recomputed ratings, {len(changed)} doctors corrected'))
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast, Round
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -121,6 +123,13 @@ class DoctorProfile(models.Model):
         validators=[MinValueValidator(0.0), MaxValueValidator(5.0)]
     )
     total_reviews = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, help_text='Sum of all review ratings')
+    # Review histogram, kept current by adjust_rating()
+    stars_1 = models.PositiveIntegerField(default=0, editable=False)
+    stars_2 = models.PositiveIntegerField(default=0, editable=False)
+    stars_3 = models.PositiveIntegerField(default=0, editable=False)
+    stars_4 = models.PositiveIntegerField(default=0, editable=False)
+    stars_5 = models.PositiveIntegerField(default=0, editable=False)
     consultation_fee = models.DecimalField(
         max_digits=8, 
         decimal_places=2, 
@@ -138,10 +147,19 @@ class DoctorProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Maintained by adjust_rating() and recompute_doctor_ratings only
+    RATING_FIELDS = frozenset([
+        'rating', 'rating_sum', 'total_reviews', 'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5'
+    ])
+
     class Meta:
         verbose_name = _('Doctor Profile')
         verbose_name_plural = _('Doctor Profiles')
         ordering = ['-rating', '-experience_years']
+        indexes = [
+            # Keyset pages of the doctor directory
+            models.Index(fields=['-rating', '-experience_years', '-id'], name='doctor_directory_idx'),
+        ]
 
     def __str__(self):
         return f"Dr. {self.user.username}"
@@ -152,6 +170,14 @@ class DoctorProfile(models.Model):
     
     def save(self, *args, **kwargs):
         self.clean()
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # The review counters change through adjust_rating()'s F() updates;
+            # writing back this instance's copies would lose concurrent reviews
+            skipped = self.RATING_FIELDS | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
         super().save(*args, **kwargs)
     
     @property
@@ -168,6 +194,42 @@ class DoctorProfile(models.Model):
         """Check if the given time is within working hours"""
         return self.working_hours_start <= time <= self.working_hours_end
 
+    @property
+    def rating_histogram(self):
+        """Number of reviews per star value, 1 through 5"""
+        return {stars: getattr(self, f'stars_{stars}') for stars in range(1, 6)}
+
+    @classmethod
+    def adjust_rating(cls, doctor_id, added=None, removed=None):
+        """Add and/or take out one review's stars in a single UPDATE
+
+        The right-hand sides all read the row as it was before the update,
+        so the average is derived from the new totals without a reload.
+        """
+        sum_delta = (added or 0) - (removed or 0)
+        count_delta = (added is not None) - (removed is not None)
+        changes = {}
+        if added != removed:
+            if added is not None:
+                changes[f'stars_{added}'] = F(f'stars_{added}') + 1
+            if removed is not None:
+                changes[f'stars_{removed}'] = F(f'stars_{removed}') - 1
+        if not changes:
+            return
+
+        new_sum = F('rating_sum') + sum_delta
+        new_count = F('total_reviews') + count_delta
+        cls.objects.filter(id=doctor_id).update(
+            rating_sum=new_sum,
+            total_reviews=new_count,
+            rating=Case(
+                When(total_reviews__lte=-count_delta, then=Value(0.0)),
+                default=Round(Cast(new_sum, FloatField()) / new_count, 1),
+                output_field=FloatField()
+            ),
+            **changes
+        )
+
 
 class Specialization(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -230,23 +292,37 @@ class Review(models.Model):
         verbose_name_plural = _('Reviews')
         unique_together = ('doctor', 'patient')
         ordering = ['-created_at']
+        indexes = [
+            # Newest-first review feed of one doctor
+            models.Index(fields=['doctor', '-created_at', '-id'], name='review_feed_idx'),
+        ]
 
     def __str__(self):
         return f"Review by {self.patient.user.username} for Dr. {self.doctor.user.username}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What this review currently contributes to its doctor's totals
+        instance._counted = (instance.__dict__.get('doctor_id'), instance.__dict__.get('rating'))
+        return instance
+
     def save(self, *args, **kwargs):
         # Update doctor's rating when review is saved
-        super().save(*args, **kwargs)
-        self.update_doctor_rating()
-    
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.update_doctor_rating()
+
     def update_doctor_rating(self):
-        """Update the doctor's average rating"""
-        reviews = Review.objects.filter(doctor=self.doctor)
-        if reviews.exists():
-            avg_rating = sum(review.rating for review in reviews) / reviews.count()
-            self.doctor.rating = round(avg_rating, 1)
-            self.doctor.total_reviews = reviews.count()
-            self.doctor.save(update_fields=['rating', 'total_reviews'])
+        """Move this review's contribution to the doctor's running totals"""
+        previous_doctor_id, previous_rating = getattr(self, '_counted', (None, None))
+        if previous_doctor_id == self.doctor_id:
+            DoctorProfile.adjust_rating(self.doctor_id, added=self.rating, removed=previous_rating)
+        else:
+            if previous_doctor_id is not None:
+                DoctorProfile.adjust_rating(previous_doctor_id, removed=previous_rating)
+            DoctorProfile.adjust_rating(self.doctor_id, added=self.rating)
+        self._counted = (self.doctor_id, self.rating)
 
 
 class UserSession(models.Model):
@@ -271,4 +347,31 @@ class UserSession(models.Model):
         """Mark session as ended"""
         self.is_active = False
         self.logout_time = timezone.now()
-        self.save() 
\ No newline at end of file
+        self.save() 
+
+
+class PatientLookupKey(models.Model):
+    """Normalized name, phone and birth-date keys of a patient for prefix lookups
+
+    Derived from User by accounts.lookup; never edit these rows directly.
+    """
+    KIND_CHOICES = [
+        ('name', _('Name')),
+        ('phone', _('Phone digits')),
+        ('birth', _('Date of birth')),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='lookup_keys')
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    key = models.CharField(max_length=255)
+
+    class Meta:
+        verbose_name = _('Patient Lookup Key')
+        verbose_name_plural = _('Patient Lookup Keys')
+        indexes = [
+            # Prefix lookups are range scans on (kind, key); user_id rides along
+            models.Index(fields=['kind', 'key', 'user'], name='patient_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.key}"
@@ -0,0 +1,247 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework.filters import BaseFilterBackend
+
+from .models import DoctorProfile, DoctorSpecialization
+
+
+SEARCH_TABLE = 'accounts_doctor_search'
+DEFAULT_BACKENDS = {
+    'sqlite': 'accounts.search.SQLiteSearchBackend',
+    'postgresql': 'accounts.search.PostgresSearchBackend',
+}
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(query):
+    """Split free text into lowercase word tokens, dropping query syntax"""
+    return [token.lower() for token in TOKEN_RE.findall(query or '')]
+
+
+def build_documents(doctor_ids):
+    """Return {doctor_id: (name, specializations, qualifications, bio)} for indexing"""
+    documents = {}
+    profiles = DoctorProfile.objects.filter(id__in=doctor_ids).values_list(
+        'id', 'user__username', 'user__first_name', 'user__last_name', 'qualifications', 'bio'
+    )
+    for doctor_id, username, first_name, last_name, qualifications, bio in profiles:
+        name = ' '.join(part for part in (first_name, last_name, username) if part)
+        documents[doctor_id] = [name, [], qualifications or '', bio or '']
+
+    specializations = DoctorSpecialization.objects.filter(
+        doctor_id__in=documents
+    ).values_list('doctor_id', 'specialization__name')
+    for doctor_id, specialization in specializations:
+        documents[doctor_id][1].append(specialization)
+
+    return {
+        doctor_id: (name, ' '.join(names), qualifications, bio)
+        for doctor_id, (name, names, qualifications, bio) in documents.items()
+    }
+
+
+class BaseSearchBackend:
+    """Keep a full-text index of doctors and query it by relevance
+
+    Documents have four fields weighted from most to least significant:
+    name, specializations, qualifications and bio.
+    """
+    def install(self):
+        raise NotImplementedError('Search backends must implement install()')
+
+    def matches(self, terms):
+        """(sql, params) selecting the ids of doctors matching every term"""
+        raise NotImplementedError('Search backends must implement matches()')
+
+    def relevance(self, terms, id_column):
+        """(sql, params, descending) scoring the doctor in `id_column` against the terms"""
+        raise NotImplementedError('Search backends must implement relevance()')
+
+    def filter(self, queryset, query, ranked=True):
+        """Restrict a DoctorProfile queryset to doctors matching `query`, best first if `ranked`
+
+        Matching and ranking both stay in the query, so the database counts
+        and pages through every match rather than a capped id list.
+        """
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+        sql, params = self.matches(terms)
+        queryset = queryset.filter(id__in=RawSQL(sql, params))
+        if not ranked:
+            return queryset
+        sql, params, descending = self.relevance(terms, f'{queryset.model._meta.db_table}.id')
+        rank = RawSQL(sql, params, output_field=FloatField())
+        return queryset.order_by(rank.desc() if descending else rank.asc(), 'id')
+
+    def search(self, query, limit=20):
+        """Return up to `limit` doctor profile ids matching `query`, most relevant first"""
+        return list(self.filter(DoctorProfile.objects.all(), query).values_list('id', flat=True)[:limit])
+
+    def remove(self, doctor_ids):
+        raise NotImplementedError('Search backends must implement remove()')
+
+    def write(self, documents):
+        raise NotImplementedError('Search backends must implement write()')
+
+    def index(self, doctor_ids):
+        """Refresh the documents of some doctors from the database"""
+        doctor_ids = list(doctor_ids)
+        if not doctor_ids:
+            return
+        documents = build_documents(doctor_ids)
+        self.remove(doctor_ids)
+        self.write(documents)
+
+    def rebuild(self, batch_size=500):
+        """Reindex every doctor, returning how many were written"""
+        self.install()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        total = 0
+        doctor_ids = list(DoctorProfile.objects.order_by('id').values_list('id', flat=True))
+        for offset in range(0, len(doctor_ids), batch_size):
+            documents = build_documents(doctor_ids[offset:offset + batch_size])
+            self.write(documents)
+            total += len(documents)
+        return total
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """FTS5 virtual table keyed by doctor profile id, ranked with bm25"""
+    weights = (10.0, 5.0, 2.0, 1.0)
+
+    def install(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+                "name, specializations, qualifications, bio, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+
+    @staticmethod
+    def match_expression(terms):
+        # Every term must match; the last one as a prefix for search-as-you-type
+        match = ' '.join(f'"{term}"' for term in terms[:-1])
+        return f'{match} "{terms[-1]}"*'.strip()
+
+    def matches(self, terms):
+        return f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [self.match_expression(terms)]
+
+    def relevance(self, terms, id_column):
+        # bm25 is lower for better matches
+        weights = ', '.join(str(weight) for weight in self.weights)
+        return (
+            f'(SELECT bm25({SEARCH_TABLE}, {weights}) FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s AND rowid = {id_column})',
+            [self.match_expression(terms)],
+            False
+        )
+
+    def remove(self, doctor_ids):
+        doctor_ids = list(doctor_ids)
+        placeholders = ', '.join(['%s'] * len(doctor_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', doctor_ids)
+
+    def write(self, documents):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, name, specializations, qualifications, bio) '
+                'VALUES (%s, %s, %s, %s, %s)',
+                [(doctor_id, *fields) for doctor_id, fields in documents.items()]
+            )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Weighted tsvector column with a GIN index, ranked with ts_rank"""
+    config = 'simple'
+
+    def install(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+                f'doctor_id bigint PRIMARY KEY REFERENCES {DoctorProfile._meta.db_table} (id) '
+                'ON DELETE CASCADE, document tsvector NOT NULL)'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document '
+                f'ON {SEARCH_TABLE} USING GIN (document)'
+            )
+
+    @staticmethod
+    def tsquery(terms):
+        return ' & '.join(terms[:-1] + [f'{terms[-1]}:*'])
+
+    def matches(self, terms):
+        return (
+            f'SELECT doctor_id FROM {SEARCH_TABLE} WHERE document @@ to_tsquery(%s, %s)',
+            [self.config, self.tsquery(terms)]
+        )
+
+    def relevance(self, terms, id_column):
+        return (
+            f'(SELECT ts_rank(document, to_tsquery(%s, %s)) FROM {SEARCH_TABLE} WHERE doctor_id = {id_column})',
+            [self.config, self.tsquery(terms)],
+            True
+        )
+
+    def remove(self, doctor_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE doctor_id = ANY(%s)', [list(doctor_ids)])
+
+    def write(self, documents):
+        weighted = ' || '.join(
+            f"setweight(to_tsvector('{self.config}', %s), '{weight}')" for weight in 'ABCD'
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (doctor_id, document) VALUES (%s, {weighted}) '
+                'ON CONFLICT (doctor_id) DO UPDATE SET document = EXCLUDED.document',
+                [(doctor_id, *fields) for doctor_id, fields in documents.items()]
+            )
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    """The search backend for the default database's engine"""
+    backends = {**DEFAULT_BACKENDS, **getattr(settings, 'MEDLINK_SEARCH_BACKENDS', {})}
+    return _load_backend(backends[connection.vendor])
+
+
+class DoctorSearchFilter(BaseFilterBackend):
+    """Full-text `?search=` over doctors, ordered by relevance
+
+    List it after OrderingFilter: an explicit `?ordering=` still wins,
+    otherwise results come back best match first.
+    """
+    search_param = 'search'
+    ordering_param = 'ordering'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not search_terms(query):
+            return queryset
+
+        return get_backend().filter(
+            queryset, query, ranked=not request.query_params.get(self.ordering_param)
+        )
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Full-text search over doctor names, specializations, qualifications and bio',
+            'schema': {'type': 'string'},
+        }]
@@ -1,10 +1,89 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.core.validators import validate_email
+from django.db.models import Count
 from .models import User, PatientProfile, DoctorProfile, Specialization, DoctorSpecialization, Review
+from . import catalog
 
 
-class UserSerializer(serializers.ModelSerializer):
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def _paths(request, param):
+    return [path.strip() for path in request.query_params.get(param, '').split(',') if path.strip()]
+
+
+def expanded_paths(request):
+    """Dotted paths of nested fields to render in full
+
+    Returns None when the client sent neither ?fields= nor ?expand=, which
+    keeps the original fully nested response shape. Naming a nested path
+    in ?fields= (`appointment_request.status`) expands its parents too.
+    """
+    if request is None or not ({FIELDS_PARAM, EXPAND_PARAM} & set(request.query_params)):
+        return None
+    expanded = set()
+    for path in _paths(request, EXPAND_PARAM) + [
+        path.rsplit('.', 1)[0] for path in _paths(request, FIELDS_PARAM) if '.' in path
+    ]:
+        parts = path.split('.')
+        expanded.update('.'.join(parts[:end]) for end in range(1, len(parts) + 1))
+    return expanded
+
+
+def is_expanded(request, path):
+    paths = expanded_paths(request)
+    return paths is None or path in paths
+
+
+class DynamicFieldsMixin:
+    """Sparse fieldsets (?fields=) and opt-in nesting (?expand=) for GET responses
+
+    Meta.expandable_fields maps each nested field to the attribute rendered
+    in its place when it is not expanded (usually the foreign key id), or
+    to None to leave it out. Without either parameter nothing changes.
+    """
+
+    def _field_path(self):
+        names = []
+        node = self
+        while node.parent is not None:
+            # List serializers wrap their child without a field name of their own
+            if node.field_name:
+                names.append(node.field_name)
+            node = node.parent
+        return '.'.join(reversed(names))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return fields
+        expanded = expanded_paths(request)
+        if expanded is None:
+            return fields
+
+        path = self._field_path()
+        prefix = f'{path}.' if path else ''
+        for name, collapsed in getattr(self.Meta, 'expandable_fields', {}).items():
+            if name in fields and f'{prefix}{name}' not in expanded:
+                if collapsed:
+                    fields[name] = serializers.IntegerField(source=collapsed, read_only=True)
+                else:
+                    del fields[name]
+
+        requested = {
+            selected[len(prefix):].split('.')[0]
+            for selected in _paths(request, FIELDS_PARAM)
+            if selected.startswith(prefix)
+        }
+        if requested:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        return fields
+
+
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Base user serializer"""
     full_name = serializers.CharField(read_only=True)
     age = serializers.IntegerField(read_only=True)
@@ -97,7 +176,7 @@ class PasswordResetSerializer(serializers.Serializer):
         return value
 
 
-class SpecializationSerializer(serializers.ModelSerializer):
+class SpecializationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     doctor_count = serializers.SerializerMethodField()
     
     class Meta:
@@ -106,11 +185,26 @@ class SpecializationSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at']
     
     def get_doctor_count(self, obj):
+        # Querysets built with with_doctor_count() carry the count already
+        if hasattr(obj, 'doctor_count'):
+            return obj.doctor_count
         return obj.doctors.count()
 
+    @staticmethod
+    def with_doctor_count(queryset):
+        return queryset.annotate(doctor_count=Count('doctors'))
+
+
+class CatalogSpecializationSerializer(SpecializationSerializer):
+    """Nested specialization read from the in-process catalog instead of the database"""
 
-class DoctorSpecializationSerializer(serializers.ModelSerializer):
-    specialization = SpecializationSerializer(read_only=True)
+    def get_attribute(self, instance):
+        # Rows the catalog has not seen yet fall back to the relation
+        return catalog.get(instance.specialization_id) or super().get_attribute(instance)
+
+
+class DoctorSpecializationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    specialization = CatalogSpecializationSerializer(read_only=True)
     specialization_id = serializers.IntegerField(write_only=True)
     
     class Meta:
@@ -120,9 +214,10 @@ class DoctorSpecializationSerializer(serializers.ModelSerializer):
             'certification', 'certification_date', 'is_primary'
         ]
         read_only_fields = ['id']
+        expandable_fields = {'specialization': 'specialization_id'}
 
 
-class PatientProfileSerializer(serializers.ModelSerializer):
+class PatientProfileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     
     class Meta:
@@ -134,6 +229,7 @@ class PatientProfileSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
+        expandable_fields = {'user': 'user_id'}
     
     def validate(self, data):
         # Validate emergency contact
@@ -143,7 +239,16 @@ class PatientProfileSerializer(serializers.ModelSerializer):
         return data
 
 
-class DoctorProfileSerializer(serializers.ModelSerializer):
+class PatientLookupSerializer(serializers.Serializer):
+    """Minimal patient row of the front-desk lookup"""
+    id = serializers.IntegerField()
+    username = serializers.CharField()
+    full_name = serializers.CharField()
+    phone_number = serializers.CharField(allow_null=True)
+    date_of_birth = serializers.DateField(allow_null=True)
+
+
+class DoctorProfileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     specializations = DoctorSpecializationSerializer(many=True, read_only=True)
     average_rating = serializers.FloatField(read_only=True)
@@ -159,6 +264,21 @@ class DoctorProfileSerializer(serializers.ModelSerializer):
             'working_days_list', 'specializations', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'rating', 'total_reviews', 'created_at', 'updated_at']
+        expandable_fields = {'user': 'user_id', 'specializations': None}
+
+    @staticmethod
+    def setup_eager_loading(queryset, request=None, path='', prefix=''):
+        """Load what the serializer will render in a fixed number of queries per page
+
+        `path` is where the serializer sits in the response, for ?expand=,
+        and `prefix` the ORM path from the queryset's model to DoctorProfile.
+        """
+        if is_expanded(request, f'{path}user'):
+            queryset = queryset.select_related(f'{prefix}user')
+        if is_expanded(request, f'{path}specializations'):
+            # The specializations themselves come from the catalog
+            queryset = queryset.prefetch_related(f'{prefix}specializations')
+        return queryset
     
     def validate(self, data):
         # Validate working hours
@@ -169,7 +289,7 @@ class DoctorProfileSerializer(serializers.ModelSerializer):
         return data
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     doctor_name = serializers.CharField(source='doctor.user.get_full_name', read_only=True)
     patient_name = serializers.CharField(source='patient.user.get_full_name', read_only=True)
     doctor_username = serializers.CharField(source='doctor.user.username', read_only=True)
@@ -197,6 +317,31 @@ class ReviewSerializer(serializers.ModelSerializer):
         return data
 
 
+class DoctorReviewSummarySerializer(serializers.ModelSerializer):
+    doctor = serializers.IntegerField(source='id', read_only=True)
+    histogram = serializers.DictField(source='rating_histogram', child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = DoctorProfile
+        fields = ['doctor', 'rating', 'total_reviews', 'histogram']
+        read_only_fields = fields
+
+
+class PublicReviewSerializer(serializers.ModelSerializer):
+    """Review as shown on a doctor's public page; anonymous reviews hide the author"""
+    patient_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Review
+        fields = ['id', 'rating', 'comment', 'is_anonymous', 'patient_name', 'created_at']
+        read_only_fields = fields
+
+    def get_patient_name(self, obj):
+        if obj.is_anonymous:
+            return None
+        return obj.patient.user.get_full_name() or obj.patient.user.username
+
+
 class ProfileUpdateSerializer(serializers.ModelSerializer):
     """Serializer for updating user profile information"""
     user = UserSerializer(partial=True)
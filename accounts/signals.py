@@ -1,7 +1,19 @@
 # signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, post_migrate
 from django.dispatch import receiver
-from .models import User, PatientProfile, DoctorProfile, Review
+from .models import User, PatientProfile, DoctorProfile, Review, Specialization, DoctorSpecialization
+from .search import get_backend
+from .lookup import LOOKUP_FIELDS, index_patients
+from . import catalog
+
+# Fields that feed the doctor search index; saves touching none of them skip reindexing
+USER_SEARCH_FIELDS = {'username', 'first_name', 'last_name', 'role'}
+PROFILE_SEARCH_FIELDS = {'bio', 'qualifications'}
+
+
+def _touches(update_fields, fields):
+    return update_fields is None or bool(fields & set(update_fields))
+
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
@@ -11,10 +23,66 @@ def create_profile(sender, instance, created, **kwargs):
         DoctorProfile.objects.create(user=instance)
 
 
-@receiver(post_save, sender=Review)
-def doctor_rating(sender, instance, created, **kwargs):
-    if created:
-        doctor = instance.doctor
-        doctor.rating = (doctor.rating * doctor.cnt + instance.rating) / (doctor.cnt + 1)
-        doctor.cnt += 1
-        doctor.save()
\ No newline at end of file
+@receiver(post_delete, sender=Review)
+def doctor_rating(sender, instance, **kwargs):
+    # Saves adjust the totals in Review.save(); deletes take the review back out
+    doctor_id, rating = getattr(instance, '_counted', (instance.doctor_id, instance.rating))
+    if doctor_id is not None:
+        DoctorProfile.adjust_rating(doctor_id, removed=rating)
+
+
+@receiver(post_migrate)
+def install_search_index(sender, **kwargs):
+    if sender.name == 'accounts':
+        get_backend().install()
+
+
+# The index lives in the same database, so these writes commit or roll
+# back together with the change that triggered them
+@receiver(post_save, sender=DoctorProfile)
+def index_doctor_profile(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, PROFILE_SEARCH_FIELDS):
+        get_backend().index([instance.id])
+
+
+@receiver(post_delete, sender=DoctorProfile)
+def unindex_doctor_profile(sender, instance, **kwargs):
+    get_backend().remove([instance.id])
+
+
+@receiver(post_save, sender=User)
+def index_doctor_user(sender, instance, created, update_fields=None, **kwargs):
+    if created or instance.role != 'doctor' or not _touches(update_fields, USER_SEARCH_FIELDS):
+        return
+    get_backend().index(DoctorProfile.objects.filter(user=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=DoctorSpecialization)
+@receiver(post_delete, sender=DoctorSpecialization)
+def index_doctor_specializations(sender, instance, **kwargs):
+    get_backend().index([instance.doctor_id])
+
+
+@receiver(post_save, sender=Specialization)
+def index_specialization_doctors(sender, instance, created, **kwargs):
+    if not created:
+        get_backend().index(instance.doctors.values_list('doctor_id', flat=True))
+
+
+# Other processes reload once the change commits; until then the writer
+# reads its own change from the database
+@receiver(post_save, sender=Specialization)
+@receiver(post_delete, sender=Specialization)
+@receiver(post_save, sender=DoctorSpecialization)
+@receiver(post_delete, sender=DoctorSpecialization)
+def invalidate_catalog(sender, instance, **kwargs):
+    catalog.invalidate()
+
+
+@receiver(post_save, sender=User)
+def index_patient_lookup(sender, instance, created, update_fields=None, **kwargs):
+    if created and instance.role != 'patient':
+        return
+    # Also runs when a patient changes role, which drops their keys
+    if _touches(update_fields, LOOKUP_FIELDS):
+        index_patients([instance.id])
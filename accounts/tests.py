@@ -1,3 +1,98 @@
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from .lookup import lookup_keys, parse_query, rebuild, search_patients
+from .models import DoctorProfile, PatientLookupKey, Review, User
+
+
+class PatientLookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user(
+            username='jo', password='password123', role='patient', first_name='José',
+            last_name="O'Neil", phone_number='+1 (555) 010-2030', date_of_birth=date(1985, 3, 7)
+        )
+        User.objects.create_user(username='doc', password='password123', role='doctor', first_name='Josef')
+
+    def test_lookup_keys(self):
+        keys = lookup_keys('José', "O'Neil", '+1 (555) 010-2030', date(1985, 3, 7))
+        self.assertTrue({
+            ('name', "jose o neil"), ('name', "o neil jose"), ('name', 'jose'), ('name', 'neil'),
+            ('name', 'oneil'), ('phone', '15550102030'), ('phone', '5550102030'), ('birth', '1985-03-07'),
+        } <= keys)
+        # Single letters are too short to be useful keys
+        self.assertNotIn(('name', 'o'), keys)
+
+    def test_parse_query(self):
+        self.assertEqual(parse_query('07.03.1985'), ('birth', '1985-03-07'))
+        self.assertEqual(parse_query('1985-3'), ('birth', '1985-03'))
+        self.assertEqual(parse_query('1985'), ('birth', '1985'))
+        self.assertEqual(parse_query('555 01'), ('phone', '55501'))
+        self.assertEqual(parse_query('Jo'), ('name', 'jo'))
+        self.assertIsNone(parse_query('j'))
+
+    def test_search_finds_patients_only(self):
+        for query in ('jos', 'oneil', "o'ne", '555010', '1985', '1985-03-07'):
+            with self.subTest(query=query):
+                self.assertEqual([row['id'] for row in search_patients(query)], [self.patient.id])
+
+    def test_results_follow_key_order(self):
+        other = User.objects.create_user(username='nei', password='password123', role='patient', first_name='Nei')
+        # 'nei' equals the query, so it sorts before 'neil', which it prefixes
+        self.assertEqual([row['id'] for row in search_patients('nei')], [other.id, self.patient.id])
+
+    def test_rebuild_replaces_keys(self):
+        PatientLookupKey.objects.all().delete()
+        self.assertEqual(rebuild(), 1)
+        self.assertEqual([row['id'] for row in search_patients('neil')], [self.patient.id])
+
+
+class DoctorRatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(username='doc', password='password123', role='doctor').doctor_profile
+        cls.patients = [
+            User.objects.create_user(username=f'patient{index}', password='password123', role='patient').patient_profile
+            for index in range(3)
+        ]
+
+    def review(self, patient, rating):
+        return Review.objects.create(doctor=self.doctor, patient=self.patients[patient], rating=rating)
+
+    def totals(self):
+        profile = DoctorProfile.objects.get(id=self.doctor.id)
+        return profile.rating, profile.total_reviews, profile.rating_sum, profile.rating_histogram
+
+    def test_reviews_adjust_totals_and_histogram(self):
+        first = self.review(0, 5)
+        self.review(1, 2)
+        self.assertEqual(self.totals(), (3.5, 2, 7, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1}))
+
+        first.rating = 4
+        first.save()
+        self.assertEqual(self.totals(), (3.0, 2, 6, {1: 0, 2: 1, 3: 0, 4: 1, 5: 0}))
+
+        first.delete()
+        self.assertEqual(self.totals(), (2.0, 1, 2, {1: 0, 2: 1, 3: 0, 4: 0, 5: 0}))
+        Review.objects.get().delete()
+        self.assertEqual(self.totals(), (0.0, 0, 0, dict.fromkeys(range(1, 6), 0)))
+
+    def test_profile_save_keeps_counters_written_since_it_loaded(self):
+        profile = DoctorProfile.objects.get(id=self.doctor.id)
+        self.review(0, 4)
+        profile.bio = 'Family medicine'
+        profile.save()
+        self.assertEqual(self.totals(), (4.0, 1, 4, {1: 0, 2: 0, 3: 0, 4: 1, 5: 0}))
+        self.assertEqual(DoctorProfile.objects.get(id=self.doctor.id).bio, 'Family medicine')
+
+    def test_recompute_restores_counters_from_reviews(self):
+        self.review(0, 5)
+        self.review(1, 4)
+        self.review(2, 4)
+        DoctorProfile.objects.filter(id=self.doctor.id).update(rating=1.0, total_reviews=9, rating_sum=0, stars_4=0)
+        call_command('recompute_doctor_ratings', stdout=StringIO())
+        # 13 / 3 rounds half up to 4.3
+        self.assertEqual(self.totals(), (4.3, 3, 13, {1: 0, 2: 0, 3: 0, 4: 2, 5: 1}))
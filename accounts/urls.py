@@ -14,6 +14,9 @@ from .views import (
     DoctorProfileAPIView,
     SpecializationViewSet,
     ReviewViewSet,
+    DoctorReviewSummaryView,
+    DoctorReviewFeedView,
+    PatientLookupView,
 )
 
 # Authentication-related URLs
@@ -29,6 +32,13 @@ auth_urls = [
 profile_urls = [
     path('profile/patient/', PatientProfileAPIView.as_view(), name='patient-profile'),
     path('profile/doctor/', DoctorProfileAPIView.as_view(), name='doctor-profile'),
+    path('patients/lookup/', PatientLookupView.as_view(), name='patient-lookup'),
+]
+
+# Public review URLs of a doctor
+review_urls = [
+    path('doctors/<int:id>/reviews/', DoctorReviewFeedView.as_view(), name='doctor-review-feed'),
+    path('doctors/<int:id>/reviews/summary/', DoctorReviewSummaryView.as_view(), name='doctor-review-summary'),
 ]
 
 # Specialization-related URLs
@@ -40,5 +50,6 @@ router.register(r'reviews', ReviewViewSet, basename='review')
 urlpatterns = [
     path('auth/', include(auth_urls)),  # Grouped under 'auth/'
     path('', include(profile_urls)),   # Profile endpoints at the root
+    path('', include(review_urls)),
     path('', include(router.urls)),  # Specialization endpoints at the root
 ]
\ No newline at end of file
@@ -8,8 +8,13 @@ from .models import PatientProfile, DoctorProfile, Specialization, Review, User
 from rest_framework import status, viewsets
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
+from django.http import Http404
 from rest_framework import permissions
-from rest_framework.generics import GenericAPIView
+from rest_framework.generics import GenericAPIView, ListAPIView, RetrieveAPIView
+from medlink.pagination import KeysetPagination
+from medlink.permissions import IsFrontDesk
+from . import catalog
+from .lookup import search_patients
 
 
 class RegisterUserView(GenericAPIView):
@@ -98,7 +103,7 @@ class DoctorProfileAPIView(APIView):
     
 
 class SpecializationViewSet(viewsets.ModelViewSet):
-    queryset = Specialization.objects.all()
+    queryset = SpecializationSerializer.with_doctor_count(Specialization.objects.all())
     serializer_class = SpecializationSerializer
     permission_classes = [IsAuthenticated]
 
@@ -106,6 +111,26 @@ class SpecializationViewSet(viewsets.ModelViewSet):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [permissions.IsAdminUser()]
         return super().get_permissions()
+
+    # Reads come from the in-process catalog; writes bump its version
+    def list(self, request, *args, **kwargs):
+        specializations = catalog.specializations()
+        page = self.paginate_queryset(specializations)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(specializations, many=True).data)
+
+    def get_object(self):
+        if self.action != 'retrieve':
+            return super().get_object()
+        try:
+            specialization = catalog.get(int(self.kwargs[self.lookup_field]))
+        except ValueError:
+            specialization = None
+        if specialization is None:
+            raise Http404
+        self.check_object_permissions(self.request, specialization)
+        return specialization
     
 
 class ReviewViewSet(viewsets.ModelViewSet):
@@ -124,4 +149,49 @@ class ReviewViewSet(viewsets.ModelViewSet):
             return Review.objects.filter(doctor=user.doctor_profile)
         elif user.role == 'patient':
             return Review.objects.filter(patient=user.patient_profile)
-        return Review.objects.none()
\ No newline at end of file
+        return Review.objects.none()
+
+
+class ReviewFeedPagination(KeysetPagination):
+    # Served by the (doctor, -created_at, -id) index
+    ordering = ('-created_at', '-id')
+
+
+class PatientLookupView(GenericAPIView):
+    """Front-desk type-ahead over patients by name, phone digits or date of birth"""
+    serializer_class = PatientLookupSerializer
+    permission_classes = [IsAuthenticated, IsFrontDesk]
+    default_limit = 10
+    max_limit = 25
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        results = search_patients(query, max(1, min(limit, self.max_limit)))
+        return Response({'query': query, 'results': self.get_serializer(results, many=True).data})
+
+
+class DoctorReviewSummaryView(RetrieveAPIView):
+    """Public rating summary of a doctor with the stored star histogram"""
+    serializer_class = DoctorReviewSummarySerializer
+    permission_classes = [permissions.AllowAny]
+    lookup_field = 'id'
+
+    def get_queryset(self):
+        return DoctorProfile.objects.filter(user__is_active=True).only(
+            'id', 'rating', 'total_reviews', 'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5'
+        )
+
+
+class DoctorReviewFeedView(ListAPIView):
+    """Public newest-first reviews of a doctor"""
+    serializer_class = PublicReviewSerializer
+    permission_classes = [permissions.AllowAny]
+    pagination_class = ReviewFeedPagination
+
+    def get_queryset(self):
+        doctor = get_object_or_404(DoctorProfile, id=self.kwargs['id'], user__is_active=True)
+        return Review.objects.filter(doctor=doctor).select_related('patient__user')
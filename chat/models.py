@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import FileExtensionValidator
 from django.utils import timezone
+from medlink.storage import get_blob_storage
 
 User = get_user_model()
 
@@ -51,6 +52,8 @@ class Message(models.Model):
         ('system', 'System Message'),
         ('appointment', 'Appointment Related'),
     ]
+    # Fields thumbnails are made from, first non-empty one wins
+    THUMBNAIL_FIELDS = ('image', 'file')
     
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
@@ -60,15 +63,21 @@ class Message(models.Model):
     text = models.TextField(blank=True)
     
     # File attachments
-    image = models.ImageField(upload_to='chat_images/', blank=True, null=True)
+    image = models.ImageField(
+        upload_to='chat_images/', storage=get_blob_storage, max_length=255, blank=True, null=True
+    )
     file = models.FileField(
         upload_to='chat_files/',
+        storage=get_blob_storage,
+        max_length=255,
         blank=True,
         null=True,
         validators=[FileExtensionValidator(allowed_extensions=['pdf', 'doc', 'docx', 'txt', 'jpg', 'jpeg', 'png'])]
     )
     file_name = models.CharField(max_length=255, blank=True, null=True)
     file_size = models.PositiveIntegerField(blank=True, null=True)
+    # Longest edge -> thumbnail name, filled in the background after upload
+    thumbnails = models.JSONField(default=dict, blank=True)
     
     # Message metadata
     timestamp = models.DateTimeField(auto_now_add=True)
@@ -108,7 +117,9 @@ class Message(models.Model):
         elif self.appointment:
             self.message_type = 'appointment'
         
-        super().save(*args, **kwargs)
+        # Attachments are counted as references in the same transaction as the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
     
     def mark_as_read(self, user):
         """Mark message as read by specific user"""
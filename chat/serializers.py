@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Chat, Message
+from medlink.thumbnails import edges_of
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -11,12 +12,23 @@ class UserSerializer(serializers.ModelSerializer):
 
 class MessageSerializer(serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
+    thumbnails = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
         fields = '__all__'
         read_only_fields = ['sender', 'timestamp', 'is_read']
 
+    def get_thumbnails(self, obj):
+        # Longest edge -> URL, served from media like the image itself
+        storage = Message._meta.get_field('image').storage
+        request = self.context.get('request')
+        urls = {}
+        for edge, name in edges_of(obj.thumbnails).items():
+            url = storage.url(name)
+            urls[edge] = request.build_absolute_uri(url) if request is not None else url
+        return urls
+
 class ChatSerializer(serializers.ModelSerializer):
     participants = UserSerializer(many=True, read_only=True)
     messages = MessageSerializer(many=True, read_only=True)
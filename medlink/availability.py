@@ -0,0 +1,262 @@
+# server/medical/availability.py
+
+import heapq
+from datetime import datetime, timedelta
+from itertools import islice
+
+from django.utils import timezone
+
+from accounts.models import DoctorProfile
+from .models import Appointment, DoctorDaySchedule, SlotHold
+
+
+DEFAULT_SLOT_MINUTES = 30
+MAX_RANGE_DAYS = 31
+SEARCH_HORIZON_DAYS = 60
+
+
+def minutes_of(value):
+    """Minutes elapsed since midnight for a time or local datetime"""
+    return value.hour * 60 + value.minute
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def merge_intervals(intervals):
+    """Merge overlapping [start, end] minute intervals into a sorted list"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def appointment_interval(scheduled_time, duration):
+    """Return (date, start_minute, end_minute) of an appointment in local time"""
+    local = timezone.localtime(scheduled_time)
+    start = minutes_of(local)
+    # Appointments running past midnight are clipped to the day they start on
+    return local.date(), start, min(start + duration, 24 * 60)
+
+
+def remaining_minutes(profile, day, busy):
+    """Minutes of a day's working hours not covered by busy intervals"""
+    if not profile.is_working_day(day):
+        return 0
+
+    day_start = minutes_of(profile.working_hours_start)
+    day_end = minutes_of(profile.working_hours_end)
+    booked = sum(
+        max(0, min(end, day_end) - max(start, day_start))
+        for start, end in busy
+    )
+    return max(0, day_end - day_start - booked)
+
+
+def rebuild_day(doctor_id, day):
+    """Recompute the busy intervals of one doctor's day from its appointments"""
+    appointments = Appointment.objects.filter(
+        appointment_request__doctor_id=doctor_id,
+        scheduled_time__date=day
+    ).exclude(
+        appointment_request__status='cancelled'
+    ).values_list('scheduled_time', 'duration')
+
+    intervals = []
+    for scheduled_time, duration in appointments:
+        _, start, end = appointment_interval(scheduled_time, duration)
+        intervals.append([start, end])
+
+    if not intervals:
+        DoctorDaySchedule.objects.filter(doctor_id=doctor_id, date=day).delete()
+        return None
+
+    busy = merge_intervals(intervals)
+    profile = DoctorProfile.objects.only(
+        'working_hours_start', 'working_hours_end', 'working_days'
+    ).filter(user_id=doctor_id).first()
+
+    schedule, _ = DoctorDaySchedule.objects.update_or_create(
+        doctor_id=doctor_id,
+        date=day,
+        defaults={
+            'busy_intervals': busy,
+            'free_minutes': remaining_minutes(profile, day, busy) if profile else 0,
+        }
+    )
+    return schedule
+
+
+def rebuild_schedules(since=None):
+    """Rebuild every doctor day that has appointments or a stored schedule
+
+    Returns how many days were rebuilt. Days whose appointments are all
+    gone or cancelled lose their schedule row.
+    """
+    appointments = Appointment.objects.exclude(appointment_request__status='cancelled')
+    schedules = DoctorDaySchedule.objects.all()
+    if since is not None:
+        appointments = appointments.filter(scheduled_time__date__gte=since)
+        schedules = schedules.filter(date__gte=since)
+
+    days = set(schedules.values_list('doctor_id', 'date'))
+    for doctor_id, scheduled_time, duration in appointments.values_list(
+        'appointment_request__doctor_id', 'scheduled_time', 'duration'
+    ).iterator():
+        day, _, _ = appointment_interval(scheduled_time, duration)
+        days.add((doctor_id, day))
+    for doctor_id, day in sorted(days):
+        rebuild_day(doctor_id, day)
+    return len(days)
+
+
+def refresh_remaining_minutes(profile):
+    """Recompute upcoming free minutes after a doctor's working hours change"""
+    schedules = list(DoctorDaySchedule.objects.filter(
+        doctor_id=profile.user_id,
+        date__gte=timezone.localdate()
+    ))
+    for schedule in schedules:
+        schedule.free_minutes = remaining_minutes(profile, schedule.date, schedule.busy_intervals)
+    DoctorDaySchedule.objects.bulk_update(schedules, ['free_minutes'])
+
+
+def free_slots(profile, day, busy, slot_minutes=DEFAULT_SLOT_MINUTES, now=None):
+    """Yield (start, end) datetimes of bookable slots on a day"""
+    if not profile.is_working_day(day):
+        return
+
+    now = now or timezone.now()
+    day_start = minutes_of(profile.working_hours_start)
+    day_end = minutes_of(profile.working_hours_end)
+    midnight = _midnight(day)
+
+    busy_index = 0
+    start = day_start
+    while start + slot_minutes <= day_end:
+        end = start + slot_minutes
+        # Busy intervals are sorted, so skip the ones that end before this slot
+        while busy_index < len(busy) and busy[busy_index][1] <= start:
+            busy_index += 1
+        if busy_index < len(busy) and busy[busy_index][0] < end:
+            # Jump straight past the blocking interval, keeping the slot grid
+            blocked_until = busy[busy_index][1]
+            steps = -(-(blocked_until - day_start) // slot_minutes)
+            start = day_start + steps * slot_minutes
+            continue
+
+        slot_start = midnight + timedelta(minutes=start)
+        if slot_start > now:
+            yield slot_start, midnight + timedelta(minutes=end)
+        start = end
+
+
+def busy_index_for(doctor_ids, date_from, date_to):
+    """Load busy intervals as {(doctor_id, date): intervals} with indexed reads
+
+    Bookings come from the day schedule index; active slot holds are laid
+    on top so slots other patients are completing don't show as free.
+    """
+    rows = DoctorDaySchedule.objects.filter(
+        doctor_id__in=doctor_ids,
+        date__gte=date_from,
+        date__lte=date_to
+    ).values_list('doctor_id', 'date', 'busy_intervals')
+    index = {(doctor_id, day): intervals for doctor_id, day, intervals in rows}
+
+    holds = SlotHold.objects.filter(
+        doctor_id__in=doctor_ids,
+        start__gte=_midnight(date_from),
+        start__lt=_midnight(date_to + timedelta(days=1)),
+        expires_at__gt=timezone.now()
+    ).values_list('doctor_id', 'start', 'duration')
+    for doctor_id, start, duration in holds:
+        day, start_minute, end_minute = appointment_interval(start, duration)
+        key = (doctor_id, day)
+        index[key] = merge_intervals(index.get(key, []) + [[start_minute, end_minute]])
+    return index
+
+
+def booked_out_doctors(day, slot_minutes=DEFAULT_SLOT_MINUTES):
+    """Ids of doctors whose bookings and active holds leave no free slot on a day
+
+    Only doctors with something booked or held that day are walked; free
+    minutes alone can't tell a fragmented day from one with a slot left.
+    """
+    doctor_ids = set(DoctorDaySchedule.objects.filter(date=day).values_list('doctor_id', flat=True))
+    doctor_ids.update(SlotHold.objects.filter(
+        start__gte=_midnight(day),
+        start__lt=_midnight(day + timedelta(days=1)),
+        expires_at__gt=timezone.now()
+    ).values_list('doctor_id', flat=True))
+    if not doctor_ids:
+        return []
+
+    busy = busy_index_for(doctor_ids, day, day)
+    profiles = DoctorProfile.objects.only(
+        'user_id', 'working_hours_start', 'working_hours_end', 'working_days'
+    ).filter(user_id__in=doctor_ids)
+    return [
+        profile.user_id for profile in profiles
+        if next(free_slots(profile, day, busy.get((profile.user_id, day), []), slot_minutes), None) is None
+    ]
+
+
+def doctor_availability(profile, date_from, date_to, slot_minutes=DEFAULT_SLOT_MINUTES):
+    """Return a list of {'date', 'slots'} dicts for a doctor between two dates"""
+    busy = busy_index_for([profile.user_id], date_from, date_to)
+
+    days = []
+    day = date_from
+    while day <= date_to:
+        slots = free_slots(profile, day, busy.get((profile.user_id, day), []), slot_minutes)
+        days.append({
+            'date': day,
+            'slots': [{'start': start, 'end': end} for start, end in slots],
+        })
+        day += timedelta(days=1)
+    return days
+
+
+def _slot_stream(profile, date_from, date_to, busy, slot_minutes, after):
+    """Lazily yield (start, doctor_id, end) for one doctor in date order"""
+    day = date_from
+    while day <= date_to:
+        intervals = busy.get((profile.user_id, day), [])
+        for start, end in free_slots(profile, day, intervals, slot_minutes, now=after):
+            yield start, profile.id, end
+        day += timedelta(days=1)
+
+
+def earliest_slots(profiles, after, limit, slot_minutes=DEFAULT_SLOT_MINUTES,
+                   horizon_days=SEARCH_HORIZON_DAYS):
+    """Return the first `limit` free slots across doctors as (start, doctor_id, end)
+
+    Each doctor's calendar is a lazy stream merged k-way with a heap, so only
+    as many slots are generated as are needed. Busy intervals are read in
+    windows that double in size, starting with a single day, and the search
+    stops as soon as `limit` slots are found.
+    """
+    profiles = list(profiles)
+    doctor_ids = [profile.user_id for profile in profiles]
+    first_day = timezone.localtime(after).date()
+    last_day = first_day + timedelta(days=horizon_days - 1)
+
+    results = []
+    window_start = first_day
+    window_days = 1
+    while profiles and window_start <= last_day and len(results) < limit:
+        window_end = min(window_start + timedelta(days=window_days - 1), last_day)
+        busy = busy_index_for(doctor_ids, window_start, window_end)
+        streams = [
+            _slot_stream(profile, window_start, window_end, busy, slot_minutes, after)
+            for profile in profiles
+        ]
+        results.extend(islice(heapq.merge(*streams), limit - len(results)))
+        window_start = window_end + timedelta(days=1)
+        window_days *= 2
+    return results
@@ -0,0 +1,119 @@
+# server/medical/directory_cache.py
+
+import hashlib
+from urllib.parse import urlencode
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+VERSION_KEY = 'doctor-directory:version'
+DOCTOR_VERSION_KEY = 'doctor-directory:doctor:{}'
+METRIC_KEY = 'doctor-directory:{}'
+
+# Filters answered from live booking data rather than directory data
+UNCACHEABLE_PARAMS = {'available_date'}
+
+
+def get_cache():
+    return caches[getattr(settings, 'MEDLINK_DIRECTORY_CACHE', 'default')]
+
+
+def _versions(keys):
+    """Read version stamps, starting a fresh one for any that are missing"""
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # A fresh stamp, never the old default, so an evicted stamp
+            # can't bring back responses cached before the last bump
+            cache.add(key, uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(doctor_ids=()):
+    """Invalidate every list response and the detail responses of some doctors"""
+    keys = [VERSION_KEY] + [DOCTOR_VERSION_KEY.format(doctor_id) for doctor_id in doctor_ids]
+    get_cache().set_many({key: uuid4().hex for key in keys}, None)
+
+
+def normalized_params(query_params):
+    """Query parameters sorted with empty values and the default page dropped"""
+    items = sorted(
+        (name, value)
+        for name, values in query_params.lists()
+        for value in values
+        if value != ''
+    )
+    return [(name, value) for name, value in items if (name, value) != ('page', '1')]
+
+
+def response_key(request, doctor_id=None):
+    """Cache key for a directory response, or None when it must not be cached"""
+    params = normalized_params(request.query_params)
+    if any(name in UNCACHEABLE_PARAMS for name, _ in params):
+        return None
+
+    if doctor_id is None:
+        scope, (version,) = 'list', _versions([VERSION_KEY])
+    else:
+        scope, (version,) = f'doctor:{doctor_id}', _versions([DOCTOR_VERSION_KEY.format(doctor_id)])
+    # Pagination links are absolute, so the host is part of the response
+    digest = hashlib.sha1(f'{request.get_host()}?{urlencode(params)}'.encode('utf-8')).hexdigest()
+    return f'doctor-directory:{scope}:{version}:{digest}'
+
+
+def _count(metric):
+    cache = get_cache()
+    key = METRIC_KEY.format(metric)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def stats():
+    cache = get_cache()
+    counts = cache.get_many([METRIC_KEY.format('hits'), METRIC_KEY.format('misses')])
+    return {
+        'hits': counts.get(METRIC_KEY.format('hits'), 0),
+        'misses': counts.get(METRIC_KEY.format('misses'), 0),
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([METRIC_KEY.format('hits'), METRIC_KEY.format('misses')])
+
+
+class DirectoryCacheMixin:
+    """Serve rendered JSON of directory GETs from cache, tagging X-Cache"""
+    cache_lookup_kwarg = None
+
+    def get(self, request, *args, **kwargs):
+        doctor_id = self.kwargs.get(self.cache_lookup_kwarg) if self.cache_lookup_kwarg else None
+        key = response_key(request, doctor_id)
+        if key is None or request.accepted_renderer.format != 'json':
+            return super().get(request, *args, **kwargs)
+
+        cache = get_cache()
+        cached = cache.get(key)
+        if cached is not None:
+            _count('hits')
+            content, headers = cached
+            response = HttpResponse(content, content_type='application/json', headers=headers)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _count('misses')
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            renderer_context = self.get_renderer_context()
+            content = request.accepted_renderer.render(response.data, renderer_context=renderer_context)
+            # Keep headers that describe the payload, such as X-Estimated-Count
+            headers = {name: value for name, value in response.items() if name.startswith('X-')}
+            cache.set(key, (content, headers))
+        response['X-Cache'] = 'MISS'
+        return response
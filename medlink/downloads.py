@@ -0,0 +1,158 @@
+# server/medical/downloads.py
+
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils.http import content_disposition_header, http_date, parse_etags
+
+from .storage import blob_digest
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+SIGNING_SALT = 'medlink.medical-file-download'
+
+
+def sign(medical_file, user):
+    """A token for one user to fetch one file without credentials, for a short time"""
+    return signing.dumps([medical_file.id, user.id], salt=SIGNING_SALT)
+
+
+def unsign(token, medical_file_id):
+    """The user id a token was issued to, or None if it is invalid, expired or for another file"""
+    try:
+        file_id, user_id = signing.loads(
+            token, salt=SIGNING_SALT, max_age=settings.MEDLINK_DOWNLOAD_URL_SECONDS
+        )
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    return user_id if file_id == medical_file_id else None
+
+
+def etag_for(name, stat):
+    # Content-addressed names carry their digest, which makes a strong validator
+    digest = blob_digest(name)
+    return f'"{digest}"' if digest else f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+
+
+def parse_range(header, size):
+    """(first, last) byte of a single `bytes=` range
+
+    Returns None to send the whole file, which is also the answer to
+    multiple or malformed ranges. Raises ValueError when the range lies
+    past the end of the file.
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-500 is the last 500 bytes
+        if int(last) == 0:
+            raise ValueError('Empty suffix range')
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), size - 1 if not last else min(int(last), size - 1)
+        if last and int(last) < start:
+            return None
+    if start >= size:
+        raise ValueError('Range starts past the end of the file')
+    return start, end
+
+
+class RangeFile:
+    """A byte window of an open file
+
+    Reads stop at the end of the window. fileno() and the file position
+    let a WSGI server's file_wrapper (gunicorn's, for one) send the window
+    with os.sendfile, bounded by Content-Length, without copying it
+    through Python.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def file_response(request, storage, name, as_attachment=False):
+    """Serve a stored file with validators and ranges, or hand it to the front server"""
+    path = storage.path(name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404('File is missing from storage')
+
+    etag = etag_for(name, stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        # Protected content: caches may keep it but must revalidate every time
+        'Cache-Control': 'private, no-cache',
+    }
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    filename = posixpath.basename(name)
+    backend = settings.MEDLINK_DOWNLOAD_BACKEND
+    if backend != 'stream':
+        # The front server sends the bytes and answers Range requests itself
+        response = HttpResponse(content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        if backend == 'x-accel-redirect':
+            physical = getattr(storage, 'physical_name', lambda value: value)(name)
+            response['X-Accel-Redirect'] = quote(f'{settings.MEDLINK_DOWNLOAD_ACCEL_PREFIX}{physical}')
+        else:
+            response['X-Sendfile'] = path
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    size = stat.st_size
+    byte_range = None
+    # If-Range: only honour the range while the client's copy is still current
+    if_range = request.headers.get('If-Range')
+    if not if_range or if_range.strip() in (etag, headers['Last-Modified']):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, as_attachment=as_attachment, filename=filename)
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            RangeFile(file, start, end - start + 1), as_attachment=as_attachment, filename=filename, status=206
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,264 @@
+# server/medical/fast_serializers.py
+
+from django.utils import timezone
+from rest_framework.response import Response
+
+from accounts import catalog
+from accounts.models import User, Specialization, DoctorSpecialization
+from accounts.serializer import (
+    UserSerializer, SpecializationSerializer, DoctorSpecializationSerializer, DoctorProfileSerializer,
+    expanded_paths
+)
+from .models import AppointmentRequest
+from .serializers import AppointmentRequestSerializer, AppointmentSerializer
+
+
+def _converter(serializer_class, name):
+    """The serializer field's own to_representation, compiled once, passing None through"""
+    to_representation = serializer_class().fields[name].to_representation
+
+    def convert(value):
+        return None if value is None else to_representation(value)
+    return convert
+
+
+def _display(model, name):
+    choices = {value: str(label) for value, label in model._meta.get_field(name).flatchoices}
+    return lambda value: choices.get(value, value)
+
+
+class UserReader:
+    """UserSerializer output from values() columns under `prefix`"""
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.columns = [f'{prefix}{name}' for name in (
+            'id', 'username', 'email', 'first_name', 'last_name', 'role', 'phone_number',
+            'date_of_birth', 'gender', 'profile_picture', 'is_verified', 'date_joined', 'last_login'
+        )]
+        self.date = _converter(UserSerializer, 'date_of_birth')
+        self.datetime = _converter(UserSerializer, 'date_joined')
+        self.storage = User._meta.get_field('profile_picture').storage
+
+    def picture_url(self, name, request):
+        if not name:
+            return None
+        url = self.storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def build(self, row, request, pending):
+        p = self.prefix
+        username, first_name, last_name = row[f'{p}username'], row[f'{p}first_name'], row[f'{p}last_name']
+        born = row[f'{p}date_of_birth']
+        age = None
+        if born:
+            today = timezone.now().date()
+            age = today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+        return {
+            'id': row[f'{p}id'],
+            'username': username,
+            'email': row[f'{p}email'],
+            'first_name': first_name,
+            'last_name': last_name,
+            'full_name': f"{first_name} {last_name}" if first_name and last_name else username,
+            'role': row[f'{p}role'],
+            'phone_number': row[f'{p}phone_number'],
+            'date_of_birth': self.date(born),
+            'age': age,
+            'gender': row[f'{p}gender'],
+            'profile_picture': self.picture_url(row[f'{p}profile_picture'], request),
+            'is_verified': row[f'{p}is_verified'],
+            'date_joined': self.datetime(row[f'{p}date_joined']),
+            'last_login': self.datetime(row[f'{p}last_login']),
+        }
+
+
+class DoctorProfileReader:
+    """DoctorProfileSerializer output; specializations are filled in one batch per page"""
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.user = UserReader(f'{prefix}user__')
+        self.columns = [f'{prefix}{name}' for name in (
+            'id', 'address', 'qualifications', 'experience_years', 'bio', 'rating', 'total_reviews',
+            'consultation_fee', 'is_available', 'working_hours_start', 'working_hours_end',
+            'working_days', 'created_at', 'updated_at'
+        )] + self.user.columns
+        self.fee = _converter(DoctorProfileSerializer, 'consultation_fee')
+        self.time = _converter(DoctorProfileSerializer, 'working_hours_start')
+        self.datetime = _converter(DoctorProfileSerializer, 'created_at')
+
+    def build(self, row, request, pending):
+        p = self.prefix
+        profile_id = row[f'{p}id']
+        if profile_id is None:
+            # A doctor user without a profile row
+            return None
+        working_days = row[f'{p}working_days']
+        specializations = []
+        pending.setdefault(profile_id, []).append(specializations)
+        return {
+            'id': profile_id,
+            'user': self.user.build(row, request, pending),
+            'address': row[f'{p}address'],
+            'qualifications': row[f'{p}qualifications'],
+            'experience_years': row[f'{p}experience_years'],
+            'bio': row[f'{p}bio'],
+            'rating': row[f'{p}rating'],
+            'total_reviews': row[f'{p}total_reviews'],
+            'consultation_fee': self.fee(row[f'{p}consultation_fee']),
+            'is_available': row[f'{p}is_available'],
+            'working_hours_start': self.time(row[f'{p}working_hours_start']),
+            'working_hours_end': self.time(row[f'{p}working_hours_end']),
+            'working_days': working_days,
+            'working_days_list': [day.strip() for day in working_days.split(',')],
+            'specializations': specializations,
+            'created_at': self.datetime(row[f'{p}created_at']),
+            'updated_at': self.datetime(row[f'{p}updated_at']),
+        }
+
+
+class SpecializationFiller:
+    """Fill the specialization lists of a page of doctor profiles with one query"""
+
+    def __init__(self):
+        self.date = _converter(DoctorSpecializationSerializer, 'certification_date')
+        self.datetime = _converter(SpecializationSerializer, 'created_at')
+
+    def specialization(self, specialization_id):
+        specialization = catalog.get(specialization_id)
+        if specialization is None:
+            # Not in the catalog yet; the serializer falls back the same way
+            return SpecializationSerializer(Specialization.objects.get(id=specialization_id)).data
+        return {
+            'id': specialization.id,
+            'name': specialization.name,
+            'description': specialization.description,
+            'icon': specialization.icon,
+            'is_active': specialization.is_active,
+            'doctor_count': specialization.doctor_count,
+            'created_at': self.datetime(specialization.created_at),
+        }
+
+    def fill(self, pending):
+        if not pending:
+            return
+        rows = DoctorSpecialization.objects.filter(doctor_id__in=pending).values(
+            'id', 'doctor_id', 'specialization_id', 'experience_years', 'certification',
+            'certification_date', 'is_primary'
+        )
+        specializations = {}
+        for row in rows:
+            specialization_id = row['specialization_id']
+            if specialization_id not in specializations:
+                specializations[specialization_id] = self.specialization(specialization_id)
+            item = {
+                'id': row['id'],
+                'specialization': specializations[specialization_id],
+                'experience_years': row['experience_years'],
+                'certification': row['certification'],
+                'certification_date': self.date(row['certification_date']),
+                'is_primary': row['is_primary'],
+            }
+            for specialization_list in pending[row['doctor_id']]:
+                specialization_list.append(item)
+
+
+class AppointmentRequestReader:
+    """AppointmentRequestSerializer output from values() columns under `prefix`"""
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.doctor_profile = DoctorProfileReader(f'{prefix}doctor__doctor_profile__')
+        self.columns = [f'{prefix}{name}' for name in (
+            'id', 'patient_id', 'patient__username', 'doctor_id', 'doctor__username', 'requested_at',
+            'preferred_date', 'preferred_time_slot', 'status', 'reason', 'urgency_level', 'notes'
+        )] + self.doctor_profile.columns
+        self.datetime = _converter(AppointmentRequestSerializer, 'requested_at')
+        self.date = _converter(AppointmentRequestSerializer, 'preferred_date')
+        self.status_display = _display(AppointmentRequest, 'status')
+        self.urgency_display = _display(AppointmentRequest, 'urgency_level')
+
+    def build(self, row, request, pending):
+        p = self.prefix
+        return {
+            'id': row[f'{p}id'],
+            'patient': row[f'{p}patient_id'],
+            'patient_name': row[f'{p}patient__username'],
+            'doctor': row[f'{p}doctor_id'],
+            'doctor_name': row[f'{p}doctor__username'],
+            'doctor_profile': self.doctor_profile.build(row, request, pending),
+            'requested_at': self.datetime(row[f'{p}requested_at']),
+            'preferred_date': self.date(row[f'{p}preferred_date']),
+            'preferred_time_slot': row[f'{p}preferred_time_slot'],
+            'status': row[f'{p}status'],
+            'status_display': self.status_display(row[f'{p}status']),
+            'reason': row[f'{p}reason'],
+            'urgency_level': row[f'{p}urgency_level'],
+            'urgency_display': self.urgency_display(row[f'{p}urgency_level']),
+            'notes': row[f'{p}notes'],
+        }
+
+
+class AppointmentReader:
+    """AppointmentSerializer output from values() rows"""
+
+    def __init__(self):
+        self.appointment_request = AppointmentRequestReader('appointment_request__')
+        self.columns = [
+            'id', 'scheduled_time', 'duration', 'accepted_by_id', 'accepted_by__username',
+            'created_at', 'updated_at', 'notes', 'is_confirmed'
+        ] + self.appointment_request.columns
+        self.datetime = _converter(AppointmentSerializer, 'scheduled_time')
+
+    def build(self, row, request, pending):
+        scheduled_time = row['scheduled_time']
+        data = {
+            'id': row['id'],
+            'appointment_request': self.appointment_request.build(row, request, pending),
+            'patient_name': row['appointment_request__patient__username'],
+            'doctor_name': row['appointment_request__doctor__username'],
+            'scheduled_time': self.datetime(scheduled_time),
+            'scheduled_time_formatted': scheduled_time.strftime('%Y-%m-%d %H:%M'),
+            'duration': row['duration'],
+            'duration_formatted': f"{row['duration']} minutes",
+            'accepted_by': row['accepted_by_id'],
+        }
+        # The serializer leaves accepted_by_name out when nobody accepted
+        if row['accepted_by_id'] is not None:
+            data['accepted_by_name'] = row['accepted_by__username']
+        data.update({
+            'created_at': self.datetime(row['created_at']),
+            'updated_at': self.datetime(row['updated_at']),
+            'notes': row['notes'],
+            'is_confirmed': row['is_confirmed'],
+        })
+        return data
+
+
+def render(reader, rows, request=None):
+    """Build the response dicts for a page of values() rows"""
+    pending = {}
+    data = [reader.build(row, request, pending) for row in rows]
+    SpecializationFiller().fill(pending)
+    return data
+
+
+class FastListMixin:
+    """Serve plain list GETs from values() rows through `fast_reader`
+
+    Used only for the default response shape; ?fields= and ?expand=
+    requests go through the serializer.
+    """
+    fast_reader = None
+
+    def list(self, request, *args, **kwargs):
+        if self.fast_reader is None or expanded_paths(request) is not None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        rows = queryset.values(*self.fast_reader.columns)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(render(self.fast_reader, rows, request))
+        return self.get_paginated_response(render(self.fast_reader, page, request))
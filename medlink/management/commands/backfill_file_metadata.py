@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from medlink.models import MedicalFile
+
+METADATA_FIELDS = ['file_size', 'sha256', 'mime_type', 'width', 'height']
+
+
+def describe(medical_file):
+    """Capture one file's metadata, or None if it is missing from storage"""
+    try:
+        medical_file.capture_metadata()
+    except FileNotFoundError:
+        return None
+    return medical_file
+
+
+class Command(BaseCommand):
+    help = 'Record size, digest, MIME type and image dimensions for medical files stored without them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Files read at once')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows updated per query')
+
+    def handle(self, *args, **options):
+        rows = MedicalFile.objects.filter(file_size__isnull=True).exclude(file='').only('id', 'file')
+        updated, missing = 0, 0
+        # Reading and hashing is I/O and hashlib, which release the GIL, so
+        # threads overlap it; the database is only touched from this thread
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            batch = []
+            for medical_file in rows.iterator(chunk_size=options['batch_size']):
+                batch.append(medical_file)
+                if len(batch) >= options['batch_size']:
+                    done, lost = self.run(executor, batch)
+                    updated, missing, batch = updated + done, missing + lost, []
+            done, lost = self.run(executor, batch)
+            updated, missing = updated + done, missing + lost
+        self.stdout.write(self.style.SUCCESS(f'Recorded metadata for {updated} files ({missing} missing)'))
+
+    def run(self, executor, batch):
+        described = list(executor.map(describe, batch))
+        found = [medical_file for medical_file in described if medical_file is not None]
+        MedicalFile.objects.bulk_update(found, METADATA_FIELDS)
+        for medical_file, result in zip(batch, described):
+            if result is None:
+                self.stderr.write(f'Missing {medical_file.file.name} (MedicalFile {medical_file.pk})')
+        return len(found), len(batch) - len(found)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from medlink.models import AppointmentRequest
+
+
+class Command(BaseCommand):
+    help = 'Set the triage priority of appointment requests created before it was stored'
+
+    def handle(self, *args, **options):
+        updated = AppointmentRequest.sync_priorities()
+        self.stdout.write(self.style.SUCCESS(f'Updated the priority of {updated} requests'))
@@ -0,0 +1,77 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import User, DoctorProfile, Specialization, DoctorSpecialization
+from medlink.availability import earliest_slots, doctor_availability
+from medlink.models import DoctorDaySchedule
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the earliest-slot search against synthetic doctors (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=14, help='Days of synthetic bookings per doctor')
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            profiles = self.create_doctors(options['doctors'], options['days'])
+            after = timezone.now()
+
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                slots = earliest_slots(profiles, after, options['limit'])
+            merged = (time.perf_counter() - started) / options['repeat']
+
+            # Baseline: build every doctor's full calendar, then sort
+            started = time.perf_counter()
+            date_from = timezone.localdate()
+            date_to = date_from + timedelta(days=options['days'] - 1)
+            everything = []
+            for profile in profiles:
+                for day in doctor_availability(profile, date_from, date_to):
+                    everything.extend((slot['start'], profile.id) for slot in day['slots'])
+            everything.sort()
+            full_scan = time.perf_counter() - started
+
+            self.stdout.write(f"doctors={len(profiles)} results={len(slots)}")
+            self.stdout.write(f"k-way merge:        {merged * 1000:.1f} ms/search")
+            self.stdout.write(f"full calendar scan: {full_scan * 1000:.1f} ms/search")
+
+            transaction.set_rollback(True)
+
+    def create_doctors(self, count, days):
+        specialization, _ = Specialization.objects.get_or_create(name='Benchmark Cardiology')
+        stamp = int(time.time())
+        users = User.objects.bulk_create([
+            User(username=f'bench_{stamp}_{i}', role='doctor', password='!')
+            for i in range(count)
+        ])
+        DoctorProfile.objects.bulk_create([DoctorProfile(user=user) for user in users])
+        profiles = list(DoctorProfile.objects.filter(user__in=users))
+        DoctorSpecialization.objects.bulk_create([
+            DoctorSpecialization(doctor=profile, specialization=specialization)
+            for profile in profiles
+        ])
+
+        # Fill most of the working day so the earliest slots are spread out
+        today = timezone.localdate()
+        schedules = []
+        for user in users:
+            for offset in range(days):
+                busy = sorted(random.sample(range(540, 1020, 30), 14))
+                schedules.append(DoctorDaySchedule(
+                    doctor=user,
+                    date=today + timedelta(days=offset),
+                    busy_intervals=[[start, start + 30] for start in busy],
+                    free_minutes=60
+                ))
+        DoctorDaySchedule.objects.bulk_create(schedules, batch_size=1000)
+        return profiles
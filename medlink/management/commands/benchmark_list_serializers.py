@@ -0,0 +1,96 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from accounts.models import User, DoctorProfile, Specialization, DoctorSpecialization
+from accounts.serializer import DoctorProfileSerializer
+from medlink.fast_serializers import AppointmentReader, AppointmentRequestReader, DoctorProfileReader, render
+from medlink.models import Appointment, AppointmentRequest
+from medlink.serializers import AppointmentRequestSerializer, AppointmentSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare list rendering through DRF serializers and values() readers (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get('/'))
+        with transaction.atomic():
+            self.create_rows(options['rows'])
+            cases = [
+                ('doctors', DoctorProfileSerializer, DoctorProfileReader(),
+                 DoctorProfile.objects.filter(user__username__startswith='bench_').order_by('id')),
+                ('appointment requests', AppointmentRequestSerializer, AppointmentRequestReader(),
+                 AppointmentRequest.objects.filter(patient__username__startswith='bench_').order_by('id')),
+                ('appointments', AppointmentSerializer, AppointmentReader(),
+                 Appointment.objects.filter(
+                     appointment_request__patient__username__startswith='bench_'
+                 ).order_by('id')),
+            ]
+            for label, serializer_class, reader, queryset in cases:
+                def serialized():
+                    rows = serializer_class.setup_eager_loading(queryset, request)
+                    return serializer_class(rows, many=True, context={'request': request}).data
+
+                def read():
+                    return render(reader, queryset.values(*reader.columns), request)
+
+                rows = queryset.count()
+                slow = self.rows_per_second(serialized, rows, options['repeat'])
+                fast = self.rows_per_second(read, rows, options['repeat'])
+                self.stdout.write(
+                    f"{label:<22} rows={rows} serializer={slow:,.0f} rows/s "
+                    f"values()={fast:,.0f} rows/s ({fast / slow:.1f}x)"
+                )
+
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def rows_per_second(build, rows, repeat):
+        """Throughput of querying, building and rendering the rows to JSON"""
+        started = time.perf_counter()
+        for _ in range(repeat):
+            JSONRenderer().render(build())
+        return rows * repeat / (time.perf_counter() - started)
+
+    def create_rows(self, count):
+        specializations = [
+            Specialization.objects.get_or_create(name=f'Benchmark {name}')[0]
+            for name in ('Cardiology', 'Neurology')
+        ]
+        stamp = int(time.time())
+        patient = User.objects.create(username=f'bench_{stamp}_patient', role='patient', password='!')
+        doctors = User.objects.bulk_create([
+            User(username=f'bench_{stamp}_{i}', role='doctor', password='!', first_name='Bench', last_name=str(i))
+            for i in range(count)
+        ])
+        DoctorProfile.objects.bulk_create([DoctorProfile(user=user) for user in doctors])
+        profiles = list(DoctorProfile.objects.filter(user__in=doctors))
+        DoctorSpecialization.objects.bulk_create([
+            DoctorSpecialization(doctor=profile, specialization=specialization)
+            for profile in profiles
+            for specialization in specializations
+        ])
+
+        day = timezone.localdate() + timedelta(days=7)
+        requests = AppointmentRequest.objects.bulk_create([
+            AppointmentRequest(
+                patient=patient, doctor=doctor, preferred_date=day, preferred_time_slot='morning',
+                reason='Benchmark', status='accepted'
+            )
+            for doctor in doctors
+        ])
+        start = timezone.now() + timedelta(days=7)
+        Appointment.objects.bulk_create([
+            Appointment(appointment_request=request, scheduled_time=start, accepted_by=request.doctor)
+            for request in requests
+        ], batch_size=1000)
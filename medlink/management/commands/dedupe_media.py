@@ -0,0 +1,90 @@
+import os
+from collections import Counter
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chat.models import Message
+from medlink.models import MedicalFile, StoredBlob
+from medlink.storage import blob_digest
+
+# Every file field backed by the content-addressed storage
+FILE_FIELDS = [(MedicalFile, 'file'), (Message, 'file'), (Message, 'image')]
+
+
+class Command(BaseCommand):
+    help = (
+        'Move medical_files/, chat_files/ and chat_images/ into content-addressed blobs, '
+        'storing duplicates once, and recount blob references'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report duplicates without changing anything')
+        parser.add_argument('--keep-originals', action='store_true', help='Leave the old files in place')
+
+    def handle(self, *args, **options):
+        migrated, missing, originals = 0, 0, set()
+        seen, duplicate_bytes = set(), 0
+
+        for model, field_name in FILE_FIELDS:
+            storage = model._meta.get_field(field_name).storage
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for pk, name in rows.values_list('pk', field_name).iterator():
+                if blob_digest(name):
+                    continue
+                path = storage.path(name)
+                if not os.path.exists(path):
+                    missing += 1
+                    self.stderr.write(f'Missing {name} ({model.__name__} {pk})')
+                    continue
+
+                with open(path, 'rb') as original:
+                    digest, size = storage.digest(File(original))
+                    if digest in seen or StoredBlob.objects.filter(sha256=digest).exists():
+                        duplicate_bytes += size
+                    seen.add(digest)
+                    if options['dry_run']:
+                        continue
+                    original.seek(0)
+                    with transaction.atomic():
+                        # Duplicates only gain a reference; the rest are copied once
+                        new_name = storage.save(name, File(original))
+                        model.objects.filter(pk=pk).update(**{field_name: new_name})
+                originals.add(path)
+                migrated += 1
+
+        if options['dry_run']:
+            self.stdout.write(f'{len(seen)} distinct files, {duplicate_bytes} bytes held in duplicates')
+            return
+
+        if not options['keep_originals']:
+            # Only after every row moved, since several rows may share an old path
+            for path in originals:
+                os.remove(path)
+
+        recounted, collected = self.recount()
+        self.stdout.write(self.style.SUCCESS(
+            f'Migrated {migrated} files ({missing} missing), saved {duplicate_bytes} bytes; '
+            f'recounted {recounted} blobs, removed {collected} unreferenced'
+        ))
+
+    def recount(self):
+        """Set every blob's reference count from the rows that hold it"""
+        references = Counter()
+        for model, field_name in FILE_FIELDS:
+            for name in model.objects.values_list(field_name, flat=True).iterator():
+                digest = blob_digest(name)
+                if digest:
+                    references[digest] += 1
+
+        storage = MedicalFile._meta.get_field('file').storage
+        blobs = list(StoredBlob.objects.all())
+        collected = 0
+        for blob in blobs:
+            blob.refcount = references.get(blob.sha256, 0)
+        StoredBlob.objects.bulk_update(blobs, ['refcount'], batch_size=1000)
+        for blob in blobs:
+            if blob.refcount == 0 and storage.collect(blob.sha256):
+                collected += 1
+        return len(blobs), collected
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from medlink.directory_cache import reset_stats, stats
+
+
+class Command(BaseCommand):
+    help = 'Report hit/miss counts of the doctor directory response cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after reporting')
+
+    def handle(self, *args, **options):
+        counts = stats()
+        total = counts['hits'] + counts['misses']
+        ratio = counts['hits'] / total if total else 0.0
+        self.stdout.write(f"hits={counts['hits']} misses={counts['misses']} hit_ratio={ratio:.1%}")
+        if options['reset']:
+            reset_stats()
@@ -0,0 +1,177 @@
+import heapq
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from medlink.models import AppointmentReminder
+from medlink.reminders import get_backend
+
+logger = logging.getLogger('medlink.reminders')
+
+# claimed_by has room for this much hostname plus ':<pid>:<8 hex>'
+MAX_HOSTNAME_LENGTH = 100
+
+
+class Command(BaseCommand):
+    help = 'Send due appointment reminders; safe to run as several parallel workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--poll-interval', type=float, default=30.0, help='Max seconds between schedule reloads')
+        parser.add_argument('--lookahead', type=int, default=300, help='Seconds of upcoming reminders kept in the heap')
+        parser.add_argument('--lease', type=int, default=120, help='Seconds a claimed batch stays reserved')
+        parser.add_argument('--retry-delay', type=int, default=300, help='Seconds before a failed reminder is retried')
+        parser.add_argument('--metrics-file', help='Write a JSON metrics snapshot here after each batch')
+        parser.add_argument('--once', action='store_true', help='Send what is due now and exit')
+
+    def handle(self, *args, **options):
+        self.options = options
+        # The hostname is cut so the id always fits AppointmentReminder.claimed_by
+        self.worker_id = f'{socket.gethostname()[:MAX_HOSTNAME_LENGTH]}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.metrics = {'worker': self.worker_id, 'sent': 0, 'failed': 0, 'batches': 0,
+                        'started_at': time.time(), 'last_lag_seconds': None, 'max_lag_seconds': 0.0}
+        self.stdout.write(f'Reminder worker {self.worker_id} started')
+
+        heap = []
+        loaded_at = 0.0
+        try:
+            while True:
+                if not heap or time.monotonic() - loaded_at >= options['poll_interval']:
+                    heap = self.load_schedule()
+                    loaded_at = time.monotonic()
+
+                now = timezone.now()
+                due = []
+                while heap and heap[0][0] <= now and len(due) < options['batch_size']:
+                    due.append(heapq.heappop(heap)[1])
+
+                if due:
+                    self.dispatch(due)
+                    continue
+
+                if options['once']:
+                    break
+
+                # Sleep until the next reminder is due or the schedule should be reloaded
+                wait = options['poll_interval']
+                if heap:
+                    wait = min(wait, max((heap[0][0] - now).total_seconds(), 0.05))
+                time.sleep(wait)
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f'Reminder worker stopped: {json.dumps(self.snapshot())}')
+
+    def load_schedule(self):
+        """Heap of (reminder_time, id) for unsent reminders of upcoming appointments due within the lookahead"""
+        now = timezone.now()
+        rows = AppointmentReminder.objects.filter(
+            is_sent=False,
+            reminder_time__lte=now + timedelta(seconds=self.options['lookahead'])
+        ).filter(
+            Q(claimed_until__isnull=True) | Q(claimed_until__lt=now)
+        ).filter(
+            # A reminder for an appointment that has already started is no use
+            appointment__scheduled_time__gt=now
+        ).exclude(
+            appointment__appointment_request__status='cancelled'
+        ).order_by('reminder_time').values_list('reminder_time', 'id')[:self.options['batch_size'] * 10]
+        heap = list(rows)
+        heapq.heapify(heap)
+        return heap
+
+    def claim(self, reminder_ids):
+        """Lease reminders to this worker; rows locked by other workers are skipped"""
+        now = timezone.now()
+        with transaction.atomic():
+            available = list(AppointmentReminder.objects.select_for_update(skip_locked=True).filter(
+                id__in=reminder_ids,
+                is_sent=False
+            ).filter(
+                Q(claimed_until__isnull=True) | Q(claimed_until__lt=now)
+            ).filter(
+                appointment__scheduled_time__gt=now
+            ).exclude(
+                # Checked again here, in case the request was cancelled after the schedule loaded
+                appointment__appointment_request__status='cancelled'
+            ).values_list('id', flat=True))
+            # The conditional update makes the claim safe on backends without row locks too
+            AppointmentReminder.objects.filter(id__in=available).filter(
+                Q(claimed_until__isnull=True) | Q(claimed_until__lt=now)
+            ).update(
+                claimed_by=self.worker_id,
+                claimed_until=now + timedelta(seconds=self.options['lease'])
+            )
+        return list(AppointmentReminder.objects.filter(
+            id__in=available,
+            claimed_by=self.worker_id,
+            is_sent=False
+        ).select_related(
+            'appointment__appointment_request__patient',
+            'appointment__appointment_request__doctor'
+        ))
+
+    def dispatch(self, reminder_ids):
+        reminders = self.claim(reminder_ids)
+        if not reminders:
+            return
+
+        by_type = defaultdict(list)
+        for reminder in reminders:
+            by_type[reminder.reminder_type].append(reminder)
+
+        delivered = []
+        for reminder_type, batch in by_type.items():
+            try:
+                delivered.extend(get_backend(reminder_type).send_many(batch))
+            except Exception:
+                logger.exception('Reminder backend for %s failed', reminder_type)
+
+        now = timezone.now()
+        AppointmentReminder.objects.filter(id__in=delivered, claimed_by=self.worker_id).update(
+            is_sent=True,
+            sent_at=now,
+            claimed_until=None
+        )
+        delivered_ids = set(delivered)
+        failed = [reminder.id for reminder in reminders if reminder.id not in delivered_ids]
+        if failed:
+            # Keep the lease until the retry delay so failures back off
+            AppointmentReminder.objects.filter(id__in=failed, claimed_by=self.worker_id).update(
+                claimed_until=now + timedelta(seconds=self.options['retry_delay'])
+            )
+
+        self.record(reminders, delivered, failed, now)
+
+    def record(self, reminders, delivered, failed, now):
+        delivered = set(delivered)
+        lags = [(now - reminder.reminder_time).total_seconds() for reminder in reminders if reminder.id in delivered]
+        self.metrics['sent'] += len(delivered)
+        self.metrics['failed'] += len(failed)
+        self.metrics['batches'] += 1
+        if lags:
+            self.metrics['last_lag_seconds'] = round(max(lags), 3)
+            self.metrics['max_lag_seconds'] = round(max(self.metrics['max_lag_seconds'], *lags), 3)
+
+        snapshot = self.snapshot()
+        logger.info('Reminder batch: %s', snapshot)
+        self.stdout.write(
+            f"sent={len(delivered)} failed={len(failed)} "
+            f"throughput={snapshot['throughput_per_second']}/s lag={snapshot['last_lag_seconds']}s"
+        )
+        if self.options['metrics_file']:
+            with open(self.options['metrics_file'], 'w', encoding='utf-8') as handle:
+                json.dump(snapshot, handle)
+
+    def snapshot(self):
+        elapsed = max(time.time() - self.metrics['started_at'], 1e-6)
+        return {**self.metrics, 'throughput_per_second': round(self.metrics['sent'] / elapsed, 2)}
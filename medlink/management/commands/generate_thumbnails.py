@@ -0,0 +1,53 @@
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from chat.models import Message
+from medlink.models import MedicalFile
+from medlink.thumbnails import FAILED, get_executor, job, record, render, source_field
+
+# Rows in flight at once, so the backlog never sits in memory whole
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnails for medical files and chat attachments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retry-failed', action='store_true',
+            help='Also retry files whose last render produced nothing, e.g. after installing pdftoppm'
+        )
+
+    def handle(self, *args, **options):
+        generated = 0
+        for model in (MedicalFile, Message):
+            missing = Q(thumbnails={})
+            if options['retry_failed']:
+                missing |= Q(thumbnails__has_key=FAILED)
+            rows = model.objects.filter(missing).only('pk', 'thumbnails', *model.THUMBNAIL_FIELDS)
+            batch = []
+            for instance in rows.iterator():
+                prepared = job(instance)
+                if prepared is not None:
+                    batch.append((instance.pk, source_field(instance), *prepared))
+                if len(batch) >= BATCH_SIZE:
+                    generated += self.run(model, batch)
+                    batch = []
+            generated += self.run(model, batch)
+        self.stdout.write(self.style.SUCCESS(f'Generated thumbnails for {generated} files'))
+
+    def run(self, model, batch):
+        """Render a batch in the pool and record the results here, as each finishes"""
+        if not settings.MEDLINK_THUMBNAIL_WORKERS:
+            results = ((row, render(*row[3])) for row in batch)
+        else:
+            futures = {get_executor().submit(render, *row[3]): row for row in batch}
+            results = ((futures[future], future.result()) for future in as_completed(futures))
+        done = 0
+        for (pk, field, name, _), edges in results:
+            record(model, pk, field, name, edges)
+            done += bool(edges)
+        return done
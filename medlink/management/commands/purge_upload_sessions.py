@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from medlink.uploads import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired resumable upload sessions and their staged chunks'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(f'Purged {deleted} expired upload sessions')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from medlink.availability import rebuild_schedules
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-day availability index from existing appointments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Include past days, not only today onwards')
+
+    def handle(self, *args, **options):
+        since = None if options['all'] else timezone.localdate()
+        total = rebuild_schedules(since=since)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} doctor days'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from medlink.models import SlotLedgerEntry
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the booking ledger from existing appointments, reporting double bookings'
+
+    def handle(self, *args, **options):
+        # Granules that started earlier can no longer be booked or held
+        conflicts = SlotLedgerEntry.rebuild(since=timezone.now())
+        for appointment in conflicts:
+            self.stderr.write(
+                f'Appointment {appointment.id} at {appointment.scheduled_time} overlaps another booking '
+                f'of doctor {appointment.appointment_request.doctor_id}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the slot ledger, {len(conflicts)} conflicting appointments'))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from medlink.models import SlotHold
+from medlink.waitlist import expire_offers
+
+
+class Command(BaseCommand):
+    help = 'Delete expired slot holds and requeue waitlist entries whose offer lapsed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Repeat every N seconds instead of running once')
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = expire_offers()
+            if requeued:
+                self.stdout.write(f'Requeued {requeued} lapsed waitlist offers')
+            _, deleted = SlotHold.objects.filter(expires_at__lte=timezone.now()).delete()
+            self.stdout.write(f"Swept {deleted.get('medlink.SlotHold', 0)} expired holds")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -1,8 +1,16 @@
-from django.db import models
+import mimetypes
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
 from django.core.validators import FileExtensionValidator
 from django.core.exceptions import ValidationError
+from django.core.files.images import get_image_dimensions
 from django.utils import timezone
 from accounts.models import User
+from .storage import ContentAddressedStorage, blob_digest, get_blob_storage
 
 
 def validate_future_date(value):
@@ -13,31 +21,128 @@ def validate_future_date(value):
 
 class MedicalFile(models.Model):
     ALLOWED_EXTENSIONS = ['pdf', 'doc', 'docx', 'jpg', 'jpeg', 'png', 'txt']
+    MAX_SIZE = 10 * 1024 * 1024
+    # Fields thumbnails are made from, first non-empty one wins
+    THUMBNAIL_FIELDS = ('file',)
     
     patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='medical_files')
     uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='uploaded_files')
     file = models.FileField(
         upload_to='medical_files/',
+        storage=get_blob_storage,
+        max_length=255,
         validators=[FileExtensionValidator(allowed_extensions=ALLOWED_EXTENSIONS)]
     )
     file_type = models.CharField(max_length=10, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True)
     is_private = models.BooleanField(default=True)
+    # Longest edge -> thumbnail name, filled in the background after upload
+    thumbnails = models.JSONField(default=dict, blank=True)
+    # Captured when the file is stored, so listings never stat storage
+    file_size = models.PositiveBigIntegerField(null=True, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True)
+    mime_type = models.CharField(max_length=100, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
 
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            # Keyset pages of a patient's files
+            models.Index(fields=['patient', '-uploaded_at', '-id'], name='file_patient_feed_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.file_type:
             self.file_type = self.file.name.split('.')[-1].lower()
-        super().save(*args, **kwargs)
+        # The file's reference is counted in the same transaction as the row
+        with transaction.atomic():
+            if self.file and self.metadata_stale():
+                self.capture_metadata()
+            super().save(*args, **kwargs)
+
+    def metadata_stale(self):
+        """Whether the stored metadata may not describe the file"""
+        if not self.file._committed or self.file_size is None:
+            return True
+        # Content-addressed names carry their digest, so a replaced file shows
+        digest = blob_digest(self.file.name)
+        return digest is not None and digest != self.sha256
+
+    def capture_metadata(self):
+        """Record size, digest, MIME type and image dimensions, storing the file if it is new"""
+        file = self.file
+        content = file if file._committed else file.file
+        self.file_size = content.size
+        self.mime_type = mimetypes.guess_type(file.name)[0] or 'application/octet-stream'
+        self.width, self.height = (None, None)
+        if self.mime_type.startswith('image/'):
+            # Reads only as far as the image header
+            self.width, self.height = get_image_dimensions(content)
+        if not file._committed:
+            # What pre_save would do, done first so the digest below comes from the stored name
+            file.save(file.name, content, save=False)
+        self.sha256 = blob_digest(file.name) or ContentAddressedStorage.digest(file)[0]
+        file.close()
 
     def __str__(self):
         return f"{self.patient.username} - {self.file.name}"
 
 
+class StoredBlob(models.Model):
+    """One stored copy of some file content and how many file fields reference it"""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    # Plain integer so a decrement racing a recount can't trip a check constraint
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]}... ({self.size} bytes, {self.refcount} refs)"
+
+
+class UploadSession(models.Model):
+    """A resumable MedicalFile upload; chunks are staged on disk until it is finalized"""
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('complete', 'Complete'),
+    ]
+
+    # Unguessable, since the id alone addresses the staged bytes
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveIntegerField(help_text='Total size in bytes')
+    received = models.PositiveIntegerField(default=0, help_text='Bytes staged so far')
+    sha256 = models.CharField(max_length=64, blank=True, help_text='Optional hex digest of the whole file')
+    description = models.TextField(blank=True)
+    is_private = models.BooleanField(default=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    medical_file = models.OneToOneField(
+        MedicalFile, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_session'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['expires_at'], name='upload_session_gc_idx'),
+        ]
+
+    def __str__(self):
+        return f"Upload of {self.filename} by {self.patient.username} ({self.received}/{self.size})"
+
+    @property
+    def staging_path(self):
+        return os.path.join(settings.MEDLINK_UPLOAD_STAGING_DIR, f'{self.id.hex}.part')
+
+
 class AppointmentRequest(models.Model):
+    URGENCY_PRIORITY = {'low': 0, 'medium': 1, 'high': 2, 'emergency': 3}
+
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('accepted', 'Accepted'),
@@ -69,11 +174,29 @@ class AppointmentRequest(models.Model):
         ],
         default='medium'
     )
+    priority = models.PositiveSmallIntegerField(
+        default=1,
+        editable=False,
+        help_text='Numeric urgency used for triage ordering, higher is more urgent'
+    )
     notes = models.TextField(blank=True)
 
     class Meta:
         ordering = ['-requested_at']
         unique_together = ['patient', 'doctor', 'preferred_date', 'preferred_time_slot']
+        indexes = [
+            models.Index(fields=['doctor', 'status', '-priority', 'requested_at', 'id'], name='request_triage_idx'),
+            # Keyset pages of the request lists
+            models.Index(fields=['doctor', '-requested_at', '-id'], name='request_doctor_feed_idx'),
+            models.Index(fields=['patient', '-requested_at', '-id'], name='request_patient_feed_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so signals act on transitions, not on every save
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
 
     def clean(self):
         if self.preferred_date < timezone.now().date():
@@ -81,7 +204,24 @@ class AppointmentRequest(models.Model):
 
     def save(self, *args, **kwargs):
         self.clean()
+        self.priority = self.URGENCY_PRIORITY.get(self.urgency_level, 1)
+        self._status_changed = self._state.adding or getattr(self, '_loaded_status', None) != self.status
         super().save(*args, **kwargs)
+        self._loaded_status = self.status
+
+    @classmethod
+    def sync_priorities(cls):
+        """Set priority from urgency_level on rows saved without it, one update per level"""
+        updated = 0
+        for urgency_level, priority in cls.URGENCY_PRIORITY.items():
+            updated += cls.objects.filter(urgency_level=urgency_level).exclude(priority=priority).update(
+                priority=priority
+            )
+            # Waitlist entries copy the priority of their request
+            WaitlistEntry.objects.filter(
+                appointment_request__urgency_level=urgency_level
+            ).exclude(priority=priority).update(priority=priority)
+        return updated
 
     def __str__(self):
         return f"Request from {self.patient.username} to Dr. {self.doctor.username} - {self.status}"
@@ -99,30 +239,246 @@ class Appointment(models.Model):
 
     class Meta:
         ordering = ['scheduled_time']
+        indexes = [
+            # Calendar range reads
+            models.Index(fields=['scheduled_time'], name='appointment_time_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the booked slot so saves that don't move it skip the ledger
+        instance._booked_slot = (instance.__dict__.get('scheduled_time'), instance.__dict__.get('duration'))
+        return instance
 
     def clean(self):
         if self.scheduled_time <= timezone.now():
             raise ValidationError('Appointment time must be in the future.')
-        
-        # Check for scheduling conflicts
-        conflicting_appointments = Appointment.objects.filter(
-            appointment_request__doctor=self.appointment_request.doctor,
-            scheduled_time__date=self.scheduled_time.date()
-        ).exclude(id=self.id)
-        
-        for appointment in conflicting_appointments:
-            if (self.scheduled_time < appointment.scheduled_time + timezone.timedelta(minutes=appointment.duration) and
-                self.scheduled_time + timezone.timedelta(minutes=self.duration) > appointment.scheduled_time):
-                raise ValidationError('This time slot conflicts with another appointment.')
 
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
+        slot = (self.scheduled_time, self.duration)
+        self._slot_changed = self._state.adding or getattr(self, '_booked_slot', None) != slot
+
+        # Conflicts are detected by the unique constraint on the slot ledger,
+        # so the appointment and its ledger rows are written together.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self._slot_changed:
+                SlotLedgerEntry.reserve(self)
+        self._booked_slot = slot
+
+    @classmethod
+    def book(cls, appointment_request, scheduled_time, duration, accepted_by):
+        """Accept a request into an appointment with its reminder, all or nothing
+
+        The slot ledger rejects conflicts atomically, so nothing is written
+        unless the whole slot could be booked.
+        """
+        with transaction.atomic():
+            appointment_request.status = 'accepted'
+            appointment_request.save()
+
+            appointment = cls.objects.create(
+                appointment_request=appointment_request,
+                scheduled_time=scheduled_time,
+                duration=duration,
+                accepted_by=accepted_by
+            )
+
+            # Create reminder for the appointment
+            reminder_time = scheduled_time - timedelta(hours=24)
+            if reminder_time > timezone.now():
+                AppointmentReminder.objects.create(
+                    appointment=appointment,
+                    reminder_time=reminder_time,
+                    reminder_type='email'
+                )
+        return appointment
 
     def __str__(self):
         return f"Appointment on {self.scheduled_time.strftime('%Y-%m-%d %H:%M')} with Dr. {self.appointment_request.doctor.username}"
 
 
+class SlotHold(models.Model):
+    """Short-lived lease on a doctor's slot while a patient completes booking"""
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='slot_holds')
+    patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='held_slots')
+    start = models.DateTimeField()
+    duration = models.PositiveIntegerField(default=30, help_text='Duration in minutes')
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['start']
+        indexes = [
+            models.Index(fields=['doctor', 'start', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"Hold on Dr. {self.doctor.username} at {self.start} for {self.patient.username}"
+
+    @property
+    def end(self):
+        return self.start + timedelta(minutes=self.duration)
+
+    @property
+    def is_active(self):
+        return self.expires_at > timezone.now()
+
+    @classmethod
+    def place(cls, doctor, patient, start, duration, ttl, limit=None):
+        """Hold a slot for `ttl` seconds, failing if any of its granules is taken
+
+        With a `limit`, also fails once the patient already has that many
+        active holds.
+        """
+        SlotLedgerEntry.check_grid(start, duration)
+        granules = list(SlotLedgerEntry.granules(start, duration))
+        with transaction.atomic():
+            if limit is not None:
+                # The patient's row serializes their concurrent holds, so the count can't be raced
+                User.objects.select_for_update().filter(id=patient.id).exists()
+                if cls.objects.filter(patient=patient, expires_at__gt=timezone.now()).count() >= limit:
+                    raise ValidationError(
+                        f'You can hold at most {limit} slots at a time.', code='hold_limit'
+                    )
+            SlotLedgerEntry.clear_stale(doctor.id, granules)
+            hold = cls.objects.create(
+                doctor=doctor,
+                patient=patient,
+                start=start,
+                duration=duration,
+                expires_at=timezone.now() + timedelta(seconds=ttl)
+            )
+            try:
+                with transaction.atomic():
+                    SlotLedgerEntry.objects.bulk_create([
+                        SlotLedgerEntry(doctor=doctor, slot_start=slot_start, hold=hold)
+                        for slot_start in granules
+                    ])
+            except IntegrityError:
+                raise ValidationError('This slot is no longer available.')
+        return hold
+
+
+class SlotLedgerEntry(models.Model):
+    """One booked or held granule of a doctor's calendar; the unique constraint prevents double-booking"""
+    GRANULE_MINUTES = 15
+
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='booked_slots')
+    slot_start = models.DateTimeField()
+    appointment = models.ForeignKey(
+        Appointment, on_delete=models.CASCADE, null=True, blank=True, related_name='ledger_entries'
+    )
+    hold = models.ForeignKey(
+        SlotHold, on_delete=models.CASCADE, null=True, blank=True, related_name='ledger_entries'
+    )
+
+    class Meta:
+        ordering = ['slot_start']
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'slot_start'], name='unique_doctor_slot_granule'),
+            models.CheckConstraint(
+                condition=models.Q(appointment__isnull=False) ^ models.Q(hold__isnull=False),
+                name='ledger_entry_has_one_owner'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Dr. {self.doctor.username} booked at {self.slot_start}"
+
+    @classmethod
+    def check_grid(cls, start, duration):
+        """Reject slots off the granule grid, whose granules would overlap their neighbours'"""
+        if start.minute % cls.GRANULE_MINUTES or start.second or start.microsecond or duration % cls.GRANULE_MINUTES:
+            raise ValidationError(
+                f'Appointments must start and last in steps of {cls.GRANULE_MINUTES} minutes.', code='off_grid'
+            )
+
+    @classmethod
+    def granules(cls, start, duration):
+        """Granule start times covering [start, start + duration)"""
+        step = timedelta(minutes=cls.GRANULE_MINUTES)
+        end = start + timedelta(minutes=duration)
+        # New slots are on the grid; older ones are aligned down so they still collide
+        current = start - timedelta(
+            minutes=start.minute % cls.GRANULE_MINUTES,
+            seconds=start.second,
+            microseconds=start.microsecond
+        )
+        while current < end:
+            yield current
+            current += step
+
+    @classmethod
+    def reserve(cls, appointment):
+        """Replace the ledger rows of an appointment, failing on any taken granule"""
+        cls.check_grid(appointment.scheduled_time, appointment.duration)
+        doctor_id = appointment.appointment_request.doctor_id
+        granules = list(cls.granules(appointment.scheduled_time, appointment.duration))
+        entries = [
+            cls(doctor_id=doctor_id, slot_start=slot_start, appointment=appointment)
+            for slot_start in granules
+        ]
+        try:
+            with transaction.atomic():
+                # The patient's own hold on this slot turns into the booking
+                cls.clear_stale(doctor_id, granules, patient_id=appointment.appointment_request.patient_id)
+                cls.objects.filter(appointment=appointment).delete()
+                cls.objects.bulk_create(entries)
+        except IntegrityError:
+            raise ValidationError('This time slot conflicts with another appointment.')
+
+    @classmethod
+    def clear_stale(cls, doctor_id, granules, patient_id=None):
+        """Drop expired holds, and optionally a patient's own holds, covering the granules"""
+        stale = models.Q(hold__expires_at__lte=timezone.now())
+        if patient_id is not None:
+            stale |= models.Q(hold__patient_id=patient_id)
+        SlotHold.objects.filter(id__in=cls.objects.filter(
+            stale,
+            doctor_id=doctor_id,
+            slot_start__in=granules,
+            hold__isnull=False
+        ).values('hold')).delete()
+
+    @classmethod
+    def release(cls, appointment_request):
+        """Free the granules held by the appointment of a request"""
+        cls.objects.filter(appointment__appointment_request=appointment_request).delete()
+
+    @classmethod
+    def rebuild(cls, since):
+        """Rewrite the booked granules of appointments starting from `since`
+
+        Bookings win over holds on the same granules. Returns the
+        appointments that overlap one already written, which keep no
+        ledger rows until someone moves them.
+        """
+        conflicts = []
+        appointments = Appointment.objects.filter(scheduled_time__gte=since).exclude(
+            appointment_request__status='cancelled'
+        ).select_related('appointment_request').order_by('scheduled_time', 'id')
+        with transaction.atomic():
+            cls.objects.filter(appointment__scheduled_time__gte=since).delete()
+            for appointment in appointments.iterator():
+                doctor_id = appointment.appointment_request.doctor_id
+                granules = list(cls.granules(appointment.scheduled_time, appointment.duration))
+                SlotHold.objects.filter(id__in=cls.objects.filter(
+                    doctor_id=doctor_id, slot_start__in=granules, hold__isnull=False
+                ).values('hold')).delete()
+                try:
+                    with transaction.atomic():
+                        cls.objects.bulk_create([
+                            cls(doctor_id=doctor_id, slot_start=slot_start, appointment=appointment)
+                            for slot_start in granules
+                        ])
+                except IntegrityError:
+                    conflicts.append(appointment)
+        return conflicts
+
+
 class AppointmentReminder(models.Model):
     appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='reminders')
     reminder_time = models.DateTimeField()
@@ -135,9 +491,80 @@ class AppointmentReminder(models.Model):
             ('push', 'Push Notification'),
         ]
     )
+    sent_at = models.DateTimeField(blank=True, null=True)
+    # Lease taken by a dispatch worker so parallel workers never send twice
+    claimed_by = models.CharField(max_length=128, blank=True)
+    claimed_until = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         ordering = ['reminder_time']
+        indexes = [
+            models.Index(fields=['is_sent', 'reminder_time']),
+        ]
 
     def __str__(self):
         return f"Reminder for {self.appointment} at {self.reminder_time}"
+
+
+class DoctorDaySchedule(models.Model):
+    """Per-doctor, per-day index of booked time used to answer availability queries"""
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='day_schedules')
+    date = models.DateField()
+    busy_intervals = models.JSONField(
+        default=list,
+        help_text='Sorted, merged [start, end] minute offsets from local midnight'
+    )
+    free_minutes = models.PositiveIntegerField(
+        default=0,
+        help_text='Unbooked minutes left within working hours'
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date']
+        unique_together = ['doctor', 'date']
+        indexes = [
+            models.Index(fields=['date', 'free_minutes']),
+        ]
+
+    def __str__(self):
+        return f"Schedule of Dr. {self.doctor.username} on {self.date}"
+
+
+class WaitlistEntry(models.Model):
+    """A pending request waiting to be offered a slot freed by a cancellation"""
+    STATUS_CHOICES = [
+        ('waiting', 'Waiting'),
+        ('offered', 'Offered'),
+        ('booked', 'Booked'),
+        ('withdrawn', 'Withdrawn'),
+    ]
+
+    appointment_request = models.OneToOneField(
+        AppointmentRequest, on_delete=models.CASCADE, related_name='waitlist_entry'
+    )
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='waitlist_entries')
+    preferred_date = models.DateField()
+    preferred_time_slot = models.CharField(max_length=20)
+    priority = models.PositiveSmallIntegerField(default=1)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting')
+    offered_hold = models.ForeignKey(
+        SlotHold, on_delete=models.SET_NULL, null=True, blank=True, related_name='waitlist_offers'
+    )
+    offered_at = models.DateTimeField(blank=True, null=True)
+    # The offered slot, kept after its hold is gone so a lapsed offer can pass to the next entry
+    offered_start = models.DateTimeField(blank=True, null=True)
+    offered_duration = models.PositiveIntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-priority', 'created_at']
+        indexes = [
+            models.Index(
+                fields=['doctor', 'preferred_date', 'preferred_time_slot', 'status', '-priority', 'created_at'],
+                name='waitlist_match_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Waitlist: {self.appointment_request} ({self.status})"
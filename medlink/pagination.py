@@ -0,0 +1,201 @@
+# server/medical/pagination.py
+
+import json
+from base64 import b64decode, b64encode
+from datetime import date, time
+from functools import reduce
+from operator import attrgetter, or_
+
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset, limit=10000):
+    """Cheap row count for a queryset
+
+    PostgreSQL reports the planner's row estimate without touching the
+    rows. Elsewhere the count is exact but stops at `limit`, so the value
+    is a lower bound for larger results.
+    """
+    queryset = queryset.order_by()
+    if connection.vendor == 'postgresql':
+        plan = json.loads(queryset.explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    return queryset[:limit].count()
+
+
+class CursorEncoder(json.JSONEncoder):
+    """JSON encoder that keeps full precision of temporal and decimal values"""
+
+    def default(self, o):
+        if isinstance(o, (date, time)):
+            # Unlike DjangoJSONEncoder, keep microseconds so seeks are exact
+            return o.isoformat()
+        return str(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the values of the last row seen.
+
+    The ordering must be stable and end with a unique, non-null field such
+    as `id`, so every page is a single indexed range scan no matter how deep
+    the client has paged. Views can override the ordering with a
+    `cursor_ordering` attribute. With `estimate_count` set, the first page
+    also carries an estimated total in the X-Estimated-Count header.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-id',)
+    invalid_cursor_message = 'Invalid cursor'
+    estimate_count = False
+    count_header = 'X-Estimated-Count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = tuple(getattr(view, 'cursor_ordering', None) or self.ordering)
+        self.page_size = self.get_page_size(request)
+
+        position, reverse = self.decode_cursor(request)
+        self.count = estimate_count(queryset) if self.estimate_count and position is None else None
+        ordering = self._reversed(self.ordering) if reverse else self.ordering
+        if position is not None:
+            queryset = queryset.filter(self._seek(ordering, position))
+
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = position is not None if not reverse else has_more
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_paginated_response(self, data):
+        headers = {self.count_header: str(self.count)} if self.count is not None else None
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }, headers=headers)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[0]), reverse=True)
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, cls=CursorEncoder)
+        token = b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(b64decode(token.encode('ascii')).decode('utf-8'))
+            position, reverse = payload['p'], bool(payload['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def _position(self, row):
+        if isinstance(row, dict):
+            # values() rows are keyed by the ordering lookups themselves
+            return [row[field.lstrip('-')] for field in self.ordering]
+        return [attrgetter(field.lstrip('-').replace('__', '.'))(row) for field in self.ordering]
+
+    @staticmethod
+    def _reversed(ordering):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+    @staticmethod
+    def _seek(ordering, position):
+        """Rows strictly after `position` in `ordering`, as (a > x) or (a = x and b > y) ..."""
+        clauses = []
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {
+                previous.lstrip('-'): value
+                for previous, value in zip(ordering[:index], position[:index])
+            }
+            clauses.append(Q(**equal, **{f'{name}__{lookup}': position[index]}))
+        return reduce(or_, clauses)
+
+
+class SelectablePagination(PageNumberPagination):
+    """Page-number pagination that switches to keyset pages on request
+
+    Views that declare a `cursor_ordering` (ending in a unique field such as
+    `id`) accept `?pagination=cursor`; the next/previous links keep the
+    mode. Keyset pages follow the view's fixed ordering, so `?ordering=` is
+    rejected with them, and report an estimated count instead of an exact
+    one, so page 5000 costs the same as page 1.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    mode_query_param = 'pagination'
+
+    def cursor_paginator(self):
+        paginator = KeysetPagination()
+        paginator.page_size = self.page_size
+        paginator.page_size_query_param = self.page_size_query_param
+        paginator.max_page_size = self.max_page_size
+        paginator.estimate_count = True
+        return paginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        wants_cursor = (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+        if wants_cursor and getattr(view, 'cursor_ordering', None):
+            if request.query_params.get(api_settings.ORDERING_PARAM):
+                raise ValidationError({"error": "ordering cannot be combined with cursor pagination"})
+            self.keyset = self.cursor_paginator()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -3,6 +3,8 @@
 from rest_framework import permissions
 from django.contrib.auth import get_user_model
 
+from .models import AppointmentRequest, MedicalFile
+
 User = get_user_model()
 
 
@@ -43,6 +45,36 @@ class IsOwnerOrDoctor(permissions.BasePermission):
         return False
 
 
+def medical_files_for(user):
+    """The medical files a user may see"""
+    if user.role == 'doctor':
+        # Doctors can see the shared files of patients with a live request to them
+        return MedicalFile.objects.filter(
+            is_private=False,
+            patient__in=AppointmentRequest.objects.filter(doctor=user).exclude(
+                status__in=['rejected', 'cancelled']
+            ).values('patient')
+        )
+    elif user.role == 'patient':
+        # Patients can only see their own files
+        return MedicalFile.objects.filter(patient=user)
+    elif user.role == 'admin':
+        # Admins can see all files
+        return MedicalFile.objects.all()
+    return MedicalFile.objects.none()
+
+
+class CanAccessMedicalFile(permissions.BasePermission):
+    """
+    Read access to any file in the user's scope (medical_files_for);
+    only the file's patient or an admin may change or delete it.
+    """
+    def has_object_permission(self, request, view, obj):
+        if request.method not in permissions.SAFE_METHODS:
+            return request.user.role == 'admin' or obj.patient_id == request.user.id
+        return medical_files_for(request.user).filter(id=obj.id).exists()
+
+
 class IsPatientOrDoctor(permissions.BasePermission):
     """
     Custom permission to allow patients or doctors to access objects.
@@ -67,6 +99,14 @@ class IsPatientOnly(permissions.BasePermission):
         return request.user.is_authenticated and request.user.role == 'patient'
 
 
+class IsFrontDesk(permissions.BasePermission):
+    """
+    Custom permission to only allow receptionists and admins to access objects.
+    """
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.role in ['receptionist', 'admin']
+
+
 class IsOwnerOrAdmin(permissions.BasePermission):
     """
     Custom permission to allow owners or admins to access objects.
@@ -0,0 +1,113 @@
+# server/medical/reminders.py
+
+import json
+import logging
+import sys
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKENDS = {
+    'email': 'medlink.reminders.EmailReminderBackend',
+    'sms': 'medlink.reminders.ConsoleReminderBackend',
+    'push': 'medlink.reminders.ConsoleReminderBackend',
+}
+
+
+def reminder_message(reminder):
+    """Subject and body shared by every delivery channel"""
+    appointment = reminder.appointment
+    doctor = appointment.appointment_request.doctor
+    when = appointment.scheduled_time.strftime('%Y-%m-%d %H:%M')
+    subject = 'Appointment reminder'
+    body = f"You have an appointment with Dr. {doctor.get_full_name() or doctor.username} on {when}."
+    return subject, body
+
+
+class BaseReminderBackend:
+    """Deliver reminders over one channel; subclasses implement send()"""
+
+    def send(self, reminder):
+        raise NotImplementedError('Reminder backends must implement send()')
+
+    def send_many(self, reminders):
+        """Send a batch and return the ids that were delivered"""
+        delivered = []
+        for reminder in reminders:
+            try:
+                self.send(reminder)
+            except Exception:
+                logger.exception('Failed to send reminder %s', reminder.id)
+            else:
+                delivered.append(reminder.id)
+        return delivered
+
+
+class ConsoleReminderBackend(BaseReminderBackend):
+    """Write reminders to stdout, for development and tests"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def send(self, reminder):
+        subject, body = reminder_message(reminder)
+        patient = reminder.appointment.appointment_request.patient
+        self.stream.write(f"[{reminder.reminder_type}] to {patient.username}: {subject} - {body}\n")
+        self.stream.flush()
+
+
+class FileReminderBackend(BaseReminderBackend):
+    """Append reminders as JSON lines to MEDLINK_REMINDER_FILE_PATH"""
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'MEDLINK_REMINDER_FILE_PATH', settings.BASE_DIR / 'sent_reminders.jsonl')
+
+    def send(self, reminder):
+        self.send_many([reminder])
+
+    def send_many(self, reminders):
+        with open(self.path, 'a', encoding='utf-8') as handle:
+            for reminder in reminders:
+                subject, body = reminder_message(reminder)
+                handle.write(json.dumps({
+                    'id': reminder.id,
+                    'type': reminder.reminder_type,
+                    'patient': reminder.appointment.appointment_request.patient_id,
+                    'subject': subject,
+                    'body': body,
+                }) + '\n')
+        return [reminder.id for reminder in reminders]
+
+
+class EmailReminderBackend(BaseReminderBackend):
+    """Send reminders through Django's configured email backend over one connection"""
+
+    def send(self, reminder, connection=None):
+        patient = reminder.appointment.appointment_request.patient
+        if not patient.email:
+            # Nothing can ever be delivered, so count it as done rather than retry it
+            logger.warning('Reminder %s skipped: patient has no email', reminder.id)
+            return
+        subject, body = reminder_message(reminder)
+        EmailMessage(subject, body, to=[patient.email], connection=connection).send()
+
+    def send_many(self, reminders):
+        delivered = []
+        with get_connection() as connection:
+            for reminder in reminders:
+                try:
+                    self.send(reminder, connection=connection)
+                except Exception:
+                    logger.exception('Failed to email reminder %s', reminder.id)
+                else:
+                    delivered.append(reminder.id)
+        return delivered
+
+
+def get_backend(reminder_type):
+    """Instantiate the backend configured for a reminder type"""
+    backends = {**DEFAULT_BACKENDS, **getattr(settings, 'MEDLINK_REMINDER_BACKENDS', {})}
+    return import_string(backends[reminder_type])()
@@ -1,36 +1,93 @@
 # server/medical/serializers.py
 
+import os
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.urls import reverse
 from rest_framework import serializers
-from .models import MedicalFile, AppointmentRequest, Appointment, AppointmentReminder
-from accounts.serializer import UserSerializer, DoctorProfileSerializer
+from .models import (
+    MedicalFile, UploadSession, AppointmentRequest, Appointment, AppointmentReminder, SlotHold, SlotLedgerEntry,
+    WaitlistEntry
+)
+from accounts.serializer import UserSerializer, DoctorProfileSerializer, DynamicFieldsMixin, is_expanded
+from .thumbnails import edges_of
 
 
-class MedicalFileSerializer(serializers.ModelSerializer):
+class MedicalFileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.username', read_only=True)
     uploaded_by_name = serializers.CharField(source='uploaded_by.username', read_only=True)
-    file_size = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
     
     class Meta:
         model = MedicalFile
         fields = [
             'id', 'patient', 'patient_name', 'uploaded_by', 'uploaded_by_name',
-            'file', 'file_type', 'uploaded_at', 'description', 'is_private', 'file_size'
+            'file', 'download_url', 'thumbnails', 'file_type', 'uploaded_at', 'description', 'is_private',
+            'file_size', 'sha256', 'mime_type', 'width', 'height'
         ]
-        read_only_fields = ['uploaded_by', 'uploaded_at', 'file_type', 'file_size']
-    
-    def get_file_size(self, obj):
-        if obj.file:
-            return obj.file.size
-        return None
+        read_only_fields = [
+            'uploaded_by', 'uploaded_at', 'file_type', 'file_size', 'sha256', 'mime_type', 'width', 'height'
+        ]
+
+    def get_download_url(self, obj):
+        # The protected endpoint; `file` is only served by DEBUG media serving
+        if not obj.pk:
+            return None
+        url = reverse('medical-file-download', kwargs={'id': obj.pk})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def get_thumbnails(self, obj):
+        # Longest edge -> URL, empty until the background job has run
+        request = self.context.get('request')
+        urls = {}
+        for edge in edges_of(obj.thumbnails):
+            url = reverse('medical-file-thumbnail', kwargs={'id': obj.pk, 'edge': edge})
+            urls[edge] = request.build_absolute_uri(url) if request is not None else url
+        return urls
     
     def validate_file(self, value):
         # Check file size (max 10MB)
-        if value.size > 10 * 1024 * 1024:
+        if value.size > MedicalFile.MAX_SIZE:
             raise serializers.ValidationError("File size cannot exceed 10MB.")
         return value
 
 
-class AppointmentRequestSerializer(serializers.ModelSerializer):
+class UploadSessionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='received', read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'size', 'offset', 'sha256', 'description', 'is_private',
+            'status', 'medical_file', 'created_at', 'expires_at'
+        ]
+        read_only_fields = ['status', 'medical_file', 'created_at', 'expires_at']
+
+    def validate_filename(self, value):
+        value = os.path.basename(value.replace('\\', '/'))
+        extension = os.path.splitext(value)[1][1:].lower()
+        if extension not in MedicalFile.ALLOWED_EXTENSIONS:
+            raise serializers.ValidationError(
+                f"Allowed file types: {', '.join(MedicalFile.ALLOWED_EXTENSIONS)}."
+            )
+        return value
+
+    def validate_size(self, value):
+        # Rejected before a single byte is sent
+        if not 0 < value <= MedicalFile.MAX_SIZE:
+            raise serializers.ValidationError("File size must be between 1 byte and 10MB.")
+        return value
+
+    def validate_sha256(self, value):
+        value = value.lower()
+        if value and (len(value) != 64 or any(char not in '0123456789abcdef' for char in value)):
+            raise serializers.ValidationError("sha256 must be a hex digest.")
+        return value
+
+
+class AppointmentRequestSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.username', read_only=True)
     doctor_name = serializers.CharField(source='doctor.username', read_only=True)
     doctor_profile = DoctorProfileSerializer(source='doctor.doctor_profile', read_only=True)
@@ -45,7 +102,21 @@ class AppointmentRequestSerializer(serializers.ModelSerializer):
             'reason', 'urgency_level', 'urgency_display', 'notes'
         ]
         read_only_fields = ['status', 'requested_at', 'patient']
+        expandable_fields = {'doctor_profile': None}
     
+    @staticmethod
+    def setup_eager_loading(queryset, request=None, path='', prefix=''):
+        """Joins and prefetches for the fields this serializer will render"""
+        queryset = queryset.select_related(f'{prefix}patient', f'{prefix}doctor')
+        if is_expanded(request, f'{path}doctor_profile'):
+            queryset = DoctorProfileSerializer.setup_eager_loading(
+                queryset.select_related(f'{prefix}doctor__doctor_profile'),
+                request,
+                path=f'{path}doctor_profile.',
+                prefix=f'{prefix}doctor__doctor_profile__'
+            )
+        return queryset
+
     def validate_preferred_date(self, value):
         from django.utils import timezone
         if value < timezone.now().date():
@@ -71,7 +142,7 @@ class AppointmentRequestSerializer(serializers.ModelSerializer):
         return data
 
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class AppointmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     appointment_request = AppointmentRequestSerializer(read_only=True)
     patient_name = serializers.CharField(source='appointment_request.patient.username', read_only=True)
     doctor_name = serializers.CharField(source='appointment_request.doctor.username', read_only=True)
@@ -88,7 +159,25 @@ class AppointmentSerializer(serializers.ModelSerializer):
             'notes', 'is_confirmed'
         ]
         read_only_fields = ['created_at', 'updated_at', 'accepted_by']
+        expandable_fields = {'appointment_request': 'appointment_request_id'}
     
+    @staticmethod
+    def setup_eager_loading(queryset, request=None, path='', prefix=''):
+        """Joins and prefetches for the fields this serializer will render"""
+        queryset = queryset.select_related(
+            f'{prefix}appointment_request__patient',
+            f'{prefix}appointment_request__doctor',
+            f'{prefix}accepted_by'
+        )
+        if is_expanded(request, f'{path}appointment_request'):
+            queryset = AppointmentRequestSerializer.setup_eager_loading(
+                queryset,
+                request,
+                path=f'{path}appointment_request.',
+                prefix=f'{prefix}appointment_request__'
+            )
+        return queryset
+
     def get_scheduled_time_formatted(self, obj):
         return obj.scheduled_time.strftime('%Y-%m-%d %H:%M')
     
@@ -102,7 +191,7 @@ class AppointmentSerializer(serializers.ModelSerializer):
         return value
 
 
-class AppointmentReminderSerializer(serializers.ModelSerializer):
+class AppointmentReminderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     appointment = AppointmentSerializer(read_only=True)
     reminder_time_formatted = serializers.SerializerMethodField()
     
@@ -113,11 +202,70 @@ class AppointmentReminderSerializer(serializers.ModelSerializer):
             'is_sent', 'reminder_type'
         ]
         read_only_fields = ['is_sent']
+        expandable_fields = {'appointment': 'appointment_id'}
     
+    @staticmethod
+    def setup_eager_loading(queryset, request=None):
+        """Joins and prefetches for the fields this serializer will render"""
+        if is_expanded(request, 'appointment'):
+            queryset = AppointmentSerializer.setup_eager_loading(
+                queryset, request, path='appointment.', prefix='appointment__'
+            )
+        return queryset
+
     def get_reminder_time_formatted(self, obj):
         return obj.reminder_time.strftime('%Y-%m-%d %H:%M')
 
 
+class SlotHoldSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    end = serializers.DateTimeField(read_only=True)
+
+    class Meta:
+        model = SlotHold
+        fields = ['id', 'doctor', 'patient', 'start', 'end', 'duration', 'expires_at', 'created_at']
+        read_only_fields = ['patient', 'expires_at', 'created_at']
+
+    def validate_duration(self, value):
+        if not 5 <= value <= 240:
+            raise serializers.ValidationError("Duration must be between 5 and 240 minutes.")
+        return value
+
+    def validate(self, data):
+        from django.utils import timezone
+        doctor = data['doctor']
+        if doctor.role != 'doctor' or not hasattr(doctor, 'doctor_profile'):
+            raise serializers.ValidationError("Slots can only be held with doctors.")
+
+        start = timezone.localtime(data['start'])
+        if start <= timezone.now():
+            raise serializers.ValidationError("Held slot must be in the future.")
+
+        try:
+            SlotLedgerEntry.check_grid(start, data.get('duration', 30))
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages[0])
+
+        profile = doctor.doctor_profile
+        end = start + timezone.timedelta(minutes=data.get('duration', 30))
+        if (not profile.is_working_day(start.date()) or end.date() != start.date()
+                or not profile.is_working_hour(start.time()) or not profile.is_working_hour(end.time())):
+            raise serializers.ValidationError("Held slot must be within the doctor's working hours.")
+        return data
+
+
+class WaitlistEntrySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    offer_expires_at = serializers.DateTimeField(source='offered_hold.expires_at', read_only=True, allow_null=True)
+
+    class Meta:
+        model = WaitlistEntry
+        fields = [
+            'id', 'appointment_request', 'doctor', 'preferred_date', 'preferred_time_slot',
+            'priority', 'status', 'offered_start', 'offered_duration', 'offer_expires_at',
+            'offered_at', 'created_at'
+        ]
+        read_only_fields = fields
+
+
 class AppointmentScheduleSerializer(serializers.Serializer):
     """Serializer for scheduling appointments"""
     doctor_id = serializers.IntegerField()
@@ -148,6 +296,27 @@ class AppointmentRescheduleSerializer(serializers.Serializer):
     reason = serializers.CharField(max_length=200, required=False, allow_blank=True)
 
 
+class BulkTriageItemSerializer(serializers.Serializer):
+    """Serializer for one entry of a bulk triage batch"""
+    request_id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=['accept', 'reject'])
+    scheduled_time = serializers.DateTimeField(required=False)
+    duration = serializers.IntegerField(min_value=5, max_value=480, default=30)
+
+    def validate(self, data):
+        from django.utils import timezone
+        if data['action'] == 'accept':
+            if not data.get('scheduled_time'):
+                raise serializers.ValidationError("scheduled_time is required to accept a request.")
+            if data['scheduled_time'] <= timezone.now():
+                raise serializers.ValidationError("Scheduled time must be in the future.")
+            try:
+                SlotLedgerEntry.check_grid(data['scheduled_time'], data['duration'])
+            except DjangoValidationError as e:
+                raise serializers.ValidationError(e.messages[0])
+        return data
+
+
 class MedicalFileUploadSerializer(serializers.Serializer):
     """Serializer for file uploads"""
     file = serializers.FileField()
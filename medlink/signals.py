@@ -0,0 +1,126 @@
+# server/medical/signals.py
+
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from accounts.models import User, DoctorProfile, Review, Specialization, DoctorSpecialization
+from chat.models import Message
+from .models import MedicalFile, Appointment, AppointmentRequest, SlotLedgerEntry, WaitlistEntry
+from .availability import appointment_interval, rebuild_day, refresh_remaining_minutes
+from .waitlist import offer_freed_slot
+from .storage import ReferenceTracker
+from . import directory_cache, thumbnails
+
+
+@receiver(post_save, sender=Appointment)
+def update_day_schedule(sender, instance, **kwargs):
+    if not getattr(instance, '_slot_changed', True):
+        return
+    doctor_id = instance.appointment_request.doctor_id
+    day, _, _ = appointment_interval(instance.scheduled_time, instance.duration)
+    rebuild_day(doctor_id, day)
+
+    # The slot loaded from the database, so a reschedule also frees the day it left
+    previous, previous_duration = getattr(instance, '_booked_slot', (None, None))
+    if previous:
+        previous_day, _, _ = appointment_interval(previous, previous_duration)
+        if previous_day != day:
+            rebuild_day(doctor_id, previous_day)
+
+
+@receiver(post_delete, sender=Appointment)
+def release_day_schedule(sender, instance, **kwargs):
+    day, _, _ = appointment_interval(instance.scheduled_time, instance.duration)
+    rebuild_day(instance.appointment_request.doctor_id, day)
+
+
+@receiver(post_save, sender=AppointmentRequest)
+def release_cancelled_request(sender, instance, **kwargs):
+    # Only on the transition, so later saves of a cancelled request don't offer the slot again
+    if instance.status != 'cancelled' or not getattr(instance, '_status_changed', True):
+        return
+    SlotLedgerEntry.release(instance)
+    scheduled = Appointment.objects.filter(
+        appointment_request=instance
+    ).values_list('scheduled_time', 'duration').first()
+    if scheduled:
+        day, _, _ = appointment_interval(*scheduled)
+        rebuild_day(instance.doctor_id, day)
+        # Backfill the freed slot from the waitlist once the cancellation is committed
+        doctor_id = instance.doctor_id
+        transaction.on_commit(lambda: offer_freed_slot(doctor_id, *scheduled))
+
+
+@receiver(post_save, sender=AppointmentRequest)
+def close_waitlist_entry(sender, instance, **kwargs):
+    if instance.status == 'pending':
+        return
+    WaitlistEntry.objects.filter(
+        appointment_request=instance,
+        status__in=['waiting', 'offered']
+    ).update(status='booked' if instance.status == 'accepted' else 'withdrawn')
+
+
+@receiver(post_save, sender=DoctorProfile)
+def refresh_doctor_capacity(sender, instance, created, **kwargs):
+    if not created:
+        refresh_remaining_minutes(instance)
+
+
+def _bump_directory(doctor_ids):
+    # After commit, so a reader can't cache rows from before the write under
+    # the new version; ids are read now, while the rows still exist
+    transaction.on_commit(partial(directory_cache.bump, list(doctor_ids)))
+
+
+@receiver(post_save, sender=DoctorProfile)
+@receiver(post_delete, sender=DoctorProfile)
+def invalidate_doctor_directory(sender, instance, **kwargs):
+    _bump_directory([instance.id])
+
+
+@receiver(post_save, sender=User)
+def invalidate_doctor_user(sender, instance, created, **kwargs):
+    if not created and instance.role == 'doctor':
+        _bump_directory(DoctorProfile.objects.filter(user=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_reviewed_doctor(sender, instance, **kwargs):
+    _bump_directory([instance.doctor_id])
+
+
+def _specialization_doctors(specialization_id):
+    return DoctorSpecialization.objects.filter(
+        specialization_id=specialization_id
+    ).values_list('doctor_id', flat=True)
+
+
+# Every doctor listing a specialization shows its doctor count, so a change
+# to one doctor's specializations touches all the doctors that share them
+@receiver(post_save, sender=DoctorSpecialization)
+@receiver(post_delete, sender=DoctorSpecialization)
+def invalidate_specialization_doctors(sender, instance, **kwargs):
+    _bump_directory({instance.doctor_id, *_specialization_doctors(instance.specialization_id)})
+
+
+@receiver(post_save, sender=Specialization)
+@receiver(post_delete, sender=Specialization)
+def invalidate_specialization(sender, instance, **kwargs):
+    _bump_directory(_specialization_doctors(instance.id))
+
+
+# Content-addressed files are shared, so rows release their references
+# instead of deleting the bytes
+ReferenceTracker(MedicalFile, 'file')
+ReferenceTracker(Message, 'file', 'image')
+
+
+@receiver(post_save, sender=MedicalFile)
+@receiver(post_save, sender=Message)
+def queue_thumbnails(sender, instance, **kwargs):
+    thumbnails.refresh(instance)
@@ -0,0 +1,182 @@
+# server/medical/storage.py
+
+import glob
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils._os import safe_join
+
+BLOB_DIR = 'blobs'
+THUMBNAIL_DIR = 'thumbnails'
+# Names handed out by the storage: <upload_to>/<sha256>/<original file name>
+BLOB_NAME_RE = re.compile(r'^(?:[^/]+/)*(?P<digest>[0-9a-f]{64})/[^/]+$')
+
+
+def blob_digest(name):
+    """The content digest of a content-addressed name, or None for other names"""
+    match = BLOB_NAME_RE.match(name or '')
+    return match.group('digest') if match else None
+
+
+def thumbnail_name(digest, edge):
+    # Flat <digest>-<edge> names, which BLOB_NAME_RE does not take for blobs
+    return f'{THUMBNAIL_DIR}/{digest[:2]}/{digest}-{edge}.jpg'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage that keeps one copy of each distinct content
+
+    Content is hashed while it is saved; a digest that is already stored
+    only gains a reference and is never written again. Names keep the
+    upload directory and the original file name for display, while the
+    bytes live under blobs/<2 hex>/<sha256>. StoredBlob rows count the
+    references, and the last release removes the bytes. Names that are
+    not content-addressed (files saved before this storage) are served
+    from their own paths as before.
+    """
+    max_name_length = 255
+
+    def physical_name(self, name):
+        digest = blob_digest(name)
+        return f'{BLOB_DIR}/{digest[:2]}/{digest}' if digest else name
+
+    def path(self, name):
+        return super().path(self.physical_name(name))
+
+    def url(self, name):
+        return super().url(self.physical_name(name))
+
+    def get_available_name(self, name, max_length=None):
+        # Equal names mean equal content, so there is nothing to avoid
+        return name
+
+    @staticmethod
+    def digest(content):
+        checksum, size = hashlib.sha256(), 0
+        if hasattr(content, 'temporary_file_path'):
+            with open(content.temporary_file_path(), 'rb') as source:
+                for block in iter(lambda: source.read(64 * 1024), b''):
+                    checksum.update(block)
+                    size += len(block)
+        else:
+            for block in content.chunks():
+                checksum.update(block)
+                size += len(block)
+        return checksum.hexdigest(), size
+
+    def blob_name(self, name, digest):
+        directory, filename = posixpath.split(name)
+        prefix = f'{directory}/{digest}/' if directory else f'{digest}/'
+        stem, extension = posixpath.splitext(filename)
+        room = self.max_name_length - len(prefix) - len(extension)
+        return f'{prefix}{stem[:max(room, 1)]}{extension}'
+
+    def _save(self, name, content):
+        StoredBlob = apps.get_model('medlink', 'StoredBlob')
+        digest, size = self.digest(content)
+        name = self.blob_name(name, digest)
+        # A savepoint in the caller's transaction: models save their rows in
+        # the same one, so a row that fails to save drops the reference too
+        with transaction.atomic():
+            # The row lock orders this against a release collecting the same blob
+            StoredBlob.objects.select_for_update().get_or_create(sha256=digest, defaults={'size': size})
+            if not os.path.exists(self.path(name)):
+                self._write(self.path(name), content)
+            StoredBlob.objects.filter(sha256=digest).update(refcount=F('refcount') + 1)
+        return name
+
+    def _write(self, full_path, content):
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if hasattr(content, 'temporary_file_path'):
+            file_move_safe(content.temporary_file_path(), full_path, allow_overwrite=True)
+        else:
+            # Written beside the blob and renamed, so readers never see a partial file
+            with tempfile.NamedTemporaryFile(dir=directory, delete=False) as partial:
+                for block in content.chunks():
+                    partial.write(block)
+            os.replace(partial.name, full_path)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+    def delete(self, name):
+        """Drop one reference; the bytes go once the last one is released and committed"""
+        digest = blob_digest(name)
+        if digest is None:
+            return super().delete(name)
+        StoredBlob = apps.get_model('medlink', 'StoredBlob')
+        StoredBlob.objects.filter(sha256=digest).update(refcount=F('refcount') - 1)
+        transaction.on_commit(lambda: self.collect(digest))
+
+    def collect(self, digest):
+        """Remove a blob nothing references any more"""
+        StoredBlob = apps.get_model('medlink', 'StoredBlob')
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(sha256=digest, refcount__lte=0).first()
+            if blob is None:
+                return False
+            path = safe_join(self.location, BLOB_DIR, digest[:2], digest)
+            if os.path.exists(path):
+                os.remove(path)
+            # Thumbnails derive from the content and go with it
+            for path in glob.glob(safe_join(self.location, THUMBNAIL_DIR, digest[:2], f'{digest}-*.jpg')):
+                os.remove(path)
+            blob.delete()
+        return True
+
+
+def get_blob_storage():
+    return ContentAddressedStorage(location=settings.MEDIA_ROOT, base_url=settings.MEDIA_URL)
+
+
+class ReferenceTracker:
+    """Release stored files when the rows holding them change or go away
+
+    Only content-addressed names carry references; older names are left
+    alone, as they always were.
+    """
+
+    def __init__(self, model, *fields):
+        self.model = model
+        self.fields = fields
+        post_init.connect(self.remember, sender=model, weak=False)
+        post_save.connect(self.saved, sender=model, weak=False)
+        post_delete.connect(self.deleted, sender=model, weak=False)
+
+    def names(self, instance):
+        # __dict__ rather than the attribute, so deferred fields are not loaded
+        names = {}
+        for field in self.fields:
+            value = instance.__dict__.get(field)
+            names[field] = getattr(value, 'name', value) or None
+        return names
+
+    def release(self, field, name):
+        if blob_digest(name):
+            self.model._meta.get_field(field).storage.delete(name)
+
+    def remember(self, sender, instance, **kwargs):
+        instance._stored_names = self.names(instance)
+
+    def saved(self, sender, instance, **kwargs):
+        previous = getattr(instance, '_stored_names', {})
+        current = self.names(instance)
+        for field, name in previous.items():
+            if name and current[field] != name:
+                self.release(field, name)
+        instance._stored_names = current
+
+    def deleted(self, sender, instance, **kwargs):
+        for field, name in self.names(instance).items():
+            if name:
+                self.release(field, name)
@@ -1,3 +1,917 @@
-from django.test import TestCase
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from django.core.exceptions import ValidationError
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from accounts import catalog
+from accounts.models import User, DoctorProfile, Specialization, DoctorSpecialization
+from accounts.serializer import DoctorProfileSerializer
+from medlink.directory_cache import get_cache
+from medlink.downloads import sign
+from medlink.fast_serializers import AppointmentReader, AppointmentRequestReader, DoctorProfileReader, render
+from medlink.availability import appointment_interval
+from medlink.models import (
+    Appointment, AppointmentReminder, AppointmentRequest, DoctorDaySchedule, MedicalFile, SlotHold, SlotLedgerEntry,
+    StoredBlob, UploadSession, WaitlistEntry
+)
+from medlink.serializers import AppointmentRequestSerializer, AppointmentSerializer
+from medlink.storage import ContentAddressedStorage
+from medlink.thumbnails import FAILED
+from medlink.waitlist import expire_offers, offer_freed_slot
+
+
+class DoctorListQueryCountTests(TestCase):
+    """The doctor list and detail must not issue queries per row"""
+
+    # count, page, specializations; the specializations themselves come
+    # from the in-process catalog
+    LIST_QUERIES = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        specializations = [
+            Specialization.objects.create(name=name)
+            for name in ('Cardiology', 'Dermatology', 'Neurology')
+        ]
+        for index in range(25):
+            doctor = User.objects.create_user(
+                username=f'doctor{index}', password='password123', role='doctor'
+            )
+            for specialization in specializations[:index % 3 + 1]:
+                DoctorSpecialization.objects.create(
+                    doctor=doctor.doctor_profile, specialization=specialization
+                )
+
+    def setUp(self):
+        # Measure the database work, not responses cached by earlier tests,
+        # with the specialization catalog in its steady (loaded) state. The
+        # test data never commits, so publish it by hand
+        get_cache().clear()
+        catalog.bump()
+        catalog.specializations()
+        self.client = APIClient()
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        for page_size in (5, 20):
+            with self.assertNumQueries(self.LIST_QUERIES):
+                response = self.client.get('/api/doctors/', {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_list_reports_doctor_counts(self):
+        response = self.client.get('/api/doctors/', {'page_size': 25})
+        counts = {
+            item['specialization']['name']: item['specialization']['doctor_count']
+            for doctor in response.data['results']
+            for item in doctor['specializations']
+        }
+        self.assertEqual(counts, {'Cardiology': 25, 'Dermatology': 16, 'Neurology': 8})
+
+    def test_detail_query_count(self):
+        doctor = User.objects.get(username='doctor2').doctor_profile
+        # page, specializations
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/doctors/{doctor.id}/')
+        self.assertEqual(len(response.data['specializations']), 3)
+
+
+class SpecializationCatalogTests(TestCase):
+    """Specialization reads are served from the in-process catalog"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cardiology = Specialization.objects.create(name='Cardiology')
+        cls.doctor = User.objects.create_user(username='doctor', password='password123', role='doctor')
+        DoctorSpecialization.objects.create(doctor=cls.doctor.doctor_profile, specialization=cls.cardiology)
+
+    def setUp(self):
+        # setUpTestData never commits, so its changes are published by hand
+        catalog.bump()
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+
+    def test_reads_do_not_query_once_loaded(self):
+        self.client.get('/api/specializations/')
+        with self.assertNumQueries(0):
+            listed = self.client.get('/api/specializations/')
+            detail = self.client.get(f'/api/specializations/{self.cardiology.id}/')
+        self.assertEqual(listed.data[0]['doctor_count'], 1)
+        self.assertEqual(detail.data['name'], 'Cardiology')
+
+    def test_writes_reload_the_catalog(self):
+        self.client.get('/api/specializations/')
+        with self.captureOnCommitCallbacks(execute=True):
+            other = User.objects.create_user(username='other', password='password123', role='doctor')
+            DoctorSpecialization.objects.create(doctor=other.doctor_profile, specialization=self.cardiology)
+            Specialization.objects.create(name='Neurology')
+
+        response = self.client.get('/api/specializations/')
+        counts = {item['name']: item['doctor_count'] for item in response.data}
+        self.assertEqual(counts, {'Cardiology': 2, 'Neurology': 0})
+        self.assertEqual(self.client.get('/api/specializations/0/').status_code, 404)
+
+
+    def test_rolled_back_writes_are_not_published(self):
+        catalog.specializations()
+        version = catalog._version()
+        try:
+            with transaction.atomic():
+                Specialization.objects.create(name='Neurology')
+                # The writer sees its own change before it commits
+                self.assertEqual(len(catalog.specializations()), 2)
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        self.assertEqual(catalog._version(), version)
+        response = self.client.get('/api/specializations/')
+        self.assertEqual([item['name'] for item in response.data], ['Cardiology'])
+
+    @override_settings(MEDLINK_CATALOG_MAX_AGE=0)
+    def test_snapshot_expires_without_a_bump(self):
+        self.client.get('/api/specializations/')
+        with self.assertNumQueries(1):
+            self.client.get('/api/specializations/')
+
+
+class FastSerializerParityTests(TestCase):
+    """values()-based readers must render exactly what the serializers render"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cardiology = Specialization.objects.create(name='Cardiology', description='Heart', icon='fa-heart')
+        neurology = Specialization.objects.create(name='Neurology')
+        cls.doctor = User.objects.create_user(
+            username='house', password='password123', role='doctor', first_name='Gregory',
+            last_name='House', date_of_birth=date(1959, 6, 11), phone_number='555-0100',
+            profile_picture='profile_pictures/house.png'
+        )
+        profile = cls.doctor.doctor_profile
+        profile.consultation_fee = Decimal('120.5')
+        profile.bio = 'Diagnostics'
+        profile.working_days = 'monday, tuesday,friday'
+        profile.save()
+        DoctorSpecialization.objects.create(
+            doctor=profile, specialization=cardiology, is_primary=True,
+            certification='Board', certification_date=date(2001, 3, 4)
+        )
+        DoctorSpecialization.objects.create(doctor=profile, specialization=neurology, experience_years=3)
+        # A doctor account whose profile was removed renders doctor_profile as null
+        cls.other_doctor = User.objects.create_user(username='wilson', password='password123', role='doctor')
+        cls.other_doctor.doctor_profile.delete()
+
+        cls.patient = User.objects.create_user(username='patient', password='password123', role='patient')
+        day = timezone.localdate() + timedelta(days=3)
+        slots = ['morning', 'afternoon', 'evening']
+        for index, (doctor, urgency) in enumerate([
+            (cls.doctor, 'high'), (cls.doctor, 'low'), (cls.other_doctor, 'emergency')
+        ]):
+            request = AppointmentRequest.objects.create(
+                patient=cls.patient, doctor=doctor, preferred_date=day,
+                preferred_time_slot=slots[index], reason='Checkup', urgency_level=urgency
+            )
+            if index < 2:
+                request.status = 'accepted'
+                request.save()
+                Appointment.objects.create(
+                    appointment_request=request,
+                    scheduled_time=(timezone.now() + timedelta(days=3, hours=index)).replace(
+                        minute=0, second=0, microsecond=0
+                    ),
+                    duration=45,
+                    # One booked without a person accepting it, as waitlist offers are
+                    accepted_by=cls.doctor if index == 0 else None
+                )
+
+    def setUp(self):
+        self.request = Request(APIRequestFactory().get('/'))
+
+    def assertParity(self, reader, serializer_class, queryset):
+        expected = serializer_class(queryset, many=True, context={'request': self.request}).data
+        actual = render(reader, queryset.values(*reader.columns), self.request)
+        self.assertEqual(json.loads(JSONRenderer().render(actual)), json.loads(JSONRenderer().render(expected)))
+        self.assertEqual([list(item) for item in actual], [list(item) for item in expected])
+
+    def test_doctor_profiles(self):
+        self.assertParity(DoctorProfileReader(), DoctorProfileSerializer, DoctorProfile.objects.order_by('id'))
+
+    def test_appointment_requests(self):
+        self.assertParity(
+            AppointmentRequestReader(), AppointmentRequestSerializer, AppointmentRequest.objects.order_by('id')
+        )
+
+    def test_appointments(self):
+        self.assertParity(AppointmentReader(), AppointmentSerializer, Appointment.objects.order_by('id'))
+
+    def test_list_endpoint_uses_reader_shape(self):
+        client = APIClient()
+        client.force_authenticate(self.patient)
+        fast = client.get('/api/appointments/').json()['results']
+        lean = client.get('/api/appointments/', {'expand': 'appointment_request.doctor_profile.user,'
+                                                 'appointment_request.doctor_profile.specializations.specialization'})
+        self.assertEqual(fast, lean.json()['results'])
+
+
+class SlotLedgerTests(TestCase):
+    """The day index and slot ledger must agree with the appointments they describe"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(username='doctor', password='password123', role='doctor')
+        cls.patient = User.objects.create_user(username='patient', password='password123', role='patient')
+        cls.start = (timezone.now() + timedelta(days=2)).replace(hour=10, minute=0, second=0, microsecond=0)
+
+    def request(self):
+        # Requests are unique per patient and preferred slot, so each gets its own patient
+        patient = User.objects.create_user(
+            username=f'patient{AppointmentRequest.objects.count()}', password='password123', role='patient'
+        )
+        return AppointmentRequest.objects.create(
+            patient=patient, doctor=self.doctor, preferred_date=self.start.date(),
+            preferred_time_slot='morning', reason='Checkup', status='accepted'
+        )
+
+    def book(self, start, duration=30):
+        request = self.request()
+        return Appointment.objects.create(appointment_request=request, scheduled_time=start, duration=duration)
+
+    def test_rebuild_restores_day_schedules(self):
+        appointment = self.book(self.start)
+        DoctorDaySchedule.objects.all().delete()
+        call_command('rebuild_day_schedules', stdout=StringIO())
+        schedule = DoctorDaySchedule.objects.get(doctor=self.doctor)
+        day, start, end = appointment_interval(appointment.scheduled_time, appointment.duration)
+        self.assertEqual((schedule.date, schedule.busy_intervals), (day, [[start, end]]))
+
+    def test_overlapping_booking_is_rejected(self):
+        self.book(self.start, duration=45)
+        with self.assertRaises(ValidationError):
+            self.book(self.start + timedelta(minutes=30))
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_slots_off_the_granule_grid_are_rejected(self):
+        for start, duration in ((self.start + timedelta(minutes=10), 30), (self.start, 40)):
+            with self.subTest(start=start, duration=duration), self.assertRaises(ValidationError) as raised:
+                self.book(start, duration)
+            self.assertEqual(raised.exception.code, 'off_grid')
+        # Back-to-back slots on the grid share no granule
+        self.book(self.start, duration=45)
+        self.book(self.start + timedelta(minutes=45))
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_hold_on_booked_or_held_slot_is_rejected(self):
+        self.book(self.start)
+        with self.assertRaises(ValidationError):
+            SlotHold.place(self.doctor, self.patient, self.start + timedelta(minutes=15), 30, ttl=300)
+        other = User.objects.create_user(username='other', password='password123', role='patient')
+        SlotHold.place(self.doctor, self.patient, self.start + timedelta(hours=1), 30, ttl=300)
+        with self.assertRaises(ValidationError):
+            SlotHold.place(self.doctor, other, self.start + timedelta(hours=1), 30, ttl=300)
+        self.assertEqual(SlotHold.objects.count(), 1)
+
+    def test_holds_per_patient_are_capped(self):
+        for hour in range(2):
+            SlotHold.place(self.doctor, self.patient, self.start + timedelta(hours=hour), 30, ttl=300, limit=2)
+        with self.assertRaises(ValidationError) as raised:
+            SlotHold.place(self.doctor, self.patient, self.start + timedelta(hours=2), 30, ttl=300, limit=2)
+        self.assertEqual(raised.exception.code, 'hold_limit')
+
+    def test_rebuild_backfills_ledger_and_reports_double_bookings(self):
+        requests = [self.request(), self.request()]
+        # Booked before the ledger existed, so neither has ledger rows
+        first, second = Appointment.objects.bulk_create([
+            Appointment(appointment_request=request, scheduled_time=self.start, duration=30)
+            for request in requests
+        ])
+        stderr = StringIO()
+        call_command('rebuild_slot_ledger', stdout=StringIO(), stderr=stderr)
+        self.assertEqual(SlotLedgerEntry.objects.filter(appointment=first).count(), 2)
+        self.assertFalse(SlotLedgerEntry.objects.filter(appointment=second).exists())
+        self.assertIn(f'Appointment {second.id}', stderr.getvalue())
+        with self.assertRaises(ValidationError):
+            self.book(self.start)
+
+
+class RequestPriorityBackfillTests(TestCase):
+    def test_backfill_sets_priority_from_urgency(self):
+        doctor = User.objects.create_user(username='doctor', password='password123', role='doctor')
+        patient = User.objects.create_user(username='patient', password='password123', role='patient')
+        day = timezone.localdate() + timedelta(days=1)
+        # bulk_create skips save(), like rows written before priority was stored
+        AppointmentRequest.objects.bulk_create([
+            AppointmentRequest(
+                patient=patient, doctor=doctor, preferred_date=day, preferred_time_slot=slot,
+                reason='Checkup', urgency_level=urgency
+            )
+            for slot, urgency in [('morning', 'emergency'), ('afternoon', 'high'), ('evening', 'low')]
+        ])
+        call_command('backfill_request_priority', stdout=StringIO())
+        self.assertEqual(
+            dict(AppointmentRequest.objects.values_list('urgency_level', 'priority')),
+            {'emergency': 3, 'high': 2, 'low': 0}
+        )
+
+
+class ReminderDispatchTests(TestCase):
+    def setUp(self):
+        doctor = User.objects.create_user(username='doctor', password='password123', role='doctor')
+        start = (timezone.now() + timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+        self.reminders = []
+        for index, slot in enumerate(['morning', 'afternoon']):
+            patient = User.objects.create_user(
+                username=f'patient{index}', password='password123', role='patient', email=f'p{index}@example.com'
+            )
+            request = AppointmentRequest.objects.create(
+                patient=patient, doctor=doctor, preferred_date=start.date(),
+                preferred_time_slot=slot, reason='Checkup', status='accepted'
+            )
+            appointment = Appointment.objects.create(
+                appointment_request=request, scheduled_time=start + timedelta(hours=index)
+            )
+            self.reminders.append(AppointmentReminder.objects.create(
+                appointment=appointment, reminder_time=timezone.now() - timedelta(minutes=1), reminder_type='email'
+            ))
+
+    def assertOnlyFirstSent(self):
+        call_command('dispatch_reminders', once=True, stdout=StringIO())
+        self.assertEqual([message.to for message in mail.outbox], [['p0@example.com']])
+        self.assertEqual(
+            list(AppointmentReminder.objects.order_by('id').values_list('is_sent', flat=True)), [True, False]
+        )
+
+    def test_cancelled_appointments_are_not_reminded(self):
+        cancelled = self.reminders[1].appointment.appointment_request
+        cancelled.status = 'cancelled'
+        cancelled.save()
+        self.assertOnlyFirstSent()
+
+    def test_started_appointments_are_not_reminded(self):
+        # As when the dispatcher was down until after the appointment began
+        Appointment.objects.filter(id=self.reminders[1].appointment_id).update(
+            scheduled_time=timezone.now() - timedelta(minutes=5)
+        )
+        self.assertOnlyFirstSent()
+
+
+class WaitlistOfferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(username='doctor', password='password123', role='doctor')
+        day = timezone.localdate() + timedelta(days=2)
+        cls.start = timezone.make_aware(datetime.combine(day, time(10)))
+        cls.entries = []
+        for index in range(2):
+            patient = User.objects.create_user(username=f'patient{index}', password='password123', role='patient')
+            request = AppointmentRequest.objects.create(
+                patient=patient, doctor=cls.doctor, preferred_date=day, preferred_time_slot='morning', reason='Checkup'
+            )
+            cls.entries.append(WaitlistEntry.objects.create(
+                appointment_request=request, doctor=cls.doctor, preferred_date=day, preferred_time_slot='morning'
+            ))
+
+    def test_offer_whose_hold_is_gone_passes_to_next_entry(self):
+        first, second = self.entries
+        self.assertEqual(offer_freed_slot(self.doctor.id, self.start, 30), first)
+        # As when the patient releases the hold, or someone clears it once expired
+        first.refresh_from_db()
+        first.offered_hold.delete()
+
+        self.assertEqual(expire_offers(), 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, first.offered_hold), ('waiting', None))
+        self.assertEqual((second.status, second.offered_start), ('offered', self.start))
+        self.assertEqual(second.offered_hold.start, self.start)
+
+    def test_only_the_cancellation_itself_offers_the_slot(self):
+        patient = User.objects.create_user(username='booked', password='password123', role='patient')
+        booked = AppointmentRequest.objects.create(
+            patient=patient, doctor=self.doctor, preferred_date=self.start.date(),
+            preferred_time_slot='morning', reason='Checkup', status='accepted'
+        )
+        Appointment.objects.create(appointment_request=booked, scheduled_time=self.start)
+        booked = AppointmentRequest.objects.get(id=booked.id)
+        booked.status = 'cancelled'
+        with self.captureOnCommitCallbacks(execute=True):
+            booked.save()
+        first = WaitlistEntry.objects.get(id=self.entries[0].id)
+        self.assertEqual(first.status, 'offered')
+
+        # The patient turns the offer down, then staff edit the cancelled request
+        first.offered_hold.delete()
+        WaitlistEntry.objects.filter(id=first.id).update(status='withdrawn')
+        booked.notes = 'Called to confirm the cancellation'
+        with self.captureOnCommitCallbacks(execute=True):
+            booked.save()
+        self.assertEqual(
+            list(WaitlistEntry.objects.order_by('id').values_list('status', flat=True)), ['withdrawn', 'waiting']
+        )
+        self.assertFalse(SlotHold.objects.exists())
+
+
+class DoctorSearchTests(TestCase):
+    def test_search_counts_and_pages_every_match(self):
+        for index in range(12):
+            doctor = User.objects.create_user(username=f'doctor{index}', password='password123', role='doctor')
+            doctor.doctor_profile.bio = 'Heart rhythm' if index % 2 else 'Heart and lungs, heart surgery'
+            doctor.doctor_profile.save()
+        client = APIClient()
+        first = client.get('/api/doctors/', {'search': 'heart', 'page_size': 5}).data
+        last = client.get('/api/doctors/', {'search': 'heart', 'page_size': 5, 'page': 3}).data
+        self.assertEqual((first['count'], len(last['results'])), (12, 2))
+        # Doctors mentioning the term twice rank first
+        self.assertEqual(
+            [doctor['user']['username'] for doctor in first['results']],
+            ['doctor0', 'doctor2', 'doctor4', 'doctor6', 'doctor8']
+        )
+
+
+class TemporaryMediaMixin:
+    """Keep stored and staged files in a directory removed after each test"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, MEDLINK_UPLOAD_STAGING_DIR=f'{media_root}/staging'
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # The field's storage is built at import, so it needs swapping too
+        self.storage = ContentAddressedStorage(location=media_root, base_url='/media/')
+        storage_patch = mock.patch.object(MedicalFile._meta.get_field('file'), 'storage', self.storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+
+class ResumableUploadTests(TemporaryMediaMixin, TestCase):
+    CONTENT = b'Blood pressure 120/80, pulse 64. ' * 100
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user(username='patient', password='password123', role='patient')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+        response = self.client.post('/api/medical-files/uploads/', {
+            'filename': 'results.txt', 'size': len(self.CONTENT),
+            'sha256': hashlib.sha256(self.CONTENT).hexdigest(),
+        })
+        self.assertEqual(response.status_code, 201)
+        self.url = f"/api/medical-files/uploads/{response.data['id']}/"
+
+    def put(self, offset, chunk, checksum=None):
+        checksum = checksum or hashlib.sha256(chunk).digest()
+        return self.client.generic(
+            'PUT', self.url, chunk, content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), HTTP_UPLOAD_CHECKSUM=f'sha256 {base64.b64encode(checksum).decode()}'
+        )
+
+    def test_chunk_at_wrong_offset_is_a_conflict(self):
+        self.assertEqual(self.put(0, self.CONTENT[:1000]).data['offset'], 1000)
+        response = self.put(500, self.CONTENT[500:1500])
+        self.assertEqual((response.status_code, response.data['offset']), (409, 1000))
+
+    def test_chunk_with_wrong_checksum_is_dropped(self):
+        response = self.put(0, self.CONTENT[:1000], checksum=hashlib.sha256(b'other').digest())
+        self.assertEqual((response.status_code, response.data['offset']), (400, 0))
+        self.assertEqual(self.client.get(self.url)['Upload-Offset'], '0')
+        # The same chunk can be retried from the same offset
+        self.assertEqual(self.put(0, self.CONTENT[:1000]).data['offset'], 1000)
+
+    def test_finalize_creates_the_medical_file(self):
+        self.assertEqual(self.client.post(f'{self.url}finalize/').status_code, 409)
+        self.put(0, self.CONTENT[:2000])
+        self.put(2000, self.CONTENT[2000:])
+
+        response = self.client.post(f'{self.url}finalize/')
+        self.assertEqual(response.status_code, 201)
+        medical_file = MedicalFile.objects.get(pk=response.data['id'])
+        self.assertEqual(medical_file.sha256, hashlib.sha256(self.CONTENT).hexdigest())
+        with medical_file.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.CONTENT)
+        session = UploadSession.objects.get()
+        self.assertEqual((session.status, session.medical_file), ('complete', medical_file))
+        self.assertFalse(os.path.exists(session.staging_path))
+        self.assertEqual(self.client.post(f'{self.url}finalize/').status_code, 409)
+
+
+class StoredBlobRefcountTests(TemporaryMediaMixin, TestCase):
+    CONTENT = b'Allergies: penicillin'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user(username='patient', password='password123', role='patient')
+
+    def upload(self, **fields):
+        return MedicalFile.objects.create(
+            patient=self.patient, file=ContentFile(self.CONTENT, name='notes.txt'), **fields
+        )
+
+    def test_identical_uploads_share_one_blob_until_both_are_gone(self):
+        first, second = self.upload(), self.upload()
+        blob = StoredBlob.objects.get()
+        path = self.storage.path(first.file.name)
+        self.assertEqual((blob.refcount, second.file.name), (2, first.file.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 1)
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_row_that_fails_to_save_takes_its_reference_with_it(self):
+        existing = self.upload()
+        with self.assertRaises(IntegrityError):
+            # The insert fails only after the file has been stored
+            self.upload(pk=existing.pk)
+        self.assertEqual(StoredBlob.objects.get().refcount, 1)
+
+
+class MedicalFileAccessTests(TemporaryMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user(username='patient', password='password123', role='patient')
+        cls.doctor = User.objects.create_user(username='doctor', password='password123', role='doctor')
+        cls.stranger = User.objects.create_user(username='stranger', password='password123', role='patient')
+        cls.request = AppointmentRequest.objects.create(
+            patient=cls.patient, doctor=cls.doctor, preferred_date=timezone.localdate() + timedelta(days=1),
+            preferred_time_slot='morning', reason='Checkup'
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.shared, self.private = [
+            MedicalFile.objects.create(
+                patient=self.patient, file=ContentFile(content, name='notes.txt'), is_private=is_private
+            )
+            for content, is_private in ((b'shared', False), (b'private', True))
+        ]
+        self.client = APIClient()
+
+    def listed(self, user):
+        self.client.force_authenticate(user)
+        return [row['id'] for row in self.client.get('/api/medical-files/').data['results']]
+
+    def download(self, user, medical_file, **params):
+        self.client.force_authenticate(user)
+        return self.client.get(f'/api/medical-files/{medical_file.id}/download/', params)
+
+    def test_doctors_see_only_shared_files_of_live_requests(self):
+        self.assertEqual(self.listed(self.doctor), [self.shared.id])
+        self.request.status = 'rejected'
+        self.request.save(update_fields=['status'])
+        self.assertEqual(self.listed(self.doctor), [])
+
+    def test_download_follows_the_file_scope(self):
+        response = self.download(self.patient, self.private)
+        self.assertEqual((response.status_code, b''.join(response.streaming_content)), (200, b'private'))
+        self.assertEqual(self.download(self.stranger, self.shared).status_code, 404)
+
+    def test_doctor_with_a_live_request_reads_shared_files_only(self):
+        response = self.download(self.doctor, self.shared)
+        self.assertEqual((response.status_code, b''.join(response.streaming_content)), (200, b'shared'))
+        self.assertEqual(self.download(self.doctor, self.private).status_code, 404)
+
+        # Every URL the serializer hands out works for them
+        detail = self.client.get(f'/api/medical-files/{self.shared.id}/')
+        self.assertEqual(detail.status_code, 200)
+        self.assertEqual(self.client.get(detail.data['download_url']).status_code, 200)
+        link = self.client.get(f'/api/medical-files/{self.shared.id}/download-link/').data['url']
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(link).status_code, 200)
+
+        # Reading is all: only the patient or an admin changes a file
+        self.client.force_authenticate(self.doctor)
+        response = self.client.patch(f'/api/medical-files/{self.shared.id}/', {'description': 'x'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_signed_link_is_checked_for_the_user_it_was_issued_to(self):
+        self.client.force_authenticate(self.patient)
+        url = self.client.get(f'/api/medical-files/{self.shared.id}/download-link/').data['url']
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.download(None, self.shared, token='forged').status_code, 403)
+        # Checked against the doctor's scope, which leaves out private files
+        token = sign(self.private, self.doctor)
+        self.assertEqual(self.download(None, self.private, token=token).status_code, 404)
+
+
+@override_settings(MEDLINK_THUMBNAIL_WORKERS=0, MEDLINK_THUMBNAIL_SIZES=[128, 512])
+class ThumbnailTests(TemporaryMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user(username='patient', password='password123', role='patient')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def png(self, colour='red'):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), colour).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def upload(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            medical_file = MedicalFile.objects.create(patient=self.patient, file=ContentFile(content, name='scan.png'))
+        medical_file.refresh_from_db()
+        return medical_file
+
+    def test_saved_image_gets_its_edges_recorded_and_served(self):
+        medical_file = self.upload(self.png())
+        self.assertEqual(sorted(medical_file.thumbnails), ['128', '512'])
+        response = self.client.get(f'/api/medical-files/{medical_file.id}/thumbnails/128/')
+        self.assertEqual(response.status_code, 200)
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as thumbnail:
+            self.assertEqual(thumbnail.size, (128, 96))
+        payload = self.client.get(f'/api/medical-files/{medical_file.id}/').data
+        self.assertEqual(sorted(payload['thumbnails']), ['128', '512'])
+
+    def test_failed_render_is_not_resubmitted_until_the_file_changes(self):
+        with self.assertLogs('medlink.thumbnails', 'WARNING'):
+            medical_file = self.upload(b'not an image')
+        self.assertEqual(list(medical_file.thumbnails), [FAILED])
+        self.assertEqual(self.client.get(f'/api/medical-files/{medical_file.id}/').data['thumbnails'], {})
+        with mock.patch('medlink.thumbnails.render') as render_thumbnails:
+            with self.captureOnCommitCallbacks(execute=True):
+                medical_file.description = 'Chest X-ray'
+                medical_file.save()
+        render_thumbnails.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            medical_file.file = ContentFile(self.png('blue'), name='scan.png')
+            medical_file.save()
+        medical_file.refresh_from_db()
+        self.assertEqual(sorted(medical_file.thumbnails), ['128', '512'])
+
+
+class AvailableDateFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.day = timezone.localdate() + timedelta(days=7)
+        cls.doctor = User.objects.create_user(username='doctor', password='password123', role='doctor')
+        profile = cls.doctor.doctor_profile
+        profile.working_hours_start, profile.working_hours_end = time(9), time(10)
+        profile.working_days = cls.day.strftime('%A').lower()
+        profile.save()
+
+    def book(self, hour, minute, duration):
+        patient = User.objects.create_user(
+            username=f'patient{hour}{minute}', password='password123', role='patient'
+        )
+        request = AppointmentRequest.objects.create(
+            patient=patient, doctor=self.doctor, preferred_date=self.day,
+            preferred_time_slot='morning', reason='Checkup', status='accepted'
+        )
+        Appointment.objects.create(
+            appointment_request=request, duration=duration,
+            scheduled_time=timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+        )
+
+    def available(self):
+        response = APIClient().get('/api/doctors/', {'available_date': self.day.isoformat()})
+        return [doctor['user']['id'] for doctor in response.data['results']]
+
+    def test_fully_booked_day_is_not_available(self):
+        self.assertEqual(self.available(), [self.doctor.id])
+        self.book(9, 0, 60)
+        self.assertEqual(self.available(), [])
+
+    def test_fragmented_day_is_not_available(self):
+        # 30 minutes free, but in two 15-minute gaps
+        self.book(9, 15, 15)
+        self.book(9, 45, 15)
+        self.assertEqual(self.available(), [])
+
+    def test_active_holds_take_slots(self):
+        self.book(9, 0, 30)
+        self.assertEqual(self.available(), [self.doctor.id])
+        patient = User.objects.create_user(username='holder', password='password123', role='patient')
+        start = timezone.make_aware(datetime.combine(self.day, time(9, 30)))
+        SlotHold.place(self.doctor, patient, start, 30, ttl=300)
+        self.assertEqual(self.available(), [])
+
+
+class BulkTriageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(username='doctor', password='password123', role='doctor')
+        cls.day = timezone.localdate() + timedelta(days=3)
+        cls.requests = []
+        for index in range(4):
+            patient = User.objects.create_user(username=f'patient{index}', password='password123', role='patient')
+            request = AppointmentRequest.objects.create(
+                patient=patient, doctor=cls.doctor, preferred_date=cls.day,
+                preferred_time_slot='morning', reason='Checkup'
+            )
+            WaitlistEntry.objects.create(
+                appointment_request=request, doctor=cls.doctor, preferred_date=cls.day, preferred_time_slot='morning'
+            )
+            cls.requests.append(request)
+
+    def at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+
+    def triage(self, items):
+        client = APIClient()
+        client.force_authenticate(self.doctor)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/appointment-requests/bulk-triage/', items, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [result['status'] for result in response.data['results']]
+
+    def accept(self, request, start, duration=30):
+        return {'request_id': request.id, 'action': 'accept', 'scheduled_time': start.isoformat(), 'duration': duration}
+
+    def test_mixed_batch_books_rejects_and_closes_waitlist(self):
+        first, second, third, _ = self.requests
+        statuses = self.triage([
+            self.accept(first, self.at(10)),
+            {'request_id': second.id, 'action': 'reject'},
+            self.accept(third, self.at(11), duration=45),
+        ])
+        self.assertEqual(statuses, ['accepted', 'rejected', 'accepted'])
+        self.assertEqual(
+            dict(AppointmentRequest.objects.filter(id__in=[first.id, second.id, third.id]).values_list('id', 'status')),
+            {first.id: 'accepted', second.id: 'rejected', third.id: 'accepted'}
+        )
+        self.assertEqual(
+            dict(WaitlistEntry.objects.values_list('appointment_request_id', 'status')),
+            {first.id: 'booked', second.id: 'withdrawn', third.id: 'booked', self.requests[3].id: 'waiting'}
+        )
+
+        appointment = Appointment.objects.get(appointment_request=third)
+        self.assertEqual(appointment.ledger_entries.count(), 3)
+        # Three days out, so both appointments get their reminder a day before
+        self.assertEqual(
+            sorted(AppointmentReminder.objects.values_list('reminder_time', flat=True)),
+            [self.at(10) - timedelta(hours=24), self.at(11) - timedelta(hours=24)]
+        )
+        schedule = DoctorDaySchedule.objects.get(doctor=self.doctor, date=self.day)
+        self.assertEqual(schedule.busy_intervals, [[600, 630], [660, 705]])
+
+    def test_conflicting_accepts_in_one_batch_book_only_the_first(self):
+        first, second = self.requests[:2]
+        statuses = self.triage([self.accept(first, self.at(10), 45), self.accept(second, self.at(10, 30))])
+        self.assertEqual(statuses, ['accepted', 'error'])
+        self.assertEqual(AppointmentRequest.objects.get(id=second.id).status, 'pending')
+        self.assertEqual(WaitlistEntry.objects.get(appointment_request=second).status, 'waiting')
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_held_slot_is_only_bookable_by_its_holder(self):
+        first, second = self.requests[:2]
+        hold = SlotHold.place(self.doctor, second.patient, self.at(10), 30, ttl=300)
+        self.assertEqual(self.triage([self.accept(first, self.at(10))]), ['error'])
+        self.assertTrue(SlotHold.objects.filter(id=hold.id).exists())
+
+        # The holder's own hold turns into the booking
+        self.assertEqual(self.triage([self.accept(second, self.at(10))]), ['accepted'])
+        self.assertFalse(SlotHold.objects.exists())
+        self.assertEqual(
+            list(SlotLedgerEntry.objects.values_list('appointment__appointment_request', flat=True)),
+            [second.id, second.id]
+        )
+
+
+class DirectoryCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(username='doctor', password='password123', role='doctor')
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+
+    def test_list_cached_inside_a_write_is_not_served_after_commit(self):
+        profile = self.doctor.doctor_profile
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.bio = 'Cardiologist'
+            profile.save()
+            # A read racing the write, cached before the transaction commits
+            self.assertEqual(self.client.get('/api/doctors/')['X-Cache'], 'MISS')
+
+        response = self.client.get('/api/doctors/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['results'][0]['bio'], 'Cardiologist')
+        self.assertEqual(self.client.get('/api/doctors/')['X-Cache'], 'HIT')
+
+    def test_rolled_back_write_keeps_cached_responses(self):
+        self.client.get('/api/doctors/')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.doctor.doctor_profile.save()
+            raise IntegrityError
+        self.assertEqual(self.client.get('/api/doctors/')['X-Cache'], 'HIT')
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Ties on rating and on experience, so only the id tells some rows apart
+        profiles = [(4.5, 10), (4.5, 10), (4.5, 3), (3.0, 10), (4.5, 10), (3.0, 10), (5.0, 1)]
+        for index, (rating, experience) in enumerate(profiles):
+            doctor = User.objects.create_user(username=f'doctor{index}', password='password123', role='doctor')
+            DoctorProfile.objects.filter(user=doctor).update(rating=rating, experience_years=experience)
+        cls.expected = list(
+            DoctorProfile.objects.order_by('-rating', '-experience_years', '-id').values_list('id', flat=True)
+        )
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([doctor['id'] for doctor in data['results']])
+            url = data[link]
+        return pages
+
+    def test_cursor_pages_round_trip_through_ties(self):
+        forward = self.walk('/api/doctors/?pagination=cursor&page_size=2', 'next')
+        self.assertEqual([doctor_id for page in forward for doctor_id in page], self.expected)
+        self.assertEqual([len(page) for page in forward], [2, 2, 2, 1])
+
+        last_page = self.client.get('/api/doctors/?pagination=cursor&page_size=2').json()
+        while last_page['next']:
+            last_page = self.client.get(last_page['next']).json()
+        backward = self.walk(last_page['previous'], 'previous')
+        self.assertEqual(backward, forward[-2::-1])
+
+    def test_cursor_rejects_ordering_and_bad_tokens(self):
+        response = self.client.get('/api/doctors/', {'pagination': 'cursor', 'ordering': 'user__username'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+        self.assertEqual(self.client.get('/api/doctors/', {'cursor': 'not-a-cursor'}).status_code, 404)
+        # Without a cursor, ?ordering= still works on numbered pages
+        self.assertEqual(self.client.get('/api/doctors/', {'ordering': 'user__username'}).status_code, 200)
+
+
+class DynamicFieldsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user(username='patient', password='password123', role='patient')
+        day = timezone.localdate() + timedelta(days=1)
+        for index in range(6):
+            doctor = User.objects.create_user(username=f'doctor{index}', password='password123', role='doctor')
+            AppointmentRequest.objects.create(
+                patient=cls.patient, doctor=doctor, preferred_date=day, preferred_time_slot='morning', reason='Checkup'
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def results(self, **params):
+        return self.client.get('/api/appointment-requests/', params).json()['results']
+
+    def test_fields_and_expand_shape_the_response(self):
+        self.assertEqual(set(self.results(fields='id,status')[0]), {'id', 'status'})
+        # Naming a nested field expands its parent
+        row = self.results(fields='id,doctor_profile.rating')[0]
+        self.assertEqual((set(row), set(row['doctor_profile'])), ({'id', 'doctor_profile'}, {'rating'}))
+        # Expanded, with its own nested user collapsed to an id
+        row = self.results(expand='doctor_profile')[0]
+        self.assertIsInstance(row['doctor_profile']['user'], int)
+        self.assertNotIn('specializations', row['doctor_profile'])
+        self.assertNotIn('doctor_profile', self.results(fields='id,doctor')[0])
+        # Without either parameter the full nested shape stays
+        self.assertIsInstance(self.results()[0]['doctor_profile']['user'], dict)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for params in ({'fields': 'id,status'}, {'expand': 'doctor_profile.user,doctor_profile.specializations'}):
+            counts = []
+            for page_size in (2, 6):
+                with self.subTest(params=params, page_size=page_size), CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(len(self.results(page_size=page_size, **params)), page_size)
+                counts.append(len(queries))
+            self.assertEqual(counts[0], counts[1], params)
@@ -0,0 +1,186 @@
+# server/medical/thumbnails.py
+
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .storage import blob_digest, thumbnail_name
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp'}
+PREVIEW_EXTENSIONS = {'pdf'}
+# Seconds a PDF first page may take to render
+PREVIEW_TIMEOUT = 30
+# Key recorded instead of edges when a render produced nothing, holding the
+# source's digest so the same file isn't rendered again on every save
+FAILED = 'failed'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pdf_first_page(source, edge):
+    # Pillow can write PDFs but not read them; poppler's pdftoppm renders the
+    # first page when it is installed, and PDFs simply get no preview otherwise
+    pdftoppm = shutil.which('pdftoppm')
+    if not pdftoppm:
+        return None
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'page')
+        subprocess.run(
+            [pdftoppm, '-png', '-f', '1', '-l', '1', '-singlefile', '-scale-to', str(edge), source, output],
+            check=True, capture_output=True, timeout=PREVIEW_TIMEOUT
+        )
+        image = Image.open(f'{output}.png')
+        image.load()
+        return image
+
+
+def render(source, targets, is_pdf=False):
+    """Write a JPEG of `source` for each (longest edge, path) target
+
+    Runs in a worker process, so it touches neither Django nor the
+    database. Returns the edges that exist afterwards; sources Pillow
+    can't read give none.
+    """
+    largest = max(edge for edge, _ in targets)
+    try:
+        image = _pdf_first_page(source, largest) if is_pdf else Image.open(source)
+        if image is None:
+            return []
+        with image:
+            # JPEGs decode straight at a reduced scale, which is most of the saving
+            image.draft('RGB', (largest, largest))
+            image = ImageOps.exif_transpose(image)
+            if image.mode != 'RGB':
+                rgba = image.convert('RGBA')
+                image = Image.new('RGB', rgba.size, 'white')
+                image.paste(rgba, mask=rgba)
+            written = []
+            for edge, path in sorted(targets, reverse=True):
+                if not os.path.exists(path):
+                    # Each size is made from the previous, larger one
+                    image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as partial_file:
+                        image.save(partial_file, 'JPEG', quality=80, optimize=True)
+                    os.replace(partial_file.name, path)
+                written.append(edge)
+            return sorted(written)
+    except (OSError, ValueError, Image.DecompressionBombError, subprocess.SubprocessError):
+        logger.warning('Could not render thumbnails for %s', source, exc_info=True)
+        return []
+
+
+def source_field(instance):
+    """The file field a row's thumbnails are made from, or None"""
+    for field in getattr(instance, 'THUMBNAIL_FIELDS', ()):
+        if getattr(instance, field):
+            return field
+    return None
+
+
+def job(instance):
+    """render() arguments for a row, or None if it has nothing to preview"""
+    field = source_field(instance)
+    if field is None:
+        return None
+    file = getattr(instance, field)
+    digest = blob_digest(file.name)
+    extension = os.path.splitext(file.name)[1][1:].lower()
+    # Thumbnails are keyed by content, so only content-addressed files get them
+    if digest is None or extension not in IMAGE_EXTENSIONS | PREVIEW_EXTENSIONS:
+        return None
+    storage = file.storage
+    targets = [(edge, storage.path(thumbnail_name(digest, edge))) for edge in settings.MEDLINK_THUMBNAIL_SIZES]
+    return file.name, (storage.path(file.name), targets, extension in PREVIEW_EXTENSIONS)
+
+
+def names_for(name, edges):
+    digest = blob_digest(name)
+    if not edges:
+        return {FAILED: digest}
+    return {str(edge): thumbnail_name(digest, edge) for edge in edges}
+
+
+def edges_of(thumbnails):
+    """Longest edge -> thumbnail name, without a failed attempt's marker"""
+    return {edge: name for edge, name in thumbnails.items() if edge != FAILED}
+
+
+def is_current(instance):
+    """Whether a row's recorded thumbnails (or failed attempt) belong to the file it holds now"""
+    field = source_field(instance)
+    digest = blob_digest(getattr(instance, field).name) if field else None
+    if not digest:
+        return not instance.thumbnails
+    if FAILED in instance.thumbnails:
+        return instance.thumbnails[FAILED] == digest
+    expected = names_for(getattr(instance, field).name, settings.MEDLINK_THUMBNAIL_SIZES)
+    return all(expected.get(edge) == name for edge, name in instance.thumbnails.items())
+
+
+def record(model, pk, field, name, edges):
+    # Only while the row still holds the file the thumbnails were made from
+    model.objects.filter(pk=pk, **{field: name}).update(thumbnails=names_for(name, edges))
+
+
+def _recorded(model, pk, field, name, future):
+    # Runs on the executor's management thread, whose connection nothing
+    # else would ever close
+    close_old_connections()
+    try:
+        record(model, pk, field, name, future.result())
+    except Exception:
+        logger.exception('Thumbnails for %s %s failed', model.__name__, pk)
+    finally:
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned rather than forked, so workers don't inherit the parent's
+            # database connections, locks or running threads
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.MEDLINK_THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def submit(instance):
+    """Generate a row's thumbnails, in the process pool unless it is disabled"""
+    prepared = job(instance)
+    if prepared is None:
+        return None
+    name, arguments = prepared
+    model, field = type(instance), source_field(instance)
+    if not settings.MEDLINK_THUMBNAIL_WORKERS:
+        record(model, instance.pk, field, name, render(*arguments))
+        return None
+    future = get_executor().submit(render, *arguments)
+    future.add_done_callback(partial(_recorded, model, instance.pk, field, name))
+    return future
+
+
+def refresh(instance):
+    """Drop stale thumbnails and queue new ones once the row is committed"""
+    if instance.thumbnails:
+        if is_current(instance):
+            return
+        type(instance).objects.filter(pk=instance.pk).update(thumbnails={})
+        instance.thumbnails = {}
+    if source_field(instance):
+        transaction.on_commit(partial(submit, instance))
@@ -0,0 +1,163 @@
+# server/medical/uploads.py
+
+import base64
+import binascii
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MedicalFile, UploadSession
+
+# Bytes read from the request and written to disk at a time
+BLOCK_SIZE = 64 * 1024
+
+
+class StagedFile(File):
+    """A staged upload that file system storage can move into place instead of copying"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def session_expiry():
+    return timezone.now() + timedelta(seconds=settings.MEDLINK_UPLOAD_SESSION_SECONDS)
+
+
+def parse_checksum(header):
+    """Digest bytes from an `Upload-Checksum: sha256 <base64>` header"""
+    algorithm, _, value = (header or '').strip().partition(' ')
+    if algorithm.lower() != 'sha256':
+        raise ValidationError('Upload-Checksum must be "sha256 <base64 digest>"', code='checksum')
+    try:
+        digest = base64.b64decode(value.strip(), validate=True)
+    except (binascii.Error, ValueError):
+        digest = b''
+    if len(digest) != hashlib.sha256().digest_size:
+        raise ValidationError('Upload-Checksum must be "sha256 <base64 digest>"', code='checksum')
+    return digest
+
+
+def _open_part(session):
+    os.makedirs(settings.MEDLINK_UPLOAD_STAGING_DIR, exist_ok=True)
+    descriptor = os.open(session.staging_path, os.O_RDWR | os.O_CREAT, 0o600)
+    return os.fdopen(descriptor, 'r+b')
+
+
+def write_chunk(session, stream, offset, length, digest):
+    """Append `length` bytes of `stream` at `offset`, streaming them to disk
+
+    The caller holds a lock on the session row. A chunk that is cut short
+    or fails its checksum is truncated away, so the client can retry it
+    from the same offset.
+    """
+    if session.status != 'open':
+        raise ValidationError('This upload is already finalized', code='finalized')
+    if offset != session.received:
+        raise ValidationError(f'Expected offset {session.received}', code='offset')
+    if length > settings.MEDLINK_UPLOAD_MAX_CHUNK:
+        raise ValidationError(
+            f'Chunks cannot exceed {settings.MEDLINK_UPLOAD_MAX_CHUNK} bytes', code='too_large'
+        )
+    if offset + length > session.size:
+        raise ValidationError('Chunk runs past the declared file size', code='invalid')
+
+    checksum = hashlib.sha256()
+    with _open_part(session) as part:
+        # Drop whatever an interrupted earlier attempt left past the offset
+        part.seek(offset)
+        part.truncate()
+        remaining = length
+        while remaining:
+            block = stream.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            part.write(block)
+            checksum.update(block)
+            remaining -= len(block)
+        if remaining or checksum.digest() != digest:
+            part.truncate(offset)
+            message = 'Chunk ended early' if remaining else 'Chunk checksum does not match'
+            raise ValidationError(message, code='checksum')
+
+    session.received = offset + length
+    session.expires_at = session_expiry()
+    session.save(update_fields=['received', 'expires_at'])
+    return session.received
+
+
+def file_sha256(path):
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as staged:
+        for block in iter(lambda: staged.read(BLOCK_SIZE), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def finalize(session):
+    """Turn a fully received session into a MedicalFile"""
+    if session.status != 'open':
+        raise ValidationError('This upload is already finalized', code='finalized')
+    if session.received != session.size:
+        raise ValidationError(f'Only {session.received} of {session.size} bytes received', code='offset')
+
+    path = session.staging_path
+    if session.sha256 and file_sha256(path) != session.sha256:
+        # Start over rather than keep bytes that add up to the wrong file
+        os.remove(path)
+        session.received = 0
+        session.save(update_fields=['received'])
+        raise ValidationError('File checksum does not match; upload it again', code='checksum')
+
+    medical_file = MedicalFile(
+        patient=session.patient,
+        uploaded_by=session.uploaded_by,
+        description=session.description,
+        is_private=session.is_private
+    )
+    # One transaction, so a row that fails to save takes its file reference with it
+    with transaction.atomic():
+        with open(path, 'rb') as staged:
+            medical_file.file.save(session.filename, StagedFile(staged), save=False)
+        medical_file.save()
+        session.status = 'complete'
+        session.medical_file = medical_file
+        session.save(update_fields=['status', 'medical_file'])
+    if os.path.exists(path):
+        # Storages that copy rather than move leave the staged bytes behind
+        os.remove(path)
+    return medical_file
+
+
+def discard(session):
+    """Delete a session and whatever it has staged"""
+    if os.path.exists(session.staging_path):
+        os.remove(session.staging_path)
+    session.delete()
+
+
+def purge_expired(now=None):
+    """Delete expired sessions and stray staged files, returning how many sessions went"""
+    now = now or timezone.now()
+    expired = UploadSession.objects.filter(expires_at__lte=now)
+    for session in expired.only('id'):
+        if os.path.exists(session.staging_path):
+            os.remove(session.staging_path)
+    deleted, _ = expired.delete()
+
+    # Files whose session is gone, e.g. after a crash between the two steps
+    directory = settings.MEDLINK_UPLOAD_STAGING_DIR
+    if os.path.isdir(directory):
+        cutoff = (now - timedelta(seconds=settings.MEDLINK_UPLOAD_SESSION_SECONDS)).timestamp()
+        live = {session_id.hex for session_id in UploadSession.objects.values_list('id', flat=True)}
+        for name in os.listdir(directory):
+            stem, extension = os.path.splitext(name)
+            path = os.path.join(directory, name)
+            if extension == '.part' and stem not in live and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+    return deleted
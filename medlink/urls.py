@@ -8,15 +8,27 @@ router = DefaultRouter()
 router.register(r'appointment-requests', views.AppointmentRequestViewSet, basename='appointment-request')
 router.register(r'appointments', views.AppointmentViewSet, basename='appointment')
 router.register(r'reminders', views.AppointmentReminderViewSet, basename='reminder')
+router.register(r'slot-holds', views.SlotHoldViewSet, basename='slot-hold')
+router.register(r'waitlist', views.WaitlistEntryViewSet, basename='waitlist')
+router.register(r'medical-files/uploads', views.UploadSessionViewSet, basename='upload-session')
 
 urlpatterns = [
     # Medical Files
     path('medical-files/', views.MedicalFileListCreateView.as_view(), name='medical-file-list'),
     path('medical-files/<int:id>/', views.MedicalFileDetailView.as_view(), name='medical-file-detail'),
+    path('medical-files/<int:id>/download/', views.MedicalFileDownloadView.as_view(), name='medical-file-download'),
+    path('medical-files/<int:id>/download-link/', views.MedicalFileDownloadLinkView.as_view(), name='medical-file-download-link'),
+    path(
+        'medical-files/<int:id>/thumbnails/<int:edge>/',
+        views.MedicalFileThumbnailView.as_view(),
+        name='medical-file-thumbnail'
+    ),
     
     # Doctors
     path('doctors/', views.DoctorListView.as_view(), name='doctor-list'),
+    path('doctors/earliest-slots/', views.EarliestSlotSearchView.as_view(), name='doctor-earliest-slots'),
     path('doctors/<int:id>/', views.DoctorDetailView.as_view(), name='doctor-detail'),
+    path('doctors/<int:id>/availability/', views.DoctorAvailabilityView.as_view(), name='doctor-availability'),
     
     # Include router URLs for appointment management
     path('', include(router.urls)),
@@ -1,36 +1,72 @@
 # server/medical/views.py
 
-from rest_framework import generics, viewsets, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework import generics, viewsets, status, mixins
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from django_filters import rest_framework as filters
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotAuthenticated, PermissionDenied
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.db import transaction, IntegrityError
 from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.conf import settings
 from django.utils import timezone
 from datetime import datetime, timedelta
 
-from .models import MedicalFile, AppointmentRequest, Appointment, AppointmentReminder
+from .models import (
+    MedicalFile, UploadSession, AppointmentRequest, Appointment, AppointmentReminder, SlotLedgerEntry, SlotHold,
+    WaitlistEntry
+)
+from .availability import (
+    DEFAULT_SLOT_MINUTES, MAX_RANGE_DAYS, appointment_interval, booked_out_doctors, doctor_availability, earliest_slots,
+    rebuild_day
+)
 from .serializers import (
     MedicalFileSerializer, 
+    UploadSessionSerializer,
     AppointmentRequestSerializer, 
     AppointmentSerializer,
-    AppointmentReminderSerializer
+    AppointmentReminderSerializer,
+    BulkTriageItemSerializer,
+    SlotHoldSerializer,
+    WaitlistEntrySerializer
 )
-from .permissions import IsAdminOrReadOnly, IsOwnerOrDoctor
-from accounts.models import DoctorProfile, DoctorSpecialization
+from .permissions import CanAccessMedicalFile, IsAdminOrReadOnly, medical_files_for
+from .pagination import KeysetPagination, SelectablePagination
+from .directory_cache import DirectoryCacheMixin
+from .downloads import file_response, sign, unsign
+from .waitlist import offer_freed_slot
+from .uploads import discard, finalize, parse_checksum, session_expiry, write_chunk
+from .fast_serializers import FastListMixin, AppointmentReader, AppointmentRequestReader, DoctorProfileReader
+from accounts.models import User, DoctorProfile, DoctorSpecialization
+from accounts.search import DoctorSearchFilter
 from accounts.serializer import DoctorProfileSerializer
 
 
-class StandardResultsSetPagination(PageNumberPagination):
+class StandardResultsSetPagination(SelectablePagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
 
 
+class TriageQueuePagination(KeysetPagination):
+    # Matches the (doctor, status, -priority, requested_at, id) index
+    ordering = ('-priority', 'requested_at', 'id')
+
+
+def parse_date_param(request, param):
+    """A YYYY-MM-DD query parameter as a date, None when absent; raises ValueError if malformed"""
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
 class MedicalFileFilter(filters.FilterSet):
     file_type = filters.CharFilter(lookup_expr='icontains')
     uploaded_after = filters.DateTimeFilter(field_name='uploaded_at', lookup_expr='gte')
@@ -50,19 +86,10 @@ class MedicalFileListCreateView(generics.ListCreateAPIView):
     search_fields = ['description', 'file_type']
     ordering_fields = ['uploaded_at', 'file_type']
     ordering = ['-uploaded_at']
+    cursor_ordering = ('-uploaded_at', '-id')
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'doctor':
-            # Doctors can see files of their patients
-            return MedicalFile.objects.filter(patient__in=user.patients.all())
-        elif user.role == 'patient':
-            # Patients can only see their own files
-            return MedicalFile.objects.filter(patient=user)
-        elif user.role == 'admin':
-            # Admins can see all files
-            return MedicalFile.objects.all()
-        return MedicalFile.objects.none()
+        return medical_files_for(self.request.user)
 
     def perform_create(self, serializer):
         serializer.save(uploaded_by=self.request.user, patient=self.request.user)
@@ -70,18 +97,151 @@ class MedicalFileListCreateView(generics.ListCreateAPIView):
 
 class MedicalFileDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = MedicalFileSerializer
-    permission_classes = [IsAuthenticated, IsOwnerOrDoctor]
+    permission_classes = [IsAuthenticated, CanAccessMedicalFile]
     lookup_field = 'id'
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'doctor':
-            return MedicalFile.objects.filter(patient__in=user.patients.all())
-        elif user.role == 'patient':
-            return MedicalFile.objects.filter(patient=user)
-        elif user.role == 'admin':
-            return MedicalFile.objects.all()
-        return MedicalFile.objects.none()
+        return medical_files_for(self.request.user)
+
+
+class MedicalFileDownloadView(APIView):
+    """Protected download of a medical file, with Range, ETag and If-None-Match
+
+    Callers either authenticate as usual or pass a `token` from the
+    download-link endpoint; either way the file must be one the user can
+    read, by the same object permission as the detail view.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, id):
+        user = request.user
+        token = request.query_params.get('token')
+        if token:
+            user_id = unsign(token, id)
+            user = User.objects.filter(id=user_id, is_active=True).first() if user_id else None
+            if user is None:
+                return Response({"error": "Download link is invalid or expired"}, status=status.HTTP_403_FORBIDDEN)
+            # The link stands in for the credentials of the user it was issued to
+            request.user = user
+        elif not user.is_authenticated:
+            raise NotAuthenticated()
+
+        medical_file = get_object_or_404(medical_files_for(user).only('id', 'file', 'patient'), id=id)
+        # Checked directly: a link's request carries no credentials, which DRF
+        # would report as 401 rather than as the issued user being refused
+        if not CanAccessMedicalFile().has_object_permission(request, self, medical_file):
+            raise PermissionDenied()
+        return file_response(
+            request, medical_file.file.storage, medical_file.file.name, as_attachment='download' in request.query_params
+        )
+
+
+class MedicalFileThumbnailView(APIView):
+    """A generated thumbnail of a medical file, scoped like the file itself"""
+    permission_classes = [IsAuthenticated, CanAccessMedicalFile]
+
+    def get(self, request, id, edge):
+        medical_file = get_object_or_404(
+            medical_files_for(request.user).only('id', 'file', 'thumbnails', 'patient'), id=id
+        )
+        self.check_object_permissions(request, medical_file)
+        name = medical_file.thumbnails.get(str(edge))
+        if name is None:
+            return Response({"error": "No thumbnail of this size yet"}, status=status.HTTP_404_NOT_FOUND)
+        return file_response(request, medical_file.file.storage, name)
+
+
+class MedicalFileDownloadLinkView(APIView):
+    """Short-lived signed URL for a medical file, usable without credentials"""
+    permission_classes = [IsAuthenticated, CanAccessMedicalFile]
+
+    def get(self, request, id):
+        medical_file = get_object_or_404(medical_files_for(request.user).only('id', 'patient'), id=id)
+        self.check_object_permissions(request, medical_file)
+        url = reverse('medical-file-download', kwargs={'id': medical_file.id})
+        return Response({
+            'url': request.build_absolute_uri(f'{url}?token={sign(medical_file, request.user)}'),
+            'expires_at': timezone.now() + timedelta(seconds=settings.MEDLINK_DOWNLOAD_URL_SECONDS),
+        })
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """Resumable medical file uploads: create a session, PUT chunks, then finalize
+
+    Each PUT carries raw bytes with `Upload-Offset` and `Upload-Checksum:
+    sha256 <base64>` headers. GET reports the offset to resume from.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+    lookup_value_regex = '[0-9a-fA-F-]{32,36}'
+    error_status = {
+        'offset': status.HTTP_409_CONFLICT,
+        'finalized': status.HTTP_409_CONFLICT,
+        'too_large': status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    }
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(uploaded_by=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(patient=self.request.user, uploaded_by=self.request.user, expires_at=session_expiry())
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        response['Upload-Offset'] = response.data['offset']
+        return response
+
+    def error_response(self, error, session=None):
+        data = {"error": error.messages[0]}
+        if session is not None:
+            data['offset'] = session.received
+        return Response(data, status=self.error_status.get(error.code, status.HTTP_400_BAD_REQUEST))
+
+    def update(self, request, *args, **kwargs):
+        """Store one chunk, streamed from the request body straight to disk"""
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "Upload-Offset and Content-Length headers are required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            digest = parse_checksum(request.headers.get('Upload-Checksum'))
+        except ValidationError as e:
+            return self.error_response(e)
+
+        with transaction.atomic():
+            # Locked so two retries of the same chunk can't interleave on disk
+            session = get_object_or_404(self.get_queryset().select_for_update(), pk=self.kwargs['pk'])
+            try:
+                received = write_chunk(session, request.stream, offset, length, digest)
+            except ValidationError as e:
+                return self.error_response(e, session)
+
+        return Response({'offset': received}, headers={'Upload-Offset': str(received)})
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """Create the MedicalFile once every byte has arrived"""
+        with transaction.atomic():
+            session = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            try:
+                medical_file = finalize(session)
+            except ValidationError as e:
+                return self.error_response(e, session)
+
+        return Response(
+            MedicalFileSerializer(medical_file, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    def perform_destroy(self, instance):
+        discard(instance)
 
 
 class DoctorFilter(filters.FilterSet):
@@ -96,40 +256,162 @@ class DoctorFilter(filters.FilterSet):
         fields = ['specialization', 'experience_min', 'experience_max', 'rating_min', 'available_date']
     
     def filter_available_date(self, queryset, name, value):
-        """Filter doctors available on a specific date"""
+        """Filter doctors with a bookable slot left on a specific date"""
         if value:
-            # Get doctors who don't have appointments on this date
-            busy_doctors = Appointment.objects.filter(
-                scheduled_time__date=value
-            ).values_list('appointment_request__doctor', flat=True)
-            return queryset.exclude(user__id__in=busy_doctors)
+            # Days without bookings or holds are free, so only those with
+            # some need their slots checked
+            return queryset.filter(
+                working_days__icontains=value.strftime('%A').lower()
+            ).exclude(user__in=booked_out_doctors(value))
         return queryset
 
 
-class DoctorListView(generics.ListAPIView):
+class DoctorListView(DirectoryCacheMixin, FastListMixin, generics.ListAPIView):
     queryset = DoctorProfile.objects.all()
     serializer_class = DoctorProfileSerializer
+    fast_reader = DoctorProfileReader()
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    # Full-text search runs last so it can order by relevance unless ?ordering= is given
+    filter_backends = [DjangoFilterBackend, OrderingFilter, DoctorSearchFilter]
     filterset_class = DoctorFilter
-    search_fields = ['user__username', 'user__first_name', 'user__last_name', 'bio', 'qualifications']
     ordering_fields = ['rating', 'experience_years', 'user__username']
     ordering = ['-rating', '-experience_years']
+    cursor_ordering = ('-rating', '-experience_years', '-id')
 
     def get_queryset(self):
         queryset = super().get_queryset()
         # Only show active doctors
-        return queryset.filter(user__is_active=True)
+        return DoctorProfileSerializer.setup_eager_loading(queryset.filter(user__is_active=True), self.request)
 
 
-class DoctorDetailView(generics.RetrieveAPIView):
+class DoctorDetailView(DirectoryCacheMixin, generics.RetrieveAPIView):
     queryset = DoctorProfile.objects.all()
     serializer_class = DoctorProfileSerializer
     lookup_field = 'id'
+    cache_lookup_kwarg = 'id'
+
+    def get_queryset(self):
+        return DoctorProfileSerializer.setup_eager_loading(
+            DoctorProfile.objects.filter(user__is_active=True), self.request
+        )
+
+
+class DoctorAvailabilityView(generics.GenericAPIView):
+    """Bookable free slots of a doctor between two dates"""
+    lookup_field = 'id'
 
     def get_queryset(self):
         return DoctorProfile.objects.filter(user__is_active=True)
 
+    def get(self, request, id=None):
+        profile = self.get_object()
+
+        try:
+            date_from = parse_date_param(request, 'from') or timezone.localdate()
+            date_to = parse_date_param(request, 'to') or date_from + timedelta(days=6)
+            slot_minutes = int(request.query_params.get('slot', DEFAULT_SLOT_MINUTES))
+        except ValueError:
+            return Response(
+                {"error": "Invalid parameters. Use YYYY-MM-DD for dates and minutes for slot"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if date_to < date_from:
+            return Response(
+                {"error": "'to' must not be before 'from'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if (date_to - date_from).days >= MAX_RANGE_DAYS:
+            return Response(
+                {"error": f"Date range cannot exceed {MAX_RANGE_DAYS} days"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not 5 <= slot_minutes <= 240:
+            return Response(
+                {"error": "slot must be between 5 and 240 minutes"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({
+            'doctor': profile.id,
+            'from': date_from,
+            'to': date_to,
+            'slot_minutes': slot_minutes,
+            'days': doctor_availability(profile, date_from, date_to, slot_minutes),
+        })
+
+
+class EarliestSlotSearchView(generics.GenericAPIView):
+    """Earliest free slots across every doctor of a specialization"""
+    max_limit = 50
+
+    def get_queryset(self):
+        return DoctorProfile.objects.filter(
+            user__is_active=True,
+            is_available=True
+        ).select_related('user')
+
+    def get(self, request):
+        specialization = request.query_params.get('specialization')
+        if not specialization:
+            return Response(
+                {"error": "specialization is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            after = request.query_params.get('after')
+            after = datetime.fromisoformat(after.replace('Z', '+00:00')) if after else timezone.now()
+            if timezone.is_naive(after):
+                after = timezone.make_aware(after)
+            limit = int(request.query_params.get('limit', 10))
+            slot_minutes = int(request.query_params.get('slot', DEFAULT_SLOT_MINUTES))
+        except ValueError:
+            return Response(
+                {"error": "Invalid parameters. Use ISO format for after and integers for limit and slot"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not 1 <= limit <= self.max_limit:
+            return Response(
+                {"error": f"limit must be between 1 and {self.max_limit}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not 5 <= slot_minutes <= 240:
+            return Response(
+                {"error": "slot must be between 5 and 240 minutes"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        doctors = {
+            profile.id: profile
+            for profile in self.get_queryset().filter(
+                id__in=DoctorSpecialization.objects.filter(
+                    specialization__name__icontains=specialization,
+                    specialization__is_active=True
+                ).values('doctor')
+            )
+        }
+        slots = earliest_slots(doctors.values(), max(after, timezone.now()), limit, slot_minutes)
+
+        return Response({
+            'specialization': specialization,
+            'after': after,
+            'slot_minutes': slot_minutes,
+            'results': [
+                {
+                    'doctor': doctor_id,
+                    'doctor_name': doctors[doctor_id].user.full_name,
+                    'start': start,
+                    'end': end,
+                }
+                for start, doctor_id, end in slots
+            ],
+        })
+
 
 class AppointmentRequestFilter(filters.FilterSet):
     status = filters.CharFilter(lookup_expr='exact')
@@ -143,25 +425,30 @@ class AppointmentRequestFilter(filters.FilterSet):
         fields = ['status', 'urgency_level', 'preferred_date']
 
 
-class AppointmentRequestViewSet(viewsets.ModelViewSet):
+class AppointmentRequestViewSet(FastListMixin, viewsets.ModelViewSet):
     serializer_class = AppointmentRequestSerializer
+    fast_reader = AppointmentRequestReader()
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_class = AppointmentRequestFilter
     search_fields = ['reason', 'notes']
-    ordering_fields = ['requested_at', 'preferred_date', 'urgency_level']
+    ordering_fields = ['requested_at', 'preferred_date', 'urgency_level', 'priority']
     ordering = ['-requested_at']
+    cursor_ordering = ('-requested_at', '-id')
+    max_triage_batch = 100
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'doctor':
-            return AppointmentRequest.objects.filter(doctor=user)
+            queryset = AppointmentRequest.objects.filter(doctor=user)
         elif user.role == 'patient':
-            return AppointmentRequest.objects.filter(patient=user)
+            queryset = AppointmentRequest.objects.filter(patient=user)
         elif user.role == 'admin':
-            return AppointmentRequest.objects.all()
-        return AppointmentRequest.objects.none()
+            queryset = AppointmentRequest.objects.all()
+        else:
+            return AppointmentRequest.objects.none()
+        return AppointmentRequestSerializer.setup_eager_loading(queryset, self.request)
 
     def perform_create(self, serializer):
         serializer.save(patient=self.request.user)
@@ -205,39 +492,20 @@ class AppointmentRequestViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Check for scheduling conflicts
-        conflicting_appointments = Appointment.objects.filter(
-            appointment_request__doctor=appointment_request.doctor,
-            scheduled_time__date=scheduled_time.date()
-        )
-        
         duration = int(request.data.get('duration', 30))
-        
-        for appointment in conflicting_appointments:
-            if (scheduled_time < appointment.scheduled_time + timedelta(minutes=appointment.duration) and
-                scheduled_time + timedelta(minutes=duration) > appointment.scheduled_time):
-                return Response(
-                    {"error": "This time slot conflicts with another appointment"}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-        appointment_request.status = 'accepted'
-        appointment_request.save()
-
-        appointment = Appointment.objects.create(
-            appointment_request=appointment_request,
-            scheduled_time=scheduled_time,
-            duration=duration,
-            accepted_by=request.user
-        )
 
-        # Create reminder for the appointment
-        reminder_time = scheduled_time - timedelta(hours=24)
-        if reminder_time > timezone.now():
-            AppointmentReminder.objects.create(
-                appointment=appointment,
-                reminder_time=reminder_time,
-                reminder_type='email'
+        try:
+            appointment = Appointment.book(appointment_request, scheduled_time, duration, request.user)
+        except ValidationError as e:
+            return Response(
+                {"error": e.messages[0]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except IntegrityError:
+            # A concurrent accept already created the appointment
+            return Response(
+                {"error": "Request has already been processed"},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
         return Response(AppointmentSerializer(appointment).data, status=status.HTTP_201_CREATED)
@@ -263,6 +531,258 @@ class AppointmentRequestViewSet(viewsets.ModelViewSet):
         
         return Response({"status": "rejected"})
 
+    @action(detail=False, methods=['get'], url_path='triage-queue', permission_classes=[IsAuthenticated])
+    def triage_queue(self, request):
+        """A doctor's inbox ordered by urgency, then age, with keyset pagination"""
+        user = request.user
+        if user.role == 'doctor':
+            queryset = AppointmentRequest.objects.filter(doctor=user)
+        elif user.role in ['receptionist', 'admin']:
+            doctor_id = request.query_params.get('doctor')
+            if not doctor_id or not doctor_id.isdigit():
+                return Response(
+                    {"error": "doctor is required"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = AppointmentRequest.objects.filter(doctor_id=doctor_id)
+        else:
+            return Response(
+                {"error": "Only doctors and staff can view the triage queue"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        queryset = queryset.filter(status=request.query_params.get('status', 'pending'))
+
+        min_urgency = request.query_params.get('min_urgency')
+        if min_urgency:
+            if min_urgency not in AppointmentRequest.URGENCY_PRIORITY:
+                return Response(
+                    {"error": "min_urgency must be one of low, medium, high, emergency"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = queryset.filter(priority__gte=AppointmentRequest.URGENCY_PRIORITY[min_urgency])
+
+        queryset = AppointmentRequestSerializer.setup_eager_loading(queryset, request)
+        paginator = TriageQueuePagination()
+        page = paginator.paginate_queryset(queryset, request)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='bulk-triage', permission_classes=[IsAuthenticated])
+    def bulk_triage(self, request):
+        """Accept or reject many pending requests in one transaction"""
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"error": "Expected a non-empty list of triage items"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if len(items) > self.max_triage_batch:
+            return Response(
+                {"error": f"A batch cannot contain more than {self.max_triage_batch} items"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if request.user.role not in ['doctor', 'receptionist', 'admin']:
+            return Response(
+                {"error": "Only doctors and staff can triage requests"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            serializer = BulkTriageItemSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = self._triage_error(item, serializer.errors)
+
+        try:
+            # The requests stay locked from the read to the write, so a cancel
+            # or reject racing the batch waits instead of being overwritten
+            with transaction.atomic():
+                requests_by_id = self._triage_requests([data['request_id'] for _, data in valid])
+                accepts, rejects = self._plan_triage(valid, requests_by_id, results)
+                appointments = self._apply_triage(accepts, rejects, requests_by_id)
+        except IntegrityError:
+            # Someone booked one of the granules after the in-memory check
+            return Response(
+                {"error": "The schedule changed while processing the batch, please retry"},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        for (index, data), appointment in zip(accepts, appointments):
+            results[index] = {
+                'request_id': data['request_id'],
+                'status': 'accepted',
+                'appointment_id': appointment.id,
+            }
+        for index, data in rejects:
+            results[index] = {'request_id': data['request_id'], 'status': 'rejected'}
+
+        return Response({'results': results})
+
+    def _triage_error(self, item, error):
+        request_id = item.get('request_id') if isinstance(item, dict) else None
+        return {'request_id': request_id, 'status': 'error', 'error': error}
+
+    def _triage_requests(self, request_ids):
+        # Locked in id order, so overlapping batches can't deadlock
+        queryset = AppointmentRequest.objects.select_for_update().filter(
+            id__in=request_ids, status='pending'
+        ).order_by('id')
+        if self.request.user.role == 'doctor':
+            queryset = queryset.filter(doctor=self.request.user)
+        return {appointment_request.id: appointment_request for appointment_request in queryset}
+
+    def _plan_triage(self, valid, requests_by_id, results):
+        """Check every accept against an in-memory set of booked granules per doctor"""
+        accepts, rejects, seen = [], [], set()
+        planned = [
+            (requests_by_id[data['request_id']].doctor_id, data)
+            for _, data in valid
+            if data['action'] == 'accept' and data['request_id'] in requests_by_id
+        ]
+
+        # Taken granules mapped to the patient holding them (None for bookings),
+        # since a patient's own hold must not block their request
+        booked = {}
+        if planned:
+            starts = [data['scheduled_time'] for _, data in planned]
+            now = timezone.now()
+            entries = SlotLedgerEntry.objects.filter(
+                doctor_id__in={doctor_id for doctor_id, _ in planned},
+                slot_start__gte=min(starts) - timedelta(minutes=SlotLedgerEntry.GRANULE_MINUTES),
+                slot_start__lt=max(starts) + timedelta(minutes=max(data['duration'] for _, data in planned))
+            ).values_list('doctor_id', 'slot_start', 'hold__patient_id', 'hold__expires_at')
+            for doctor_id, slot_start, holder_id, expires_at in entries:
+                if expires_at is None or expires_at > now:
+                    booked[(doctor_id, slot_start)] = holder_id
+
+        for index, data in valid:
+            appointment_request = requests_by_id.get(data['request_id'])
+            if appointment_request is None or data['request_id'] in seen:
+                results[index] = self._triage_error(data, "Request not found or already processed")
+                continue
+            seen.add(data['request_id'])
+
+            if data['action'] == 'reject':
+                rejects.append((index, data))
+                continue
+
+            granules = {
+                (appointment_request.doctor_id, slot_start)
+                for slot_start in SlotLedgerEntry.granules(data['scheduled_time'], data['duration'])
+            }
+            if any(
+                granule in booked and booked[granule] != appointment_request.patient_id
+                for granule in granules
+            ):
+                results[index] = self._triage_error(data, "This time slot conflicts with another appointment.")
+                continue
+            booked.update(dict.fromkeys(granules))
+            accepts.append((index, data))
+        return accepts, rejects
+
+    def _apply_triage(self, accepts, rejects, requests_by_id):
+        """Write the planned batch with bulk inserts in a single transaction"""
+        now = timezone.now()
+
+        with transaction.atomic():
+            AppointmentRequest.objects.filter(
+                id__in=[data['request_id'] for _, data in rejects]
+            ).update(status='rejected')
+            AppointmentRequest.objects.filter(
+                id__in=[data['request_id'] for _, data in accepts]
+            ).update(status='accepted')
+            # update() skips the signals that close waitlist entries
+            WaitlistEntry.objects.filter(
+                appointment_request_id__in=[data['request_id'] for _, data in accepts]
+            ).update(status='booked')
+            WaitlistEntry.objects.filter(
+                appointment_request_id__in=[data['request_id'] for _, data in rejects]
+            ).update(status='withdrawn')
+
+            appointments = Appointment.objects.bulk_create([
+                Appointment(
+                    appointment_request=requests_by_id[data['request_id']],
+                    scheduled_time=data['scheduled_time'],
+                    duration=data['duration'],
+                    accepted_by=self.request.user
+                )
+                for _, data in accepts
+            ])
+
+            for appointment in appointments:
+                SlotLedgerEntry.clear_stale(
+                    appointment.appointment_request.doctor_id,
+                    list(SlotLedgerEntry.granules(appointment.scheduled_time, appointment.duration)),
+                    patient_id=appointment.appointment_request.patient_id
+                )
+            SlotLedgerEntry.objects.bulk_create([
+                SlotLedgerEntry(
+                    doctor_id=appointment.appointment_request.doctor_id,
+                    slot_start=slot_start,
+                    appointment=appointment
+                )
+                for appointment in appointments
+                for slot_start in SlotLedgerEntry.granules(appointment.scheduled_time, appointment.duration)
+            ])
+
+            AppointmentReminder.objects.bulk_create([
+                AppointmentReminder(
+                    appointment=appointment,
+                    reminder_time=appointment.scheduled_time - timedelta(hours=24),
+                    reminder_type='email'
+                )
+                for appointment in appointments
+                if appointment.scheduled_time - timedelta(hours=24) > now
+            ])
+
+            # bulk_create skips signals, so refresh the schedule index directly
+            days = {
+                (appointment.appointment_request.doctor_id,
+                 appointment_interval(appointment.scheduled_time, appointment.duration)[0])
+                for appointment in appointments
+            }
+            for doctor_id, day in days:
+                rebuild_day(doctor_id, day)
+
+        return appointments
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def waitlist(self, request, pk=None):
+        """Put a pending request on the doctor's waitlist for freed slots"""
+        appointment_request = self.get_object()
+
+        if request.user != appointment_request.patient:
+            return Response(
+                {"error": "Only the patient can join the waitlist"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        if appointment_request.status != 'pending':
+            return Response(
+                {"error": "Only pending requests can join the waitlist"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        entry, created = WaitlistEntry.objects.get_or_create(
+            appointment_request=appointment_request,
+            defaults={
+                'doctor': appointment_request.doctor,
+                'preferred_date': appointment_request.preferred_date,
+                'preferred_time_slot': appointment_request.preferred_time_slot,
+                'priority': appointment_request.priority,
+            }
+        )
+        return Response(
+            WaitlistEntrySerializer(entry).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def cancel(self, request, pk=None):
         appointment_request = self.get_object()
@@ -285,23 +805,27 @@ class AppointmentRequestViewSet(viewsets.ModelViewSet):
         return Response({"status": "cancelled"})
 
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(FastListMixin, viewsets.ModelViewSet):
     serializer_class = AppointmentSerializer
+    fast_reader = AppointmentReader()
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     ordering_fields = ['scheduled_time', 'created_at']
     ordering = ['scheduled_time']
+    cursor_ordering = ('scheduled_time', 'id')
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'doctor':
-            return Appointment.objects.filter(appointment_request__doctor=user)
+            queryset = Appointment.objects.filter(appointment_request__doctor=user)
         elif user.role == 'patient':
-            return Appointment.objects.filter(appointment_request__patient=user)
+            queryset = Appointment.objects.filter(appointment_request__patient=user)
         elif user.role == 'admin':
-            return Appointment.objects.all()
-        return Appointment.objects.none()
+            queryset = Appointment.objects.all()
+        else:
+            return Appointment.objects.none()
+        return AppointmentSerializer.setup_eager_loading(queryset, self.request)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def confirm(self, request, pk=None):
@@ -351,22 +875,200 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 
         appointment.scheduled_time = new_time
         appointment.is_confirmed = False
-        appointment.save()
+        try:
+            appointment.save()
+        except ValidationError as e:
+            return Response(
+                {"error": e.messages[0]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         return Response(AppointmentSerializer(appointment).data)
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def calendar(self, request):
+        """Appointments between two dates as parallel columns for calendar views"""
+        try:
+            date_from = parse_date_param(request, 'from') or timezone.localdate()
+            date_to = parse_date_param(request, 'to') or date_from + timedelta(days=6)
+        except ValueError:
+            return Response(
+                {"error": "Invalid date format. Use YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if date_to < date_from:
+            return Response(
+                {"error": "'to' must not be before 'from'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if (date_to - date_from).days >= MAX_RANGE_DAYS:
+            return Response(
+                {"error": f"Date range cannot exceed {MAX_RANGE_DAYS} days"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = self.get_queryset()
+        doctor_id = request.query_params.get('doctor')
+        if doctor_id:
+            if not doctor_id.isdigit():
+                return Response(
+                    {"error": "doctor must be a user id"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = queryset.filter(appointment_request__doctor_id=doctor_id)
+
+        # Bound on the raw column rather than __date so the range stays indexable
+        start = timezone.make_aware(datetime.combine(date_from, datetime.min.time()))
+        end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+        rows = queryset.filter(
+            scheduled_time__gte=start,
+            scheduled_time__lt=end
+        ).order_by('scheduled_time', 'id').values_list(
+            'id', 'scheduled_time', 'duration', 'appointment_request__patient_id',
+            'appointment_request__status', 'is_confirmed'
+        )
+
+        columns = ['id', 'start', 'duration', 'patient', 'status', 'confirmed']
+        values = list(zip(*rows)) or [()] * len(columns)
+        return Response({
+            'from': date_from,
+            'to': date_to,
+            'count': len(values[0]),
+            **{name: list(column) for name, column in zip(columns, values)},
+        })
+
 
 class AppointmentReminderViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = AppointmentReminderSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    cursor_ordering = ('reminder_time', 'id')
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'doctor':
-            return AppointmentReminder.objects.filter(appointment__appointment_request__doctor=user)
+            queryset = AppointmentReminder.objects.filter(appointment__appointment_request__doctor=user)
         elif user.role == 'patient':
-            return AppointmentReminder.objects.filter(appointment__appointment_request__patient=user)
+            queryset = AppointmentReminder.objects.filter(appointment__appointment_request__patient=user)
         elif user.role == 'admin':
-            return AppointmentReminder.objects.all()
-        return AppointmentReminder.objects.none()
\ No newline at end of file
+            queryset = AppointmentReminder.objects.all()
+        else:
+            return AppointmentReminder.objects.none()
+        return AppointmentReminderSerializer.setup_eager_loading(queryset, self.request)
+
+
+class SlotHoldViewSet(mixins.ListModelMixin,
+                      mixins.RetrieveModelMixin,
+                      mixins.DestroyModelMixin,
+                      viewsets.GenericViewSet):
+    """Temporary holds patients place on slots while they finish booking"""
+    serializer_class = SlotHoldSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = SlotHold.objects.filter(expires_at__gt=timezone.now())
+        if user.role == 'doctor':
+            return queryset.filter(doctor=user)
+        elif user.role == 'patient':
+            return queryset.filter(patient=user)
+        elif user.role in ['receptionist', 'admin']:
+            return queryset
+        return SlotHold.objects.none()
+
+    def create(self, request, *args, **kwargs):
+        if request.user.role != 'patient':
+            return Response(
+                {"error": "Only patients can hold slots"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            hold = SlotHold.place(
+                doctor=data['doctor'],
+                patient=request.user,
+                start=data['start'],
+                duration=data.get('duration', 30),
+                ttl=settings.MEDLINK_SLOT_HOLD_SECONDS,
+                limit=settings.MEDLINK_SLOT_HOLDS_PER_PATIENT
+            )
+        except ValidationError as e:
+            return Response(
+                {"error": e.messages[0]},
+                status=status.HTTP_429_TOO_MANY_REQUESTS if e.code == 'hold_limit' else status.HTTP_409_CONFLICT
+            )
+
+        return Response(self.get_serializer(hold).data, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        if self.request.user != instance.patient:
+            raise PermissionDenied("Only the patient who placed the hold can release it")
+        instance.delete()
+
+
+class WaitlistEntryViewSet(mixins.ListModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """Waitlist entries and the freed slots offered to them"""
+    serializer_class = WaitlistEntrySerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = WaitlistEntry.objects.select_related('offered_hold')
+        if user.role == 'doctor':
+            return queryset.filter(doctor=user)
+        elif user.role == 'patient':
+            return queryset.filter(appointment_request__patient=user)
+        elif user.role in ['receptionist', 'admin']:
+            return queryset
+        return WaitlistEntry.objects.none()
+
+    @action(detail=True, methods=['post'], url_path='accept-offer', permission_classes=[IsAuthenticated])
+    def accept_offer(self, request, pk=None):
+        """Book the slot offered to this entry"""
+        entry = self.get_object()
+        appointment_request = entry.appointment_request
+
+        if request.user != appointment_request.patient:
+            return Response(
+                {"error": "Only the patient can accept this offer"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        hold = entry.offered_hold
+        if entry.status != 'offered' or hold is None or not hold.is_active:
+            return Response(
+                {"error": "There is no active offer for this entry"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            appointment = Appointment.book(appointment_request, hold.start, hold.duration, accepted_by=None)
+        except (ValidationError, IntegrityError):
+            return Response(
+                {"error": "The offered slot is no longer available"},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return Response(AppointmentSerializer(appointment).data, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        if self.request.user != instance.appointment_request.patient:
+            raise PermissionDenied("Only the patient can leave the waitlist")
+        with transaction.atomic():
+            if instance.offered_hold:
+                instance.offered_hold.delete()
+                # The slot this patient was offered goes to the next entry instead
+                doctor_id, start, duration = instance.doctor_id, instance.offered_start, instance.offered_duration
+                if start is not None:
+                    transaction.on_commit(lambda: offer_freed_slot(doctor_id, start, duration))
+            instance.status = 'withdrawn'
+            instance.save(update_fields=['status'])
@@ -0,0 +1,93 @@
+# server/medical/waitlist.py
+
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import SlotHold, WaitlistEntry
+
+logger = logging.getLogger(__name__)
+
+
+def time_slot_for(value):
+    """Map a datetime onto the AppointmentRequest.preferred_time_slot choices"""
+    hour = timezone.localtime(value).hour
+    if hour < 12:
+        return 'morning'
+    if hour < 17:
+        return 'afternoon'
+    return 'evening'
+
+
+def best_match(doctor_id, start, exclude=()):
+    """Most urgent, then oldest, waiting entry for a doctor's date and time slot"""
+    return WaitlistEntry.objects.exclude(id__in=exclude).filter(
+        doctor_id=doctor_id,
+        preferred_date=timezone.localtime(start).date(),
+        preferred_time_slot=time_slot_for(start),
+        status='waiting',
+        appointment_request__status='pending'
+    ).select_related('appointment_request').order_by('-priority', 'created_at').first()
+
+
+def offer_freed_slot(doctor_id, start, duration, exclude=()):
+    """Hold a freed slot for the best waitlisted request; returns the entry or None
+
+    `exclude` skips entries that already let this slot go.
+    """
+    if start <= timezone.now():
+        return None
+
+    with transaction.atomic():
+        entry = best_match(doctor_id, start, exclude)
+        if entry is None:
+            return None
+
+        try:
+            hold = SlotHold.place(
+                doctor=entry.doctor,
+                patient=entry.appointment_request.patient,
+                start=start,
+                duration=duration,
+                ttl=settings.MEDLINK_WAITLIST_OFFER_SECONDS
+            )
+        except ValidationError:
+            # Someone else got the slot first
+            return None
+
+        entry.status = 'offered'
+        entry.offered_hold = hold
+        entry.offered_at = timezone.now()
+        entry.offered_start = start
+        entry.offered_duration = duration
+        entry.save(update_fields=['status', 'offered_hold', 'offered_at', 'offered_start', 'offered_duration'])
+
+    logger.info('Offered slot %s to waitlist entry %s', start, entry.id)
+    return entry
+
+
+def expire_offers():
+    """Requeue entries whose offer lapsed and pass each slot to the next entry; returns how many
+
+    An offer lapses when its hold expires or is gone: expired holds are
+    cleared by anyone holding or booking over them, and patients can
+    release theirs.
+    """
+    with transaction.atomic():
+        lapsed = list(WaitlistEntry.objects.select_for_update(of=('self',)).filter(
+            Q(offered_hold__isnull=True) | Q(offered_hold__expires_at__lte=timezone.now()),
+            status='offered'
+        ).values_list('id', 'doctor_id', 'offered_start', 'offered_duration'))
+        WaitlistEntry.objects.filter(id__in=[entry_id for entry_id, *_ in lapsed]).update(
+            status='waiting', offered_hold=None, offered_at=None, offered_start=None, offered_duration=None
+        )
+
+    for entry_id, doctor_id, start, duration in lapsed:
+        # Offers made before the slot was stored on the entry can only be requeued
+        if start is not None:
+            offer_freed_slot(doctor_id, start, duration, exclude=[entry_id])
+    return len(lapsed)
@@ -54,6 +54,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'accounts.catalog.CatalogVersionMiddleware',
 ]
 
 ROOT_URLCONF = 'server.urls'
@@ -78,6 +79,27 @@ WSGI_APPLICATION = 'server.wsgi.application'
 
 ASGI_APPLICATION = "server.routing.application"
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered doctor list/detail responses. Switch to FileBasedCache (or a
+    # shared cache server) so several worker processes share hits and stamps.
+    'doctor_directory': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'doctor-directory',
+        'TIMEOUT': 600,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+MEDLINK_DIRECTORY_CACHE = 'doctor_directory'
+# Holds the specialization catalog's version stamp; each process keeps the
+# catalog itself in memory. With a cache shared between processes a change
+# reaches every worker at once; with the per-process LocMemCache other
+# workers only reload when their copy is older than MEDLINK_CATALOG_MAX_AGE.
+MEDLINK_CATALOG_CACHE = 'default'
+MEDLINK_CATALOG_MAX_AGE = 60
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -197,3 +219,43 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Appointment reminder delivery, keyed by AppointmentReminder.reminder_type.
+# Point sms/push at a provider-specific backend in production.
+MEDLINK_REMINDER_BACKENDS = {
+    'email': 'medlink.reminders.EmailReminderBackend',
+    'sms': 'medlink.reminders.ConsoleReminderBackend',
+    'push': 'medlink.reminders.ConsoleReminderBackend',
+}
+MEDLINK_REMINDER_FILE_PATH = BASE_DIR / 'sent_reminders.jsonl'
+
+# How long a patient's hold on a slot lasts while they finish booking
+MEDLINK_SLOT_HOLD_SECONDS = 300
+# Active holds one patient may have at once, so nobody can hold a whole calendar
+MEDLINK_SLOT_HOLDS_PER_PATIENT = 3
+
+# How long a slot freed by a cancellation stays offered to a waitlisted patient
+MEDLINK_WAITLIST_OFFER_SECONDS = 3600
+
+# Resumable medical file uploads. Staged chunks live outside MEDIA_ROOT so
+# they are never served; keep it on the same filesystem so finalizing is a
+# rename. Sessions idle for longer than the TTL are purged with
+# `manage.py purge_upload_sessions`.
+MEDLINK_UPLOAD_STAGING_DIR = BASE_DIR / 'upload_staging'
+MEDLINK_UPLOAD_SESSION_SECONDS = 24 * 3600
+MEDLINK_UPLOAD_MAX_CHUNK = 2 * 1024 * 1024
+
+# How protected medical file downloads are sent: 'stream' from Python (the
+# WSGI server's file_wrapper sendfiles it where supported),
+# 'x-accel-redirect' for nginx with an internal location at the prefix
+# aliasing MEDIA_ROOT, or 'x-sendfile' for Apache/lighttpd
+MEDLINK_DOWNLOAD_BACKEND = 'stream'
+MEDLINK_DOWNLOAD_ACCEL_PREFIX = '/protected-media/'
+# Lifetime of signed download links
+MEDLINK_DOWNLOAD_URL_SECONDS = 300
+
+# Thumbnails of uploaded images and PDF first pages (PDFs need poppler's
+# pdftoppm), by longest edge in pixels. They are made in a pool of this
+# many processes after upload; 0 makes them inline instead
+MEDLINK_THUMBNAIL_SIZES = [128, 512]
+MEDLINK_THUMBNAIL_WORKERS = 2